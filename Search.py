@@ -0,0 +1,229 @@
+# Search.py
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import RLock
+
+from flask import current_app
+from rapidfuzz import fuzz, process
+from sqlalchemy import select
+
+from config import db
+from models import Product, Category, Tag, product_tag_association
+from serializers import product_dicts_by_id
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+# how long a request waits for another request's first build of the index
+FIRST_BUILD_TIMEOUT = 30
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall((text or '').lower())
+
+
+def searchable_text(name, category, tags, description):
+    return ' '.join([name or '', category or '', ' '.join(tags), description or ''])
+
+
+def product_text(product):
+    return searchable_text(product.name, product.category.name if product.category else None,
+                           [tag.name for tag in product.tags], product.description)
+
+
+def load_texts():
+    """The searchable text of every product, from two column queries instead of serialized products."""
+    tags = defaultdict(list)
+    for product_id, name in db.session.execute(
+        select(product_tag_association.c.product_id, Tag.name)
+        .join(Tag, Tag.id == product_tag_association.c.tag_id)
+        .order_by(product_tag_association.c.product_id, Tag.id)
+    ):
+        tags[product_id].append(name)
+    return {
+        product_id: searchable_text(name, category, tags[product_id], description)
+        for product_id, name, category, description in db.session.execute(
+            select(Product.id, Product.name, Category.name, Product.description)
+            .outerjoin(Category, Category.id == Product.category_id)
+        )
+    }
+
+
+class SearchIndex:
+    """
+    In-process inverted index over product name, description, category and tags.
+
+    The index maps every token to the ids of the products containing it, so a
+    query only has to score the products sharing a token (or a token prefix)
+    with it instead of the whole catalog. It holds only ids and searchable
+    text; search_products() loads the current products for the hits.
+
+    It is built on first use and kept current with add_product/remove_product
+    from the product write routes. Rebuilds, which pick up other workers'
+    writes, are built outside the lock and swapped in, replaying the writes
+    made while they were built.
+    """
+
+    def __init__(self):
+        self._lock = RLock()
+        self._postings = {}     # token -> set of product ids
+        self._vocabulary = []   # sorted tokens, for prefix lookups
+        self._vocabulary_dirty = False
+        self._texts = {}        # product id -> searchable text
+        self._tokens = {}       # product id -> tokens, to unindex on update/delete
+        self._built_at = None
+        self._built = threading.Event()
+        self._pending = None    # product id -> text, or None when removed, while a rebuild runs
+        self._rebuild_thread = None
+
+    def is_stale(self, ttl):
+        return self._built_at is None or (ttl and time.monotonic() - self._built_at > ttl)
+
+    def start_rebuild(self):
+        """Claim the next rebuild. Returns False if one is already running."""
+        with self._lock:
+            if self._pending is not None:
+                return False
+            self._pending = {}
+            return True
+
+    def abort_rebuild(self):
+        with self._lock:
+            self._pending = None
+
+    def build(self, texts):
+        """Replace the index with {product id: searchable text}."""
+        postings = {}
+        tokens = {}
+        for product_id, text in texts.items():
+            tokens[product_id] = set(tokenize(text))
+            for token in tokens[product_id]:
+                postings.setdefault(token, set()).add(product_id)
+        with self._lock:
+            pending, self._pending = self._pending or {}, None
+            self._postings = postings
+            self._texts = dict(texts)
+            self._tokens = tokens
+            for product_id, text in pending.items():
+                self._unindex(product_id)
+                if text is not None:
+                    self._index(product_id, text)
+            self._vocabulary_dirty = True
+            self._built_at = time.monotonic()
+        self._built.set()
+
+    def rebuild(self):
+        """Build from the database; the caller has claimed the rebuild with start_rebuild()."""
+        try:
+            texts = load_texts()
+        except BaseException:
+            self.abort_rebuild()
+            raise
+        self.build(texts)
+
+    def rebuild_in_background(self, app):
+        def run():
+            with app.app_context():
+                try:
+                    self.rebuild()
+                except Exception:
+                    app.logger.exception('Could not rebuild the search index')
+
+        self._rebuild_thread = threading.Thread(target=run, name='search-index-rebuild', daemon=True)
+        self._rebuild_thread.start()
+
+    def wait_until_built(self, timeout):
+        return self._built.wait(timeout)
+
+    def add_product(self, product):
+        """Index a new product or re-index an updated one."""
+        self._update(product.id, product_text(product))
+
+    def remove_product(self, product_id):
+        self._update(product_id, None)
+
+    def _update(self, product_id, text):
+        with self._lock:
+            if self._pending is not None:
+                self._pending[product_id] = text
+            if self._built_at is None:
+                return
+            self._unindex(product_id)
+            if text is not None:
+                self._index(product_id, text)
+            self._vocabulary_dirty = True
+
+    def candidates(self, query):
+        """Ids of products sharing an exact, prefix or near-miss token with the query."""
+        with self._lock:
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+            matches = set()
+            for token in tokenize(query):
+                terms = self._prefixed(token)
+                if not terms:
+                    # tolerate typos by matching close vocabulary terms
+                    terms = [term for term, _, _ in process.extract(
+                        token, self._vocabulary, scorer=fuzz.ratio, score_cutoff=80, limit=5
+                    )]
+                for term in terms:
+                    matches.update(self._postings[term])
+            return matches
+
+    def search(self, query, score_cutoff=60, limit=None):
+        """Ids of the matching products, best match first."""
+        with self._lock:
+            choices = {product_id: self._texts[product_id] for product_id in self.candidates(query)}
+        results = process.extract(
+            query, choices, scorer=fuzz.WRatio, processor=str.lower, score_cutoff=score_cutoff, limit=limit
+        )
+        return [product_id for _, _, product_id in results]
+
+    def _prefixed(self, token):
+        terms = []
+        i = bisect_left(self._vocabulary, token)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(token):
+            terms.append(self._vocabulary[i])
+            i += 1
+        return terms
+
+    def _index(self, product_id, text):
+        tokens = set(tokenize(text))
+        for token in tokens:
+            self._postings.setdefault(token, set()).add(product_id)
+        self._texts[product_id] = text
+        self._tokens[product_id] = tokens
+
+    def _unindex(self, product_id):
+        for token in self._tokens.pop(product_id, ()):
+            ids = self._postings.get(token)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[token]
+        self._texts.pop(product_id, None)
+
+
+def get_search_index():
+    """The search index of the current app, one per app and process."""
+    return current_app.extensions.setdefault('search_index', SearchIndex())
+
+
+def search_products(query, limit=None):
+    """
+    Fuzzy search the catalog and return the current serialized products of the
+    hits. The first search builds the index; once it is older than
+    SEARCH_INDEX_TTL, searches use it as is while it is rebuilt in the background.
+    """
+    if not query:
+        return []
+    search_index = get_search_index()
+    if search_index.is_stale(current_app.config['SEARCH_INDEX_TTL']) and search_index.start_rebuild():
+        if search_index.wait_until_built(0):
+            search_index.rebuild_in_background(current_app._get_current_object())
+        else:
+            search_index.rebuild()
+    search_index.wait_until_built(FIRST_BUILD_TIMEOUT)
+    return product_dicts_by_id(search_index.search(query, current_app.config['SEARCH_SCORE_CUTOFF'], limit))
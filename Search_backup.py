@@ -1,29 +1,30 @@
 # search.py
-from flask import Blueprint, request, jsonify
-from models import Product
-from sqlalchemy import or_
+from flask import Blueprint, request, jsonify, current_app
+from fulltext import get_backend
+from database import replica_reads
+from serializers import use_fast_serializers, product_dicts_by_id
 
 search_bp = Blueprint('search_bp', __name__, url_prefix='/api')
 
 @search_bp.route('/search', methods=['GET'])
+@replica_reads
 def search():
     query = request.args.get('q', '')
+    limit = request.args.get('limit', default=current_app.config['SEARCH_RESULTS_LIMIT'], type=int)
 
     if not query:
         return jsonify({'error': 'No search query provided'}), 400
 
-    search_results = Product.query.filter(
-        or_(
-            Product.name.ilike(f'%{query}%'),
-            Product.category.ilike(f'%{query}%'),
-            Product.description.ilike(f'%{query}%')
-        )
-    ).all()
+    # FTS5 on SQLite, tsvector on Postgres, ilike when neither is set up
+    if use_fast_serializers():
+        results = product_dicts_by_id(get_backend().search_ids(query, limit))
+    else:
+        results = [product.serialize() for product in get_backend().search(query, limit)]
 
     suggestions = get_search_suggestions(query)
     
     return jsonify({
-        'results': [product.to_dict() for product in search_results],
+        'results': results,
         'suggestions': suggestions
     }), 200
 
@@ -6,31 +6,57 @@ from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from flask_restful import  Api
 from flask_sqlalchemy import SQLAlchemy
+from cache import response_cache
+from database import engine_options, replica_binds, init_engine
+from hashing import init_password_hasher
+from json_provider import OrjsonProvider, orjson
 
 
-def create_app(config_name=None):
+def create_app(config_name=None, **settings):
+    """Build the app from a named config; keyword arguments override its settings."""
     app = Flask(__name__)
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
     app.config.from_object(get_config(config_name))
+    app.config.update(settings)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = replica_binds(app.config)
 
     # Initialize extensions
     db.init_app(app)
+    init_engine(app)
     migrate.init_app(app, db)
     bcrypt.init_app(app)
     jwt.init_app(app)
     api.init_app(app)
     cors.init_app(app)
+    response_cache.init_app(app)
+    init_password_hasher(app)
+
+    # these import models, which imports this module
+    from serializers import init_encoded_products, init_category_cache
+    from events import init_events
+    from authenticate import init_user_cache
+    # keeps product_rating_stats in step with rating writes
+    import ratings
+    init_encoded_products(app)
+    init_category_cache(app)
+    init_events(app)
+    init_user_cache(app)
 
     from authenticate import authenticate_bp
     from products import product_bp
     from orders import order_bp
     from wishlist import wishlist_bp    
-    from search import search_bp
+    from Search_backup import search_bp
+    from events import events_bp
 
     app.register_blueprint(authenticate_bp)
     app.register_blueprint(product_bp)
     app.register_blueprint(order_bp)
     app.register_blueprint(wishlist_bp)
     app.register_blueprint(search_bp)
+    app.register_blueprint(events_bp)
 
 
     return app
@@ -1,11 +1,17 @@
 from flask import request, make_response, jsonify, session, Blueprint
 from flask_restful import Resource, Api, reqparse
-from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt_identity, current_user, set_access_cookies, set_refresh_cookies, unset_jwt_cookies
+from flask import current_app
+from flask_jwt_extended import JWTManager, create_access_token, create_refresh_token, jwt_required, get_jwt_identity, get_jwt, current_user, set_access_cookies, set_refresh_cookies, unset_jwt_cookies
 from functools import wraps
+import math
+from collections import namedtuple
+from sqlalchemy import select
 
 # Local imports
 from config import db, app, jwt
 from models import User
+from cache import LRUCache
+from hashing import HashingBusy
 
 authenticate_bp = Blueprint('authenticate_bp', __name__, url_prefix='/user')
 auth_api = Api(authenticate_bp)
@@ -18,18 +24,58 @@ def init_jwt(app):
 def user_identity_lookup(user_id):
     return user_id
 
+# The fields of the current user that routes read, loaded without the full model
+TokenUser = namedtuple('TokenUser', ['id', 'role', 'username'])
+
+
+def init_user_cache(app):
+    app.extensions['token_users'] = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+
+
+def invalidate_user_cache():
+    """
+    Forget every cached token user after a user changes. Users change rarely, so
+    this clears the whole cache instead of tracking each user's tokens; other
+    workers notice within USER_CACHE_TTL seconds.
+    """
+    current_app.extensions['token_users'].clear()
+
+
+# flask_jwt_extended calls this on every protected request, so it is served from a cache keyed by token
 @jwt.user_lookup_loader
 def user_lookup_callback(_jwt_header, jwt_data):
-    identity = jwt_data["sub"]
-    return db.session.get(User, identity)
+    cache = current_app.extensions['token_users']
+    user = cache.get(jwt_data['jti'])
+    if user is None:
+        row = db.session.execute(
+            select(User.id, User.role, User.username).where(User.id == jwt_data['sub'])
+        ).first()
+        if row is None:
+            return None
+        user = TokenUser(*row)
+        cache.set(jwt_data['jti'], user)
+    return user
+
+
+def create_tokens(user):
+    """Access and refresh tokens for a user, with the role as a claim so allow() needs no lookup."""
+    claims = {'role': user.role}
+    return (create_access_token(identity=user.id, additional_claims=claims),
+            create_refresh_token(identity=user.id, additional_claims=claims))
+
+
+def current_role():
+    """The current user's role, from the token's role claim when it has one."""
+    role = get_jwt().get('role')
+    return role if role is not None else current_user.role
+
 
 # Authorization decorator to restrict routes based on roles
 def allow(*allowed_roles):
     def wrapper(fn):
         @wraps(fn)
         def decorator(*args, **kwargs):
-            user = current_user
-            user_role = user.role
+            user_role = current_role()
             for role in allowed_roles:
                 if role == user_role:
                     return fn(*args, **kwargs)
@@ -50,6 +96,11 @@ login_args = reqparse.RequestParser()
 login_args.add_argument('email', required=True)
 login_args.add_argument('password', required=True)
 
+def hashing_busy():
+    """The 429 for a register or login that found every password hashing worker busy."""
+    retry_after = math.ceil(current_app.config['PASSWORD_HASH_WAIT_TIMEOUT']) or 1
+    return {'error': 'Too many sign-in attempts, please retry shortly'}, 429, {'Retry-After': str(retry_after)}
+
 @authenticate_bp.route('/hello')
 def index():
     return '<h1>Hey user </h1>'
@@ -71,12 +122,14 @@ class Register(Resource):
                 return {'error': 'User already exists'}, 400
 
             new_user = User(username=username, email=email, role=role)
-            new_user.set_password(password)
+            try:
+                new_user.set_password(password)
+            except HashingBusy:
+                return hashing_busy()
             db.session.add(new_user)
             db.session.commit()
 
-            access_token = create_access_token(identity=new_user.id)
-            refresh_token = create_refresh_token(identity=new_user.id)
+            access_token, refresh_token = create_tokens(new_user)
 
             response = jsonify({'access_token': access_token})
             set_access_cookies(response, access_token)
@@ -93,9 +146,19 @@ class Login(Resource):
         password = data.get('password')
 
         user = User.query.filter_by(email=email).first()
-        if user and user.authenticate(password):
-            access_token = create_access_token(identity=user.id)
-            refresh_token = create_refresh_token(identity=user.id)
+        try:
+            authenticated = user is not None and user.authenticate(password)
+        except HashingBusy:
+            return hashing_busy()
+        if authenticated and user.password_needs_rehash():
+            # BCRYPT_LOG_ROUNDS changed since this password was hashed
+            try:
+                user.set_password(password)
+                db.session.commit()
+            except HashingBusy:
+                pass  # rehashed on a later login
+        if authenticated:
+            access_token, refresh_token = create_tokens(user)
 
             response = jsonify({'user': user.serialize(), "access_token": access_token})
             set_access_cookies(response, access_token)
@@ -107,8 +170,8 @@ class Login(Resource):
 class RefreshToken(Resource):
     @jwt_required(refresh=True)
     def post(self):
-        current_user_id = get_jwt_identity()
-        new_access_token = create_access_token(identity=current_user_id)
+        # the role claim is taken from the user again, so role changes apply on refresh
+        new_access_token = create_access_token(identity=current_user.id, additional_claims={'role': current_user.role})
 
         response = jsonify({"access_token": new_access_token})
         set_access_cookies(response, new_access_token)
@@ -154,6 +217,7 @@ def update_user(id):
         user.username = username
 
     db.session.commit()
+    invalidate_user_cache()
 
     return jsonify({"msg": "User updated successfully", "user": user.to_dict()}), 200
 
@@ -165,6 +229,7 @@ def delete_user(id):
         return jsonify({"msg": "User not found"}), 404
     db.session.delete(user)
     db.session.commit()
+    invalidate_user_cache()
     return '', 204
 
 # routes
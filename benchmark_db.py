@@ -0,0 +1,137 @@
+"""
+Throughput of the API under concurrent gunicorn workers, with and without the
+SQLite connection tuning from database.py.
+
+Seeds a scratch SQLite database, serves it with gunicorn, and drives a mix of
+product reads and rating writes from client threads:
+
+    python benchmark_db.py --workers 4 --clients 16 --requests 2000
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+PROFILES = {
+    'defaults': {'SQLITE_WAL': 'false', 'SQLITE_SYNCHRONOUS': 'FULL',
+                 'SQLITE_MMAP_SIZE': '0', 'SQLITE_CACHE_SIZE': '-2000'},
+    'tuned': {},
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed(env, products):
+    script = f"""
+from app import create_app
+from models import db, User, Category, Product
+app = create_app('production')
+with app.app_context():
+    db.create_all()
+    user = User(username='bench', email='bench@example.com', role='seller')
+    category = Category(name='Bench')
+    db.session.add_all([user, category])
+    db.session.flush()
+    db.session.add_all([
+        Product(name=f'Product {{i}}', category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                description='Benchmark product', sku=f'BENCH-{{i}}', stock=100, user_id=user.id)
+        for i in range({products})
+    ])
+    db.session.commit()
+"""
+    subprocess.run([sys.executable, '-c', script], env=env, check=True)
+
+
+def wait_for(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+
+def request(base_url, products, write_ratio):
+    product_id = random.randint(1, products)
+    if random.random() < write_ratio:
+        body = json.dumps({'product_id': product_id, 'user_id': 1, 'rating': 5, 'comment': 'bench'}).encode()
+        req = urllib.request.Request(f'{base_url}/api/ratings', data=body, headers={'Content-Type': 'application/json'})
+    else:
+        req = urllib.request.Request(f'{base_url}/api/products/{product_id}')
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=30) as response:
+            response.read()
+        ok = True
+    except OSError:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+def run_profile(name, args):
+    directory = tempfile.mkdtemp(prefix='bench-')
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{directory}/bench.db', CACHE_ENABLED='false',
+               FLASK_CONFIG='production', **PROFILES[name])
+    seed(env, args.products)
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(args.workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', "app:create_app('production')"],
+        env=env,
+    )
+    try:
+        wait_for(f'{base_url}/api/products/1')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.clients) as executor:
+            results = list(executor.map(
+                lambda _: request(base_url, args.products, args.write_ratio), range(args.requests)
+            ))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+
+    latencies = sorted(latency for latency, ok in results if ok)
+    errors = sum(1 for _, ok in results if not ok)
+    return {
+        'profile': name,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--products', type=int, default=1000)
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='share of requests that write a rating')
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                        help='connection settings to run (default: all)')
+    args = parser.parse_args()
+
+    for name in args.profile or ['defaults', 'tuned']:
+        print(run_profile(name, args))
+
+
+if __name__ == '__main__':
+    main()
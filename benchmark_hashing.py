@@ -0,0 +1,63 @@
+"""
+Password checks per second, and per core, for a burst of concurrent logins:
+checked inline on each request thread, and on the bcrypt pool in hashing.py.
+Requests the pool turns away are counted as shed.
+
+    python benchmark_hashing.py --rounds 12 --clients 32 --logins 200 --workers 4
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import bcrypt
+from hashing import PasswordHasher, HashingBusy
+
+
+def burst(check, clients, logins):
+    """Run `logins` checks from `clients` threads; returns (seconds, checks done, checks shed)."""
+    def login(_):
+        try:
+            return check()
+        except HashingBusy:
+            return None
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as requests:
+        results = list(requests.map(login, range(logins)))
+    elapsed = time.perf_counter() - started
+    done = sum(result is not None for result in results)
+    return elapsed, done, logins - done
+
+
+def report(name, elapsed, done, shed, cores):
+    print(f'{name:<8} {done / elapsed:>8,.1f} logins/s  {done / elapsed / cores:>8,.1f} per core  '
+          f'({done} checked, {shed} shed, {elapsed:.2f} s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=12, help='BCRYPT_LOG_ROUNDS')
+    parser.add_argument('--clients', type=int, default=32, help='concurrent request threads')
+    parser.add_argument('--logins', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='PASSWORD_HASH_WORKERS')
+    parser.add_argument('--queue-size', type=int, default=16, help='PASSWORD_HASH_QUEUE_SIZE')
+    parser.add_argument('--wait-timeout', type=float, default=0.5, help='PASSWORD_HASH_WAIT_TIMEOUT')
+    args = parser.parse_args()
+
+    password_hash = bcrypt.generate_password_hash('password', args.rounds)
+    cores = os.cpu_count() or 1
+    print(f'{cores} cores, cost {args.rounds}, {args.clients} clients')
+
+    report('inline', *burst(lambda: bcrypt.check_password_hash(password_hash, 'password'),
+                            args.clients, args.logins), cores)
+    hasher = PasswordHasher(args.workers, args.queue_size, args.wait_timeout)
+    try:
+        report('pool', *burst(lambda: hasher.check(password_hash, 'password'), args.clients, args.logins),
+               min(cores, args.workers))
+    finally:
+        hasher.executor.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""
+Rows per second for building product JSON three ways: SerializerMixin.to_dict(),
+Product.serialize() over eager loaded ORM objects, and the column projection
+serializers in serializers.py.
+
+    python benchmark_serializers.py --products 5000 --repeat 5
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from app import create_app
+from models import db, User, Category, Tag, Product, ProductImage
+from serializers import product_dicts
+
+
+def seed(count):
+    seller = User(username='bench', email='bench@example.com', role='seller')
+    db.session.add(seller)
+    categories = [Category(name=f'Category {c}') for c in range(10)]
+    db.session.add_all(categories)
+    db.session.flush()
+    tags = {category.id: [Tag(name=f'Tag {category.id}-{t}', category_id=category.id) for t in range(5)]
+            for category in categories}
+    db.session.add_all(tag for category_tags in tags.values() for tag in category_tags)
+    for i in range(count):
+        category = categories[i % len(categories)]
+        db.session.add(Product(
+            name=f'Product {i}', category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+            description='Benchmark product', sku=f'BENCH-{i}', stock=100, user_id=seller.id,
+            tags=tags[category.id][:3],
+            images=[ProductImage(image_url=f'http://example.com/{i}-{n}.jpg') for n in range(2)],
+        ))
+    db.session.commit()
+
+
+def measure(name, build, count, repeat):
+    best = None
+    for _ in range(repeat):
+        db.session.expunge_all()
+        started = time.perf_counter()
+        result = build()
+        elapsed = time.perf_counter() - started
+        assert len(result) == count
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{name:<12} {count / best:>12,.0f} rows/s  ({best * 1000:.1f} ms)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    app = create_app('testing', SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    try:
+        with app.app_context():
+            db.create_all()
+            seed(args.products)
+            measure('to_dict', lambda: [product.to_dict() for product in Product.query.all()],
+                    args.products, args.repeat)
+            measure('serialize', lambda: [product.serialize() for product in Product.query_for_listing().all()],
+                    args.products, args.repeat)
+            measure('projection', product_dicts, args.products, args.repeat)
+            db.session.remove()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+# cache.py
+import os
+import pickle
+import sqlite3
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+from flask import current_app, g, request, Response
+
+
+class LRUCache:
+    """Thread-safe in-process LRU mapping with a per-entry time to live."""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """
+    Cache shared by every worker on a host, stored in a SQLite file.
+    A local stand-in for a cache server such as Redis or Memcached.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+            connection.execute('CREATE TABLE IF NOT EXISTS tag_versions (tag TEXT PRIMARY KEY, version INTEGER NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        # sqlite3's own context manager ends transactions but leaves the connection open
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            yield connection
+        finally:
+            connection.close()
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT value FROM entries WHERE key = ? AND expires_at > ?', (key, time.time())
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, pickle.dumps(value), time.time() + ttl)
+            )
+
+    def get_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        with self._connect() as connection:
+            rows = connection.execute(
+                f'SELECT tag, version FROM tag_versions WHERE tag IN ({", ".join("?" * len(tags))})', tags
+            ).fetchall()
+        versions = dict.fromkeys(tags, 0)
+        versions.update(rows)
+        return versions
+
+    def bump_versions(self, tags):
+        with self._connect() as connection:
+            connection.executemany(
+                'INSERT INTO tag_versions (tag, version) VALUES (?, 1) '
+                'ON CONFLICT (tag) DO UPDATE SET version = version + 1',
+                [(tag,) for tag in tags]
+            )
+
+
+class CacheStore:
+    """
+    The cache of one app: an in-process LRU in front of an optional shared backend.
+
+    Entries remember the version of each of their tags when they were stored.
+    Invalidating a tag bumps its version, so every entry carrying it misses on
+    the next read, in every worker when the versions live in the shared backend.
+    """
+
+    def __init__(self, max_size, ttl, shared=None):
+        self.ttl = ttl
+        self.local = LRUCache(max_size, ttl)
+        self.shared = shared
+        self._versions = {}
+        self._lock = Lock()
+        self._stats_lock = Lock()
+        self.stats = Counter()
+
+    def versions(self, tags):
+        if self.shared is not None:
+            return self.shared.get_versions(tags)
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def get(self, key):
+        entry = self.local.get(key)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None:
+                self.local.set(key, entry)
+        if entry is not None:
+            value, versions = entry
+            if self.versions(versions) == versions:
+                self._count('hits')
+                return value
+            self.local.delete(key)
+            self._count('stale')
+        self._count('misses')
+        return None
+
+    def set(self, key, value, versions):
+        entry = (value, versions)
+        self.local.set(key, entry)
+        if self.shared is not None:
+            self.shared.set(key, entry, self.ttl)
+        self._count('stores')
+
+    def invalidate(self, tags):
+        tags = set(tags)
+        if self.shared is not None:
+            self.shared.bump_versions(tags)
+        else:
+            with self._lock:
+                for tag in tags:
+                    self._versions[tag] = self._versions.get(tag, 0) + 1
+        self._count('invalidations', len(tags))
+
+    def _count(self, name, n=1):
+        # request threads share the store, and Counter updates are not atomic
+        with self._stats_lock:
+            self.stats[name] += n
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return dict(stats, evictions=self.local.evictions, size=len(self.local))
+
+
+class ResponseCache:
+    """Read-through cache for GET responses, configured from CACHE_* settings."""
+
+    def init_app(self, app):
+        shared = None
+        if app.config.get('CACHE_SHARED_PATH'):
+            shared = SqliteCacheBackend(os.path.expanduser(app.config['CACHE_SHARED_PATH']))
+        app.extensions['response_cache'] = CacheStore(app.config['CACHE_MAX_SIZE'], app.config['CACHE_TTL'], shared)
+
+    @property
+    def store(self):
+        return current_app.extensions['response_cache']
+
+    def cached(self, *tags):
+        """
+        Cache a view's 200 responses, keyed by path and query string. `tags` are
+        formatted with the view arguments, e.g. 'product:{product_id}'; the view can
+        add more with add_tags() once it knows them.
+        """
+        def wrapper(fn):
+            @wraps(fn)
+            def decorator(*args, **kwargs):
+                if not current_app.config['CACHE_ENABLED']:
+                    return fn(*args, **kwargs)
+
+                store = self.store
+                key = request.path + '?' + '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+                cached_response = store.get(key)
+                if cached_response is not None:
+                    body, status, mimetype = cached_response
+                    response = Response(body, status=status, mimetype=mimetype)
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                # read tag versions before the view runs, so a concurrent write makes the entry stale
+                g.cache_versions = store.versions(tag.format(**kwargs) for tag in tags)
+                response = current_app.make_response(fn(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    store.set(key, (response.get_data(), response.status_code, response.mimetype), g.cache_versions)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return decorator
+        return wrapper
+
+    def add_tags(self, *tags):
+        """Tag the response being cached with tags only known inside the view."""
+        if current_app.config['CACHE_ENABLED'] and 'cache_versions' in g:
+            g.cache_versions.update(self.store.versions(tags))
+
+    def invalidate(self, *tags):
+        if current_app.config['CACHE_ENABLED']:
+            self.store.invalidate(tags)
+
+    def stats(self):
+        return self.store.get_stats()
+
+
+response_cache = ResponseCache()
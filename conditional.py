@@ -0,0 +1,162 @@
+# conditional.py
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, request
+from sqlalchemy import event, func, select, delete, and_, or_
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import Product, Category, Tag, ProductImage, Rating, Discount, CatalogVersion
+
+versions = CatalogVersion.__table__
+
+
+def product_key(product_id):
+    return f'product:{product_id}'
+
+
+def category_key(category_id):
+    return f'category:{category_id}'
+
+
+def bump_versions(connection, keys):
+    """
+    Give each key a new version, creating missing rows. `keys` maps keys to
+    their category id. Versions are nanosecond timestamps kept above the
+    current maximum, so the newest version is always the largest.
+    """
+    if not keys:
+        return
+    latest = connection.execute(select(func.max(versions.c.version))).scalar() or 0
+    version = max(time.time_ns(), latest + 1)
+    rows = [{'key': key, 'category_id': category_id, 'version': version} for key, category_id in keys.items()]
+
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(versions)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['key'],
+            set_={'category_id': insert.excluded.category_id, 'version': insert.excluded.version}
+        ), rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            versions.update().where(versions.c.key == row['key'])
+            .values(category_id=row['category_id'], version=row['version'])
+        )
+        if not updated.rowcount:
+            connection.execute(versions.insert().values(**row))
+
+
+def bump_products(connection, product_ids):
+    """Bump products changed without the ORM, e.g. by a bulk UPDATE."""
+    product_ids = list(product_ids)
+    if product_ids:
+        categories = connection.execute(
+            select(Product.id, Product.category_id).where(Product.id.in_(product_ids))
+        ).all()
+        bump_versions(connection, {product_key(product_id): category_id for product_id, category_id in categories})
+
+
+# Every change that alters a product's JSON bumps the product's or its category's version
+@event.listens_for(db.session.session_factory, 'after_flush')
+def bump_changed_versions(session, flush_context):
+    changed = {}
+    removed = set()
+    for instance in list(session.new) + list(session.dirty):
+        if isinstance(instance, Product):
+            changed[product_key(instance.id)] = instance.category_id
+        elif isinstance(instance, Category):
+            changed[category_key(instance.id)] = instance.id
+        elif isinstance(instance, Tag):
+            changed[category_key(instance.category_id)] = instance.category_id
+    for instance in session.deleted:
+        if isinstance(instance, Product):
+            removed.add(product_key(instance.id))
+        elif isinstance(instance, Category):
+            removed.add(category_key(instance.id))
+        elif isinstance(instance, Tag):
+            changed[category_key(instance.category_id)] = instance.category_id
+    # images, ratings and discounts are part of their product's JSON
+    product_ids = {
+        instance.product_id for instance in list(session.new) + list(session.dirty) + list(session.deleted)
+        if isinstance(instance, (ProductImage, Rating, Discount))
+    }
+    product_ids -= {int(key.split(':')[1]) for key in list(changed) + list(removed) if key.startswith('product:')}
+
+    connection = session.connection()
+    if removed:
+        connection.execute(delete(versions).where(versions.c.key.in_(removed)))
+    bump_versions(connection, {key: category_id for key, category_id in changed.items() if key not in removed})
+    bump_products(connection, product_ids)
+
+
+def catalog_validator():
+    """Validator for the whole catalog: every product and category."""
+    return db.session.execute(select(func.count(), func.max(versions.c.version))).one()
+
+
+def category_validator(category_name):
+    """Validator for a category's products and the category itself."""
+    category_id = select(Category.id).where(Category.name == category_name).limit(1).scalar_subquery()
+    return db.session.execute(
+        select(func.count(), func.max(versions.c.version)).where(versions.c.category_id == category_id)
+    ).one()
+
+
+def product_validator(product_id):
+    """Validator for a product, its ratings and discounts, and its category."""
+    category_id = select(versions.c.category_id).where(versions.c.key == product_key(product_id)).scalar_subquery()
+    return db.session.execute(
+        select(func.count(), func.max(versions.c.version)).where(or_(
+            versions.c.key == product_key(product_id),
+            and_(versions.c.key.startswith('category:'), versions.c.category_id == category_id),
+        ))
+    ).one()
+
+
+def conditional(validator):
+    """
+    Answer GETs with ETag and Last-Modified validators, and with a 304 and no
+    body when the client's copy is current. `validator` is called with the view
+    arguments and returns a (count, version) row; a missing version skips the
+    check, e.g. for a product that doesn't exist.
+
+    If-None-Match is preferred. Last-Modified has one second resolution, so
+    If-Modified-Since can miss changes made in the same second as the copy.
+    """
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if not current_app.config['CONDITIONAL_GET_ENABLED'] or request.method not in ('GET', 'HEAD'):
+                return fn(*args, **kwargs)
+
+            count, version = validator(**kwargs)
+            if version is None:
+                return fn(*args, **kwargs)
+
+            # the query string selects a different body, so it is part of the tag
+            digest = hashlib.sha1(f'{request.full_path}|{count}|{version}'.encode()).hexdigest()
+            etag = digest[:32]
+            last_modified = datetime.fromtimestamp(version / 1e9, timezone.utc).replace(microsecond=0)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = request.if_modified_since is not None and last_modified <= request.if_modified_since
+
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.make_response(fn(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+        return decorator
+    return wrapper
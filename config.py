@@ -12,6 +12,8 @@ from flask_jwt_extended import JWTManager # type: ignore
 
 from dotenv import load_dotenv
 
+from database import RoutingSession, RoutingSQLAlchemy
+
 
 load_dotenv()
 
@@ -31,6 +33,92 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY', 'You will never walk alone')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'your_jwt_secret_key')
+    # Product listing pagination
+    PRODUCTS_PAGE_SIZE = int(os.getenv('PRODUCTS_PAGE_SIZE', 50))
+    PRODUCTS_PAGE_SIZE_MAX = int(os.getenv('PRODUCTS_PAGE_SIZE_MAX', 200))
+    PRODUCTS_STREAM_BATCH_SIZE = int(os.getenv('PRODUCTS_STREAM_BATCH_SIZE', 500))
+    SELLER_ORDERS_PAGE_SIZE = int(os.getenv('SELLER_ORDERS_PAGE_SIZE', 50))
+    SELLER_ORDERS_PAGE_SIZE_MAX = int(os.getenv('SELLER_ORDERS_PAGE_SIZE_MAX', 200))
+    # In-process search index (Search.py)
+    SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', 300))
+    SEARCH_SCORE_CUTOFF = int(os.getenv('SEARCH_SCORE_CUTOFF', 60))
+    # Full-text backend for /api/search (fulltext.py): 'auto' or 'ilike'
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+    SEARCH_RESULTS_LIMIT = int(os.getenv('SEARCH_RESULTS_LIMIT', 100))
+    # Popular products used to top up recommendations (recommendations.py)
+    RECOMMENDATION_POPULAR_SIZE = int(os.getenv('RECOMMENDATION_POPULAR_SIZE', 50))
+    RECOMMENDATION_POPULAR_TTL = int(os.getenv('RECOMMENDATION_POPULAR_TTL', 600))
+    # Neighbors kept per product in the tag similarity table (similarity.py)
+    SIMILARITY_TOP_K = int(os.getenv('SIMILARITY_TOP_K', 20))
+    # Response cache for catalog reads (cache.py). CACHE_SHARED_PATH is a SQLite
+    # file shared by all workers on the host; unset keeps the cache in-process.
+    CACHE_ENABLED = os.getenv('CACHE_ENABLED', 'true').lower() == 'true'
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 300))
+    CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', 1024))
+    CACHE_SHARED_PATH = os.getenv('CACHE_SHARED_PATH')
+    # Endpoints that build product JSON from column projections (serializers.py)
+    # instead of ORM objects; the output is the same either way.
+    FAST_SERIALIZER_ENDPOINTS = [endpoint for endpoint in os.getenv(
+        'FAST_SERIALIZER_ENDPOINTS',
+        'product_bp.get_products,product_bp.get_products_by_category_name,product_bp.get_user_products,search_bp.search'
+    ).split(',') if endpoint]
+    # ETag/Last-Modified validators and 304s for catalog reads (conditional.py)
+    CONDITIONAL_GET_ENABLED = os.getenv('CONDITIONAL_GET_ENABLED', 'true').lower() == 'true'
+    # Per-product JSON bytes reused by listings until the product changes (serializers.py).
+    # Each worker keeps its own copy; the TTL bounds how stale another worker's can get.
+    ENCODED_PRODUCTS_CACHE_SIZE = int(os.getenv('ENCODED_PRODUCTS_CACHE_SIZE', 10000))
+    ENCODED_PRODUCTS_CACHE_TTL = int(os.getenv('ENCODED_PRODUCTS_CACHE_TTL', 300))
+    # Serialized categories with their tags, checked against catalog_versions on every read (serializers.py)
+    CATEGORY_CACHE_SIZE = int(os.getenv('CATEGORY_CACHE_SIZE', 1000))
+    CATEGORY_CACHE_TTL = int(os.getenv('CATEGORY_CACHE_TTL', 3600))
+    # Write-behind queue for view, engagement and search events (events.py). Each worker
+    # buffers up to EVENTS_QUEUE_SIZE events and writes them in batches of EVENTS_BATCH_SIZE,
+    # or every EVENTS_FLUSH_INTERVAL seconds; a full queue drops events after EVENTS_PUT_TIMEOUT.
+    EVENTS_QUEUE_SIZE = int(os.getenv('EVENTS_QUEUE_SIZE', 10000))
+    EVENTS_BATCH_SIZE = int(os.getenv('EVENTS_BATCH_SIZE', 500))
+    EVENTS_FLUSH_INTERVAL = float(os.getenv('EVENTS_FLUSH_INTERVAL', 1.0))
+    EVENTS_PUT_TIMEOUT = float(os.getenv('EVENTS_PUT_TIMEOUT', 0))
+    EVENTS_SHUTDOWN_TIMEOUT = float(os.getenv('EVENTS_SHUTDOWN_TIMEOUT', 10))
+    EVENTS_MAX_PER_REQUEST = int(os.getenv('EVENTS_MAX_PER_REQUEST', 100))
+    # `flask rollup-events` keeps this many days of raw events and folds older ones into the
+    # daily rollup tables (retention.py), deleting them in batches with a pause in between
+    EVENTS_RETENTION_DAYS = int(os.getenv('EVENTS_RETENTION_DAYS', 30))
+    EVENTS_RETENTION_BATCH_SIZE = int(os.getenv('EVENTS_RETENTION_BATCH_SIZE', 5000))
+    EVENTS_RETENTION_PAUSE = float(os.getenv('EVENTS_RETENTION_PAUSE', 0.05))
+    # Current users of verified tokens, cached by token jti (authenticate.py). Updating or
+    # deleting a user clears this worker's cache; other workers catch up after the TTL.
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 30))
+    # Reviews per page of /api/products/<id>/ratings, and on the product itself
+    RATINGS_PAGE_SIZE = int(os.getenv('RATINGS_PAGE_SIZE', 20))
+    RATINGS_PAGE_SIZE_MAX = int(os.getenv('RATINGS_PAGE_SIZE_MAX', 100))
+    # Wishlist card pages (/api/wishlist/items), and the most product ids one /api/wishlist/batch request takes
+    WISHLIST_PAGE_SIZE = int(os.getenv('WISHLIST_PAGE_SIZE', 50))
+    WISHLIST_PAGE_SIZE_MAX = int(os.getenv('WISHLIST_PAGE_SIZE_MAX', 200))
+    WISHLIST_BATCH_MAX_SIZE = int(os.getenv('WISHLIST_BATCH_MAX_SIZE', 100))
+    # bcrypt cost for new password hashes; logins rehash passwords hashed at another cost.
+    # Hashing runs on PASSWORD_HASH_WORKERS threads (hashing.py) with PASSWORD_HASH_QUEUE_SIZE
+    # more waiting; Register and Login answer 429 after PASSWORD_HASH_WAIT_TIMEOUT seconds without room.
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+    PASSWORD_HASH_QUEUE_SIZE = int(os.getenv('PASSWORD_HASH_QUEUE_SIZE', 16))
+    PASSWORD_HASH_WAIT_TIMEOUT = float(os.getenv('PASSWORD_HASH_WAIT_TIMEOUT', 0.5))
+    # Engine and connection pool, turned into SQLALCHEMY_ENGINE_OPTIONS by database.py.
+    # Pool sizing is ignored for in-memory SQLite, which keeps a single connection.
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', -1))
+    # Pragmas set on every new SQLite connection
+    SQLITE_WAL = os.getenv('SQLITE_WAL', 'true').lower() == 'true'
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -64000))  # negative is KiB
+    # Read replicas, comma separated; views marked with database.replica_reads
+    # read from them. Reads go to the primary for DB_REPLICA_LAG seconds after a write,
+    # in any worker sharing CACHE_SHARED_PATH.
+    DB_REPLICA_URLS = [url for url in os.getenv('DB_REPLICA_URLS', '').split(',') if url]
+    DB_REPLICA_LAG = float(os.getenv('DB_REPLICA_LAG', 1.0))
 
 class DevelopmentConfig(Config):
     """Development configuration with settings for development."""
@@ -43,10 +131,16 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.getenv('TEST_DATABASE_URL', 'sqlite:///test_database.db')
     WTF_CSRF_ENABLED = False
     DEBUG = True
+    # the minimum bcrypt cost, so tests don't spend their time hashing
+    BCRYPT_LOG_ROUNDS = int(os.getenv('BCRYPT_LOG_ROUNDS', 4))
 
 class ProductionConfig(Config):
     """Production configuration with settings for production."""
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///prod_database.db')
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 20))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
 
 # Dictionary to map environment names to configuration classes
 config_by_name = {
@@ -62,9 +156,10 @@ def get_config(config_name=None):
 
 # Define metadata, instantiate db
 metadata = MetaData(naming_convention={
+    "ix": "ix_%(column_0_label)s",
     "fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s",
 })
-db = SQLAlchemy(metadata=metadata)
+db = RoutingSQLAlchemy(metadata=metadata, session_options={'class_': RoutingSession})
 migrate = Migrate()
 bcrypt = Bcrypt()
 jwt = JWTManager()
@@ -0,0 +1,171 @@
+# database.py
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql.elements import TextClause
+
+SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+REPLICA_PREFIX = 'replica_'
+# shared cache key that exists for DB_REPLICA_LAG seconds after a write in any worker
+LAST_WRITE_KEY = 'replica_routing:last_write'
+
+
+def is_memory_sqlite(uri):
+    url = make_url(uri)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, uri=None):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS built from the DB_* settings. Options the app sets
+    in SQLALCHEMY_ENGINE_OPTIONS itself take precedence.
+    """
+    options = {
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if not is_memory_sqlite(uri or config['SQLALCHEMY_DATABASE_URI']):
+        options['pool_size'] = config['DB_POOL_SIZE']
+        options['max_overflow'] = config['DB_MAX_OVERFLOW']
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def replica_binds(config):
+    """SQLALCHEMY_BINDS with a 'replica_<n>' bind for each of DB_REPLICA_URLS."""
+    binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+    for number, url in enumerate(config['DB_REPLICA_URLS']):
+        binds[f'{REPLICA_PREFIX}{number}'] = dict(engine_options(config, url), url=url)
+    return binds
+
+
+def sqlite_pragmas(config):
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if synchronous not in SYNCHRONOUS_LEVELS:
+        raise ValueError(f'SQLITE_SYNCHRONOUS must be one of {sorted(SYNCHRONOUS_LEVELS)}')
+    pragmas = [
+        f'synchronous={synchronous}',
+        f'mmap_size={int(config["SQLITE_MMAP_SIZE"])}',
+        f'cache_size={int(config["SQLITE_CACHE_SIZE"])}',
+    ]
+    if config['SQLITE_WAL']:
+        # WAL lets readers run alongside the single writer instead of waiting on it
+        pragmas.insert(0, 'journal_mode=WAL')
+    return pragmas
+
+
+def init_engine(app):
+    """Set the SQLite pragmas on each new connection of the app's engines. Call after db.init_app()."""
+    pragmas = sqlite_pragmas(app.config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute('PRAGMA ' + pragma)
+        cursor.close()
+
+    app.extensions['replica_routing'] = {'last_write': None}
+    with app.app_context():
+        for engine in app.extensions['sqlalchemy'].engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', set_pragmas)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    SQLAlchemy whose create_all(), drop_all() and reflect() cover only the
+    current app's binds, leaving out replicas, which mirror the primary's
+    tables. db.init_app() registers a metadata per bind on the db shared by
+    every app, so by default they would also look for other apps' binds.
+    """
+
+    def app_bind_keys(self):
+        engines = self.engines
+        return [key for key in self.metadatas
+                if key in engines and not (key and key.startswith(REPLICA_PREFIX))]
+
+    def create_all(self, bind_key='__all__'):
+        super().create_all(self.app_bind_keys() if bind_key == '__all__' else bind_key)
+
+    def drop_all(self, bind_key='__all__'):
+        super().drop_all(self.app_bind_keys() if bind_key == '__all__' else bind_key)
+
+    def reflect(self, bind_key='__all__'):
+        super().reflect(self.app_bind_keys() if bind_key == '__all__' else bind_key)
+
+
+def shared_cache():
+    """The cache backend shared by the app's workers, if CACHE_SHARED_PATH is set."""
+    store = current_app.extensions.get('response_cache')
+    return store.shared if store is not None else None
+
+
+def is_read(clause):
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith(('SELECT', 'WITH'))
+    return clause.is_select
+
+
+def replica_reads(fn):
+    """Let a GET view read from a replica, when replicas are configured."""
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        g.replica_reads = request.method in ('GET', 'HEAD')
+        return fn(*args, **kwargs)
+    return decorator
+
+
+class RoutingSession(Session):
+    """
+    Session that sends SELECTs issued by replica_reads views to a replica bind.
+
+    Everything else goes to the primary: writes and flushes, reads that follow
+    a write in the same session, and, for DB_REPLICA_LAG seconds after any
+    write, every read, so clients see their own writes while the replicas
+    catch up. Writes are visible to every worker through the shared cache
+    backend when there is one, so responses cached there are never read
+    from a replica that is behind; without it each worker only knows its
+    own writes, as it only knows its own cache.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or (clause is not None and not is_read(clause)):
+                self.record_write()
+            elif clause is not None and self.use_replica():
+                replicas = [engine for key, engine in self._db.engines.items()
+                            if key and key.startswith(REPLICA_PREFIX)]
+                if replicas:
+                    return random.choice(replicas)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def record_write(self):
+        first_write = not self.info.get('wrote')
+        self.info['wrote'] = True
+        if not has_app_context():
+            return
+        current_app.extensions['replica_routing']['last_write'] = time.monotonic()
+        lag = current_app.config['DB_REPLICA_LAG']
+        shared = shared_cache()
+        if first_write and lag > 0 and shared is not None and current_app.config['DB_REPLICA_URLS']:
+            shared.set(LAST_WRITE_KEY, True, lag)
+
+    def use_replica(self):
+        if not has_request_context() or not g.get('replica_reads') or self.info.get('wrote'):
+            return False
+        last_write = current_app.extensions['replica_routing']['last_write']
+        if last_write is not None and time.monotonic() - last_write < current_app.config['DB_REPLICA_LAG']:
+            return False
+        shared = shared_cache()
+        if shared is None:
+            return True
+        # checked once per request
+        if 'replica_lagging' not in g:
+            g.replica_lagging = shared.get(LAST_WRITE_KEY) is not None
+        return not g.replica_lagging
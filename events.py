@@ -0,0 +1,227 @@
+# events.py
+import atexit
+import math
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from flask import Blueprint, current_app, jsonify, request
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+
+from authenticate import allow
+from config import db
+from models import Product, ViewingHistory, Engagement, SearchQuery
+from recommendations import record_interactions
+
+events_bp = Blueprint('events_bp', __name__, url_prefix='/api')
+
+# event type -> (table, timestamp column, interactions keyword of record_interactions)
+EVENT_TYPES = {
+    'view': (ViewingHistory.__table__, 'viewed_at', 'views'),
+    'engagement': (Engagement.__table__, 'engaged_at', 'engagements'),
+    'search': (SearchQuery.__table__, 'searched_at', 'searches'),
+}
+STOP = object()
+
+
+class EventQueue:
+    """
+    Write-behind buffer for behavioral events. Requests put rows on a bounded
+    queue; a background thread writes them in batches of up to `batch_size`,
+    or whatever arrived within `flush_interval` seconds of the first row, with
+    one multi-row INSERT per table. When the queue is full, put() waits up to
+    `put_timeout` seconds and then drops the event.
+    """
+
+    def __init__(self, app, max_size, batch_size, flush_interval, put_timeout=0):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(max_size)
+        self.stats = Counter()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def put(self, event_type, row):
+        """Queue a row for the event type's table. Returns False if it was dropped."""
+        self.start()
+        try:
+            if self.put_timeout:
+                self.queue.put((event_type, row), timeout=self.put_timeout)
+            else:
+                self.queue.put_nowait((event_type, row))
+        except queue.Full:
+            self.stats['dropped'] += 1
+            return False
+        self.stats['queued'] += 1
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                if self._thread is None:
+                    # write what is still queued when the process exits
+                    atexit.register(self.stop, self.app.config['EVENTS_SHUTDOWN_TIMEOUT'])
+                self._thread = threading.Thread(target=self._run, name='event-flusher', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        """Write everything still queued and stop the flusher."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                # waits while the queue is full, until the flusher takes its next batch
+                self.queue.put(STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        self.flush()
+
+    def flush(self):
+        """Write everything queued so far from the calling thread."""
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                return
+            self.write(batch)
+
+    def _run(self):
+        while True:
+            batch = self._take(block=True)
+            stopping = bool(batch) and batch[-1] is STOP
+            if stopping:
+                batch.pop()
+            if batch:
+                self.write(batch)
+            if stopping:
+                return
+
+    def _take(self, block):
+        """The next batch: up to batch_size rows, waiting up to flush_interval after the first."""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            try:
+                if not block:
+                    item = self.queue.get_nowait()
+                elif deadline is None:
+                    item = self.queue.get()
+                    deadline = time.monotonic() + self.flush_interval
+                else:
+                    item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            batch.append(item)
+            if item is STOP:
+                break
+        return batch
+
+    def write(self, batch):
+        rows = defaultdict(list)
+        for event_type, row in batch:
+            rows[event_type].append(row)
+        started = time.perf_counter()
+        try:
+            with self.app.app_context(), db.engine.begin() as connection:
+                # the products may have been deleted since the events were queued
+                product_ids = {row['product_id'] for event_rows in rows.values() for row in event_rows
+                               if 'product_id' in row}
+                known = set(connection.execute(
+                    select(Product.id).where(Product.id.in_(product_ids))
+                ).scalars()) if product_ids else set()
+                interactions = {}
+                for event_type, event_rows in rows.items():
+                    table, _, keyword = EVENT_TYPES[event_type]
+                    valid = [row for row in event_rows if 'product_id' not in row or row['product_id'] in known]
+                    self.stats['invalid'] += len(event_rows) - len(valid)
+                    if valid:
+                        connection.execute(table.insert(), valid)
+                        interactions[keyword] = valid
+                # Core inserts skip the ORM after_insert hooks that feed the recommendation candidates
+                record_interactions(connection, **interactions)
+        except Exception:
+            self.stats['failed'] += len(batch)
+            self.app.logger.exception('Could not write %d events', len(batch))
+            return
+        self.stats['written'] += sum(len(event_rows) for event_rows in rows.values())
+        self.stats['batches'] += 1
+        self.stats['write_ms'] += round((time.perf_counter() - started) * 1000)
+
+    def get_stats(self):
+        return dict(self.stats, depth=self.queue.qsize(), capacity=self.queue.maxsize)
+
+
+def init_events(app):
+    events = EventQueue(
+        app,
+        max_size=app.config['EVENTS_QUEUE_SIZE'],
+        batch_size=app.config['EVENTS_BATCH_SIZE'],
+        flush_interval=app.config['EVENTS_FLUSH_INTERVAL'],
+        put_timeout=app.config['EVENTS_PUT_TIMEOUT'],
+    )
+    app.extensions['events'] = events
+
+
+def record_event(event_type, **row):
+    """Queue a behavioral event for the current app. Returns False if it was dropped."""
+    table, timestamp, _ = EVENT_TYPES[event_type]
+    # stamped now rather than when written; UTC like CURRENT_TIMESTAMP on SQLite
+    row.setdefault(timestamp, datetime.now(timezone.utc).replace(tzinfo=None))
+    return current_app.extensions['events'].put(event_type, row)
+
+
+def event_row(user_id, data):
+    """Validate an event from the API and return its type and row."""
+    event_type = data.get('type')
+    if event_type == 'search':
+        query = data.get('query')
+        if not isinstance(query, str) or not query.strip() or len(query) > 200:
+            raise ValueError
+        return event_type, {'user_id': user_id, 'search_query': query.strip()}
+    if event_type not in EVENT_TYPES:
+        raise ValueError
+    row = {'user_id': user_id, 'product_id': int(data['product_id'])}
+    if event_type == 'engagement':
+        row['watch_time'] = int(data.get('watch_time') or 0)
+        if row['watch_time'] < 0:
+            raise ValueError
+    return event_type, row
+
+
+# Behavioral events: {"events": [{"type": "view", "product_id": 1},
+#   {"type": "engagement", "product_id": 1, "watch_time": 30}, {"type": "search", "query": "laptop"}]}
+@events_bp.route('/events', methods=['POST'])
+@jwt_required()
+def create_events():
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    try:
+        events = data['events']
+        if not isinstance(events, list) or len(events) > current_app.config['EVENTS_MAX_PER_REQUEST']:
+            raise ValueError
+        rows = [event_row(user_id, event) for event in events]
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return jsonify({'error': 'events must be a list of view, engagement or search events'}), 422
+
+    accepted = sum(record_event(event_type, **row) for event_type, row in rows)
+    dropped = len(rows) - accepted
+    if dropped:
+        # the queue is full: ask the client to retry the dropped events once the flusher catches up
+        response = jsonify({'accepted': accepted, 'dropped': dropped})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(math.ceil(current_app.config['EVENTS_FLUSH_INTERVAL']) or 1)
+        return response
+    return jsonify({'accepted': accepted}), 202
+
+
+# Queue depth, drops and write counters
+@events_bp.route('/events/stats', methods=['GET'])
+@jwt_required()
+@allow('admin')
+def get_event_stats():
+    return jsonify(current_app.extensions['events'].get_stats()), 200
@@ -0,0 +1,189 @@
+# fulltext.py
+import re
+
+from flask import current_app
+from sqlalchemy import event, or_, select, text
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+from config import db
+from models import Product, Category
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# SQLite: an FTS5 table keyed by product id, kept in sync by triggers
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description, category, tokenize = 'porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, (SELECT name FROM categories WHERE id = new.category_id));
+    END""",
+    # only the indexed columns, so stock and price updates leave the index alone
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    """CREATE TRIGGER products_fts_update AFTER UPDATE OF name, description, category_id ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+        INSERT INTO products_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, (SELECT name FROM categories WHERE id = new.category_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS products_fts_category_update AFTER UPDATE OF name ON categories BEGIN
+        UPDATE products_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM products WHERE category_id = new.id);
+    END""",
+    """INSERT INTO products_fts (rowid, name, description, category)
+        SELECT products.id, products.name, products.description, categories.name
+        FROM products LEFT JOIN categories ON categories.id = products.category_id
+        WHERE products.id NOT IN (SELECT rowid FROM products_fts)""",
+]
+
+# Postgres: a GIN indexed tsvector column on products, kept in sync by a trigger
+POSTGRES_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+    """CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce((SELECT name FROM categories WHERE id = NEW.category_id), '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS products_search_vector_trigger ON products",
+    """CREATE TRIGGER products_search_vector_trigger BEFORE INSERT OR UPDATE OF name, description, category_id
+        ON products FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()""",
+    # a renamed category re-runs the products trigger for its products
+    """CREATE OR REPLACE FUNCTION categories_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE products SET category_id = category_id WHERE category_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS categories_search_vector_trigger ON categories",
+    """CREATE TRIGGER categories_search_vector_trigger AFTER UPDATE OF name ON categories
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION categories_search_vector_update()""",
+    "UPDATE products SET name = name WHERE search_vector IS NULL",
+]
+
+
+class IlikeBackend:
+    """Substring matching on name, category and description. Needs no schema support, but scans the table."""
+    name = 'ilike'
+
+    def matching(self, query):
+        pattern = f'%{query}%'
+        return or_(
+            Product.name.ilike(pattern),
+            Category.name.ilike(pattern),
+            Product.description.ilike(pattern)
+        )
+
+    # outer joins, so a product whose category row is missing can still match on name or description
+    def search(self, query, limit):
+        return Product.query.outerjoin(Category, Product.category_id == Category.id).filter(
+            self.matching(query)
+        ).limit(limit).all()
+
+    def search_ids(self, query, limit):
+        return db.session.execute(
+            select(Product.id).outerjoin(Category, Product.category_id == Category.id)
+            .where(self.matching(query)).limit(limit)
+        ).scalars().all()
+
+
+class RankedBackend:
+    """Base for backends whose SQL returns product ids ordered by relevance."""
+    sql = None
+
+    def match_expression(self, query):
+        raise NotImplementedError
+
+    def search_ids(self, query, limit):
+        expression = self.match_expression(query)
+        if not expression:
+            return []
+        return db.session.execute(text(self.sql), {'query': expression, 'limit': limit}).scalars().all()
+
+    def search(self, query, limit):
+        ids = self.search_ids(query, limit)
+        if not ids:
+            return []
+        products = {product.id: product for product in Product.query.filter(Product.id.in_(ids))}
+        return [products[product_id] for product_id in ids if product_id in products]
+
+
+class SqliteFTS5Backend(RankedBackend):
+    name = 'fts5'
+    sql = """SELECT rowid FROM products_fts WHERE products_fts MATCH :query
+             ORDER BY bm25(products_fts, 10.0, 1.0, 5.0) LIMIT :limit"""
+
+    def match_expression(self, query):
+        # quote every token so user input can't use FTS5 query syntax; the last one matches as a prefix
+        tokens = TOKEN_PATTERN.findall(query)
+        if not tokens:
+            return None
+        return ' '.join(f'"{token}"' for token in tokens) + '*'
+
+
+class PostgresTsvectorBackend(RankedBackend):
+    name = 'tsvector'
+    sql = """SELECT id FROM products WHERE search_vector @@ plainto_tsquery('english', :query)
+             ORDER BY ts_rank(search_vector, plainto_tsquery('english', :query)) DESC LIMIT :limit"""
+
+    def match_expression(self, query):
+        return query.strip() or None
+
+
+def install(connection):
+    """Create the full-text table or column and its triggers for the connected database, if supported."""
+    dialect = connection.dialect.name
+    statements = {'sqlite': SQLITE_DDL, 'postgresql': POSTGRES_DDL}.get(dialect, [])
+    for statement in statements:
+        connection.exec_driver_sql(statement)
+
+
+def detect_backend(connection):
+    dialect = connection.dialect.name
+    try:
+        if dialect == 'sqlite':
+            connection.exec_driver_sql('SELECT rowid FROM products_fts LIMIT 0')
+            return SqliteFTS5Backend()
+        if dialect == 'postgresql':
+            connection.exec_driver_sql('SELECT search_vector FROM products LIMIT 0')
+            return PostgresTsvectorBackend()
+    except DBAPIError:
+        # the full-text migration has not run on this database
+        pass
+    return IlikeBackend()
+
+
+def get_backend():
+    """The full-text backend for the current app, chosen once per process from SEARCH_BACKEND."""
+    backend = current_app.extensions.get('fulltext_backend')
+    if backend is None:
+        if current_app.config['SEARCH_BACKEND'] == 'ilike':
+            backend = IlikeBackend()
+        else:
+            with db.engine.connect() as connection:
+                backend = detect_backend(connection)
+        current_app.extensions['fulltext_backend'] = backend
+    return backend
+
+
+@event.listens_for(db.metadata, 'after_create')
+def install_after_create(target, connection, **kw):
+    try:
+        install(connection)
+    except OperationalError:
+        # SQLite built without FTS5, searches fall back to ilike
+        pass
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def uninstall_before_drop(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql('DROP TABLE IF EXISTS products_fts')
@@ -0,0 +1,82 @@
+# hashing.py
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from config import bcrypt
+
+
+class HashingBusy(Exception):
+    """Raised when every hashing worker is busy and the wait queue is full."""
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt on a small pool of worker threads. bcrypt releases the GIL
+    while it works, so the pool hashes in parallel, and it bounds how many
+    request threads can be burning CPU on bcrypt at once. At most `workers`
+    hashes run and `queue_size` wait; a caller that finds no room within
+    `wait_timeout` seconds gets HashingBusy instead of queueing behind the burst.
+    """
+
+    def __init__(self, workers, queue_size, wait_timeout):
+        self.workers = workers
+        self.wait_timeout = wait_timeout
+        self.slots = threading.BoundedSemaphore(workers + queue_size)
+        self.stats = Counter()
+        # threads start on the first submit, so forked workers don't inherit them
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+    def run(self, fn, *args):
+        if not self.slots.acquire(timeout=self.wait_timeout):
+            self.stats['rejected'] += 1
+            raise HashingBusy
+        try:
+            future = self.executor.submit(fn, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+        future.add_done_callback(lambda _: self.slots.release())
+        self.stats[fn.__name__] += 1
+        return future.result()
+
+    def hash(self, password, rounds):
+        return self.run(bcrypt.generate_password_hash, password, rounds).decode('utf8')
+
+    def check(self, password_hash, password):
+        return self.run(bcrypt.check_password_hash, password_hash, password)
+
+    def get_stats(self):
+        return dict(self.stats, workers=self.workers)
+
+
+def init_password_hasher(app):
+    app.extensions['password_hasher'] = PasswordHasher(
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_size=app.config['PASSWORD_HASH_QUEUE_SIZE'],
+        wait_timeout=app.config['PASSWORD_HASH_WAIT_TIMEOUT'],
+    )
+
+
+def hash_password(password):
+    """A bcrypt hash of `password` at the app's BCRYPT_LOG_ROUNDS."""
+    return current_app.extensions['password_hasher'].hash(password, current_app.config['BCRYPT_LOG_ROUNDS'])
+
+
+def check_password(password_hash, password):
+    return current_app.extensions['password_hasher'].check(password_hash, password)
+
+
+def hash_rounds(password_hash):
+    """The cost of a bcrypt hash: '$2b$12$...' -> 12."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def needs_rehash(password_hash):
+    """True when the hash was made at a cost other than the current BCRYPT_LOG_ROUNDS."""
+    return hash_rounds(password_hash) != current_app.config['BCRYPT_LOG_ROUNDS']
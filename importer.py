@@ -0,0 +1,193 @@
+# importer.py
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from itertools import islice
+
+from flask import current_app
+from sqlalchemy import select
+
+from cache import response_cache
+from conditional import bump_versions, product_key, category_key
+from config import db
+from models import Product, Category, Tag, ProductImage, Rating, Discount, User, product_tag_association
+from ratings import add_rating_stats, coerce_rating
+
+products_table = Product.__table__
+CHUNK_SIZE = 1 << 16
+SEPARATORS = frozenset(' \t\r\n,]')
+
+
+def read_records(path, chunk_size=CHUNK_SIZE):
+    """
+    Yield the objects of a JSON array or a JSON Lines file one at a time,
+    reading `chunk_size` characters at a time instead of the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding='utf-8') as source:
+        buffer, position = '', 0
+        eof = False
+        first = True
+        while True:
+            # skip whitespace, the commas between records, and the array's brackets
+            while position < len(buffer) and (buffer[position] in SEPARATORS or (first and buffer[position] == '[')):
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = source.read(chunk_size), 0
+                eof = not buffer
+                continue
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                # the record continues in the next chunk
+                chunk = source.read(chunk_size)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+                continue
+            if not isinstance(record, dict):
+                raise ValueError(f'Expected a JSON object, got {type(record).__name__}')
+            yield record
+            position = end
+            first = False
+
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+
+def import_catalog(records, seller_id, batch_size=1000, reviewer_id=None, discount_days=30):
+    """
+    Insert products, with their images, tags, ratings and discounts, from
+    DummyJSON style records: title, description, price, stock, category,
+    thumbnail, sku, images, tags, reviews and discountPercentage. Records may
+    carry their own seller_id, and reviews their own user_id.
+
+    Categories and tags are looked up in dictionaries loaded once, and each
+    batch of `batch_size` products is written with one multi-row INSERT per
+    table in its own transaction, so memory stays bounded by the batch.
+    Products whose SKU already exists are skipped. Reviews are attributed by
+    reviewerEmail, then to `reviewer_id`, and skipped without either or
+    without a rating from 1 to 5.
+    Returns counts of what was inserted and skipped.
+    """
+    counts = Counter()
+    categories = dict(db.session.execute(select(Category.name, Category.id)).all())
+    # the oldest tag wins when several share a name, like Tag.query.filter_by(name).first()
+    tags = dict(db.session.execute(select(Tag.name, Tag.id).order_by(Tag.id.desc())).all())
+    db.session.commit()
+    # categories that got products, for the response cache
+    changed_categories = set()
+    now = datetime.now()
+
+    for batch in batched(records, batch_size):
+        with db.engine.begin() as connection:
+            import_batch(connection, batch, seller_id, reviewer_id, now, timedelta(days=discount_days),
+                         categories, tags, changed_categories, counts)
+
+    # other workers' response caches drop these listings when the cache is shared
+    response_cache.invalidate('products', *(f'category:{category_id}' for category_id in changed_categories))
+    if 'encoded_products' in current_app.extensions:
+        current_app.extensions['encoded_products'].clear()
+    return counts
+
+
+def import_batch(connection, batch, seller_id, reviewer_id, now, discount_length,
+                 categories, tags, changed_categories, counts):
+    records = {}
+    for record in batch:
+        sku = record.get('sku')
+        if not sku or not record.get('category') or not (record.get('title') or record.get('name')) \
+                or sku in records:
+            counts['invalid'] += 1
+            continue
+        records[sku] = record
+    existing = set(connection.execute(select(Product.sku).where(Product.sku.in_(records))).scalars())
+    counts['existing'] += len(existing)
+    records = {sku: record for sku, record in records.items() if sku not in existing}
+    if not records:
+        return
+
+    for record in records.values():
+        if record['category'] not in categories:
+            categories[record['category']] = connection.execute(
+                Category.__table__.insert().values(name=record['category'])
+            ).inserted_primary_key[0]
+            counts['categories'] += 1
+        changed_categories.add(categories[record['category']])
+
+    rows = [{
+        'name': record.get('title') or record.get('name'),
+        'description': record.get('description'),
+        'price': record.get('price') or 0,
+        'stock': record.get('stock') or 0,
+        'category_id': categories[record['category']],
+        'image_url': record.get('thumbnail') or record.get('image_url') or '',
+        'sku': sku,
+        'user_id': record.get('seller_id') or seller_id,
+    } for sku, record in records.items()]
+    if connection.dialect.insert_returning:
+        inserted = connection.execute(products_table.insert().returning(products_table.c.id, products_table.c.sku), rows)
+    else:
+        # e.g. SQLite before 3.35; the batch's SKUs are unique, so they find the new rows
+        connection.execute(products_table.insert(), rows)
+        inserted = connection.execute(
+            select(products_table.c.id, products_table.c.sku).where(products_table.c.sku.in_(records))
+        )
+    product_ids = {sku: product_id for product_id, sku in inserted}
+    counts['products'] += len(product_ids)
+
+    images, tag_links, ratings, discounts = [], [], [], []
+    tagged_categories = set()
+    reviewers = dict(connection.execute(select(User.email, User.id).where(User.email.in_({
+        review['reviewerEmail'] for record in records.values() for review in record.get('reviews') or []
+        if review.get('reviewerEmail')
+    }))).all())
+    for sku, record in records.items():
+        product_id = product_ids[sku]
+        category_id = categories[record['category']]
+        images.extend({'product_id': product_id, 'image_url': url} for url in record.get('images') or [])
+
+        for name in dict.fromkeys(record.get('tags') or []):
+            if name == record['category']:
+                continue
+            if name not in tags:
+                tags[name] = connection.execute(
+                    Tag.__table__.insert().values(name=name, category_id=category_id)
+                ).inserted_primary_key[0]
+                tagged_categories.add(category_id)
+                counts['tags'] += 1
+            tag_links.append({'product_id': product_id, 'tag_id': tags[name]})
+
+        for review in record.get('reviews') or []:
+            user_id = review.get('user_id') or reviewers.get(review.get('reviewerEmail')) or reviewer_id
+            rating = coerce_rating(review.get('rating'))
+            if user_id is None or rating is None:
+                counts['skipped_reviews'] += 1
+                continue
+            ratings.append({'product_id': product_id, 'user_id': user_id,
+                            'rating': rating, 'comment': review.get('comment')})
+
+        if record.get('discountPercentage'):
+            discounts.append({'product_id': product_id, 'discount_percentage': record['discountPercentage'],
+                              'start_date': now, 'end_date': now + discount_length})
+
+    for table, rows in [(ProductImage.__table__, images), (product_tag_association, tag_links),
+                        (Rating.__table__, ratings), (Discount.__table__, discounts)]:
+        if rows:
+            connection.execute(table.insert(), rows)
+    # Core inserts skip the ORM flush hook that keeps rating stats
+    add_rating_stats(connection, [(rating['product_id'], rating['rating'], 1) for rating in ratings])
+    counts['images'] += len(images)
+    counts['ratings'] += len(ratings)
+    counts['discounts'] += len(discounts)
+
+    # Core inserts skip the ORM flush hooks that bump catalog versions; a new tag changes its category
+    versions = {product_key(product_ids[sku]): categories[record['category']] for sku, record in records.items()}
+    versions.update({category_key(category_id): category_id for category_id in tagged_categories})
+    bump_versions(connection, versions)
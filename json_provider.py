@@ -0,0 +1,56 @@
+# json_provider.py
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional; create_app keeps Flask's provider without it
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider backed by orjson. Output matches the default provider:
+    sorted keys, HTTP dates for datetimes, and indented responses in debug mode.
+    Calls with json.dumps() arguments orjson doesn't support fall back to it.
+    """
+
+    def dumps_bytes(self, obj, indent=False):
+        # datetimes go through self.default, which formats them as HTTP dates like Flask does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self.compact is False or (self.compact is None and self._app.debug):
+            body = self.dumps_bytes(obj, indent=True) + b'\n'
+        else:
+            body = self.dumps_bytes(obj)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def encode_json(obj):
+    """Compact JSON bytes for obj from the app's JSON provider."""
+    provider = current_app.json
+    if isinstance(provider, OrjsonProvider):
+        return provider.dumps_bytes(obj)
+    return provider.dumps(obj).encode()
+
+
+def json_bytes_response(body):
+    """A JSON response from already encoded bytes."""
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
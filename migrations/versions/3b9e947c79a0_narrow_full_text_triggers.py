@@ -0,0 +1,71 @@
+"""narrow full text triggers
+
+Revision ID: 3b9e947c79a0
+Revises: 89f5cb9f444d
+Create Date: 2026-10-18 09:47:05.610267
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e947c79a0'
+down_revision = '89f5cb9f444d'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_UPDATE_TRIGGER = """CREATE TRIGGER products_fts_update AFTER UPDATE{columns} ON products BEGIN
+        DELETE FROM products_fts WHERE rowid = old.id;
+        INSERT INTO products_fts (rowid, name, description, category)
+        VALUES (new.id, new.name, new.description, (SELECT name FROM categories WHERE id = new.category_id));
+    END"""
+
+POSTGRES_PRODUCTS_TRIGGER = """CREATE TRIGGER products_search_vector_trigger BEFORE INSERT OR UPDATE{columns}
+        ON products FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()"""
+
+SQLITE_UPGRADE = [
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    SQLITE_UPDATE_TRIGGER.format(columns=' OF name, description, category_id'),
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS products_fts_update",
+    SQLITE_UPDATE_TRIGGER.format(columns=''),
+]
+
+POSTGRES_UPGRADE = [
+    "DROP TRIGGER IF EXISTS products_search_vector_trigger ON products",
+    POSTGRES_PRODUCTS_TRIGGER.format(columns=' OF name, description, category_id'),
+    """CREATE OR REPLACE FUNCTION categories_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE products SET category_id = category_id WHERE category_id = NEW.id;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql""",
+    """CREATE TRIGGER categories_search_vector_trigger AFTER UPDATE OF name ON categories
+        FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+        EXECUTE FUNCTION categories_search_vector_update()""",
+    # products of categories renamed before this migration
+    "UPDATE products SET category_id = category_id",
+]
+
+POSTGRES_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS categories_search_vector_trigger ON categories",
+    "DROP FUNCTION IF EXISTS categories_search_vector_update()",
+    "DROP TRIGGER IF EXISTS products_search_vector_trigger ON products",
+    POSTGRES_PRODUCTS_TRIGGER.format(columns=''),
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_UPGRADE, 'postgresql': POSTGRES_UPGRADE}.get(dialect, []):
+        op.execute(sa.text(statement))
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    for statement in {'sqlite': SQLITE_DOWNGRADE, 'postgresql': POSTGRES_DOWNGRADE}.get(dialect, []):
+        op.execute(sa.text(statement))
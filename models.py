@@ -1,23 +1,26 @@
 from sqlalchemy_serializer import SerializerMixin
 from sqlalchemy import Column, Integer, String, ForeignKey, Table
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import validates, relationship,backref
+from sqlalchemy.orm import validates, relationship,backref, selectinload
 from sqlalchemy.ext.hybrid import hybrid_property
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from config import  db
 from app import bcrypt
+from hashing import hash_password, check_password, needs_rehash
 
 # Association table for many-to-many relationship between users and products56
 
 wishlist_table = db.Table('wishlist_table',
     db.Column('user_id', db.Integer, db.ForeignKey('users.id'), primary_key=True),
-    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
+    db.Index('ix_wishlist_table_product_id', 'product_id')
 )
 # Association table for the many-to-many relationship between Products and Tags
 product_tag_association = db.Table('product_tag_association',
     db.Column('product_id', db.Integer, db.ForeignKey('products.id'), primary_key=True),
-    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True)
+    db.Column('tag_id', db.Integer, db.ForeignKey('tags.id'), primary_key=True),
+    db.Index('ix_product_tag_association_tag_id', 'tag_id')
 )
 class User(db.Model, SerializerMixin):
     __tablename__ = 'users'
@@ -35,9 +38,11 @@ class User(db.Model, SerializerMixin):
     products = db.relationship('Product', back_populates='seller')
     billing_details = db.relationship('BillingDetail', back_populates='user', cascade='all, delete-orphan')
    
-    wishlists = relationship('Product', secondary=wishlist_table, backref=backref('wishlisted_by_users', lazy='dynamic'))
+    # dynamic, so a wishlist can be counted, filtered and paged in SQL instead of loaded whole
+    wishlists = relationship('Product', secondary=wishlist_table, lazy='dynamic',
+                             backref=backref('wishlisted_by_users', lazy='dynamic'))
 
-    serialize_rules = ('-_password_hash', '-orders', '-created_at', '-updated_at')
+    serialize_rules = ('-_password_hash', '-orders', '-wishlists', '-created_at', '-updated_at')
 
     @validates('username', 'email')
     def validate_fields(self, key, value):
@@ -45,17 +50,22 @@ class User(db.Model, SerializerMixin):
             raise ValueError(f'User must have a {key}')
         return value
 
+    # bcrypt runs on the app's hashing pool (hashing.py), which raises HashingBusy when saturated
     def set_password(self, password):
-        self._password_hash = bcrypt.generate_password_hash(password).decode('utf8')
+        self._password_hash = hash_password(password)
     
     def authenticate(self, password):
-        return bcrypt.check_password_hash(self._password_hash, password)
+        return check_password(self._password_hash, password)
+
+    def password_needs_rehash(self):
+        """True when the password was hashed at a different BCRYPT_LOG_ROUNDS than the current one."""
+        return needs_rehash(self._password_hash)
     
     def get_completed_orders(self):
         """
         Get all completed orders for this user.
         """
-        completed_orders = Order.query.filter_by(user_id=self.id, status='completed').all()
+        completed_orders = Order.query.options(selectinload(Order.order_items)).filter_by(user_id=self.id, status='completed').all()
         return [order.serialize() for order in completed_orders]
     
     def serialize(self):
@@ -104,7 +114,7 @@ class Product(db.Model, SerializerMixin):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
     image_url = db.Column(db.String, nullable=False)
     price = db.Column(db.Float, nullable=False)
     description = db.Column(db.Text)
@@ -116,24 +126,41 @@ class Product(db.Model, SerializerMixin):
 
     images = db.relationship('ProductImage', back_populates='product', cascade='all, delete-orphan')
 
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     seller = db.relationship('User', back_populates='products')
 
     order_items = db.relationship('OrderItem', backref='product')
+    # joined, so listings get rating stats without another query
+    rating_stats = db.relationship('ProductRatingStats', uselist=False, lazy='joined', cascade='all, delete-orphan')
 
-    serialize_rules = ('-order_items', '-created_at', '-updated_at','-seller')
+    serialize_rules = ('-order_items', '-created_at', '-updated_at','-seller', '-rating_stats')
 
     @validates('name', 'category', 'price', 'stock')
     def validate_fields(self, key, value):
         if not value:
             raise ValueError(f'Product must have a {key}')
         return value
+
+    @classmethod
+    def query_for_listing(cls):
+        """
+        Product query that eager loads every relationship touched by
+        serialize() and serialize_limited(), so listings run a fixed
+        number of queries instead of one per product.
+        """
+        return cls.query.options(
+            selectinload(cls.category).selectinload(Category.tags),
+            selectinload(cls.images),
+            selectinload(cls.tags),
+        )
     
-    def serialize(self):
+    def serialize(self, compact=False):
+        # compact products reference their category by id, for responses that side-load categories
+        category = {'category_id': self.category_id} if compact else {'category': self.category.serialize()}
         return {
             'id': self.id,
             'name': self.name,
-            'category': self.category.serialize(),  # serialize the category relationship
+            **category,  # serialize the category relationship
             'price': self.price,
             'image_url': self.image_url,
             'description': self.description,
@@ -141,6 +168,7 @@ class Product(db.Model, SerializerMixin):
             'tags': [tag.serialize() for tag in self.tags],  # serialize tags relationship
             'sku': self.sku,
             'stock': self.stock,
+            'rating_stats': ProductRatingStats.stats_dict(self.rating_stats),
         }
     def serialize_limited(self):
         return {
@@ -156,7 +184,7 @@ class Category(db.Model):
     __tablename__ = 'categories'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
+    name = db.Column(db.String, nullable=False, index=True)
     products = db.relationship('Product', backref='category', lazy=True)
     tags = db.relationship('Tag', backref='category', lazy=True)
 
@@ -175,7 +203,7 @@ class Tag(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
-    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False, index=True)
     products = db.relationship('Product', secondary=product_tag_association, back_populates='tags')
 
     def serialize(self):
@@ -192,7 +220,7 @@ class ProductImage(db.Model, SerializerMixin):
     __tablename__ = 'product_images'
 
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     image_url = db.Column(db.String, nullable=False)
 
     product = db.relationship('Product', back_populates='images')
@@ -220,6 +248,10 @@ class Order(db.Model, SerializerMixin):
     order_items = db.relationship('OrderItem', backref='order')
     items = association_proxy('order_items', 'product')
 
+    __table_args__ = (
+        db.Index('ix_orders_user_id_status', 'user_id', 'status'),
+    )
+
     serialize_rules = ('-order_items', '-user', 'created_at', 'updated_at')
     def serialize(self):
         return {
@@ -242,6 +274,11 @@ class OrderItem(db.Model, SerializerMixin):
     created_at = db.Column(db.DateTime, server_default=db.func.now())
     updated_at = db.Column(db.DateTime, onupdate=db.func.now())
 
+    __table_args__ = (
+        db.Index('ix_order_items_order_id_product_id', 'order_id', 'product_id'),
+        db.Index('ix_order_items_product_id', 'product_id'),
+    )
+
     serialize_rules = ('-order', '-product', '-created_at', '-updated_at')
 
     @validates('quantity', 'price')
@@ -260,6 +297,31 @@ class OrderItem(db.Model, SerializerMixin):
         }
 
 
+class ProductSalesSummary(db.Model):
+    __tablename__ = 'product_sales_summaries'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    total_quantity = db.Column(db.Integer, nullable=False, default=0)
+    total_sales = db.Column(db.Float, nullable=False, default=0)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
+    def __repr__(self):
+        return f"<ProductSalesSummary(product_id={self.product_id}, total_quantity={self.total_quantity}, total_sales={self.total_sales})>"
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_versions'
+
+    # 'product:<id>' or 'category:<id>'; category_id is the product's category, or the category itself
+    key = db.Column(db.String, primary_key=True)
+    category_id = db.Column(db.Integer, nullable=False, index=True)
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<CatalogVersion(key={self.key}, version={self.version})>"
+
+
 class ViewingHistory(db.Model, SerializerMixin):
     __tablename__ = 'viewing_history'
 
@@ -273,6 +335,9 @@ class ViewingHistory(db.Model, SerializerMixin):
 
     serialize_rules = ('-user', '-product', '-viewed_at')
 
+db.Index('ix_viewing_history_user_id_viewed_at', ViewingHistory.user_id, ViewingHistory.viewed_at.desc())
+db.Index('ix_viewing_history_product_id', ViewingHistory.product_id)
+
 
 class SearchQuery(db.Model, SerializerMixin):
     __tablename__ = 'search_query'
@@ -286,6 +351,8 @@ class SearchQuery(db.Model, SerializerMixin):
 
     serialize_rules = ('-user', '-searched_at')
 
+db.Index('ix_search_query_user_id_searched_at', SearchQuery.user_id, SearchQuery.searched_at.desc())
+
 
 class Engagement(db.Model, SerializerMixin):
     __tablename__ = 'engagement'
@@ -301,11 +368,81 @@ class Engagement(db.Model, SerializerMixin):
 
     serialize_rules = ('-user', '-product', '-engaged_at')
 
+db.Index('ix_engagement_user_id_engaged_at', Engagement.user_id, Engagement.engaged_at.desc())
+db.Index('ix_engagement_product_id', Engagement.product_id)
+
+
+class DailyInteraction(db.Model):
+    """Views and engagements rolled up per day from viewing_history and engagement (retention.py)."""
+    __tablename__ = 'daily_interactions'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    engagements = db.Column(db.Integer, nullable=False, default=0)
+    watch_time = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_daily_interactions_user_id_day', 'user_id', 'day'),
+        db.Index('ix_daily_interactions_product_id', 'product_id'),
+    )
+
+    def __repr__(self):
+        return f"<DailyInteraction(day={self.day}, user_id={self.user_id}, product_id={self.product_id}, views={self.views})>"
+
+
+class DailySearch(db.Model):
+    """Searches rolled up per day from search_query (retention.py)."""
+    __tablename__ = 'daily_searches'
+
+    day = db.Column(db.Date, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    search_query = db.Column(db.String(200), primary_key=True)
+    searches = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_daily_searches_user_id_day', 'user_id', 'day'),
+    )
+
+    def __repr__(self):
+        return f"<DailySearch(day={self.day}, user_id={self.user_id}, search_query={self.search_query}, searches={self.searches})>"
+
+class RecommendationCandidate(db.Model):
+    __tablename__ = 'recommendation_candidates'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, server_default=db.func.now(), onupdate=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_recommendation_candidates_user_id_score', 'user_id', 'score'),
+    )
+
+    def __repr__(self):
+        return f"<RecommendationCandidate(user_id={self.user_id}, product_id={self.product_id}, score={self.score})>"
+
+class ProductSimilarity(db.Model):
+    __tablename__ = 'product_similarities'
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    similar_product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_product_similarities_product_id_score', 'product_id', 'score'),
+        db.Index('ix_product_similarities_similar_product_id', 'similar_product_id'),
+    )
+
+    def __repr__(self):
+        return f"<ProductSimilarity(product_id={self.product_id}, similar_product_id={self.similar_product_id}, score={self.score})>"
+
 class Rating(db.Model, SerializerMixin):
     __tablename__ = 'ratings'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     comment = db.Column(db.Text)
@@ -331,11 +468,43 @@ class Rating(db.Model, SerializerMixin):
             'created_at': self.created_at.isoformat()
         }
 
+class ProductRatingStats(db.Model):
+    """Count, sum and 1-5 star histogram of a product's ratings, updated with every rating write (ratings.py)."""
+    __tablename__ = 'product_rating_stats'
+
+    HISTOGRAM = ('stars_1', 'stars_2', 'stars_3', 'stars_4', 'stars_5')
+
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id', ondelete='CASCADE'), primary_key=True)
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    stars_1 = db.Column(db.Integer, nullable=False, default=0)
+    stars_2 = db.Column(db.Integer, nullable=False, default=0)
+    stars_3 = db.Column(db.Integer, nullable=False, default=0)
+    stars_4 = db.Column(db.Integer, nullable=False, default=0)
+    stars_5 = db.Column(db.Integer, nullable=False, default=0)
+
+    @classmethod
+    def stats_dict(cls, stats):
+        """
+        The rating_stats of a product's JSON, from a stats object or a row with
+        the same column names. None, or a row of NULLs from an outer join, is a
+        product without ratings.
+        """
+        count = getattr(stats, 'rating_count', None) or 0
+        return {
+            'count': count,
+            'average': round(stats.rating_sum / count, 2) if count else None,
+            'histogram': {column[-1]: getattr(stats, column, None) or 0 for column in cls.HISTOGRAM},
+        }
+
+    def __repr__(self):
+        return f"<ProductRatingStats(product_id={self.product_id}, rating_count={self.rating_count})>"
+
 class Discount(db.Model, SerializerMixin):
     __tablename__ = 'discounts'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    product_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False, index=True)
     discount_percentage = db.Column(db.Float, nullable=False)
     start_date = db.Column(db.DateTime, nullable=False)
     end_date = db.Column(db.DateTime, nullable=False)
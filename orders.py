@@ -1,11 +1,19 @@
 from flask import Flask, make_response,jsonify,session,request, current_app, Blueprint
 from flask_restful import Resource, Api, reqparse
 from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from sqlalchemy import select, update, case
+from sqlalchemy.orm import selectinload
+from datetime import datetime
 from config import api, jwt, db, app
 
 # Add your model imports
 from models import Product, Order, OrderItem, User
 from authenticate import allow
+from sales import seller_products_with_sales, record_completed_order
+from database import replica_reads
+from serializers import invalidate_encoded_products
+from conditional import bump_products
+from cache import response_cache
 
 order_bp = Blueprint('order_bp',__name__, url_prefix='/api')
 order_api = Api(order_bp)
@@ -37,8 +45,11 @@ def remove_from_cart(product_id):
         return jsonify({'error': 'Item not found in cart'}), 404
 
     order.total_price -= order_item.price * order_item.quantity  # Adjust the total price
+    release_stock(product_id, order_item.quantity)
     db.session.delete(order_item)
+    category_id = db.session.scalar(select(Product.category_id).where(Product.id == product_id))
     db.session.commit()
+    invalidate_stock([product_id], [category_id])
 
     # Check if the cart is empty
     if not order.order_items:
@@ -54,32 +65,91 @@ def remove_from_cart(product_id):
 def add_to_cart():
     data = request.get_json()
     user_id = get_jwt_identity()
-    
+
+    # Merge repeated products into one quantity per product
+    quantities = {}
+    try:
+        for item_data in data['order_items']:
+            product_id = int(item_data['product_id'])
+            quantity = int(item_data['quantity'])
+            if quantity <= 0:
+                raise ValueError
+            quantities[product_id] = quantities.get(product_id, 0) + quantity
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'order_items must be a list of product_id and positive quantity'}), 422
+
+    products = {product.id: product for product in Product.query.filter(Product.id.in_(quantities)).all()}
+    missing = sorted(set(quantities) - set(products))
+    if missing:
+        return jsonify({'error': 'Products not found', 'product_ids': missing}), 404
+
+    # Reserve stock with one conditional UPDATE; any short product fails the whole cart
+    if not reserve_stock(quantities):
+        db.session.rollback()
+        # the stock read above may predate the UPDATE, so check against the current stock
+        stock = db.session.execute(select(Product.id, Product.stock).where(Product.id.in_(quantities)))
+        short = sorted(product_id for product_id, current in stock if current < quantities[product_id])
+        return jsonify({'error': 'Insufficient stock', 'product_ids': short}), 409
+
     # Check if the user already has an active cart
-    order = Order.query.filter_by(user_id=user_id, status='cart').first()
+    order = Order.query.filter_by(user_id=user_id, status='cart').with_for_update().first()
     if not order:
         # Create a new cart
         order = Order(user_id=user_id, status='cart', total_price=0)
         db.session.add(order)
-        db.session.commit()
-    
-    # Add items to the cart
-    for item_data in data['order_items']:
-        product = Product.query.get(item_data['product_id'])
-        if product:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=product.id,
-                quantity=item_data['quantity'],
-                price=product.price
-            )
-            db.session.add(order_item)
-            order.total_price += product.price * item_data['quantity']
-    
+        db.session.flush()
+
+    # Upsert line items, adding to the quantity of products already in the cart
+    existing = {item.product_id: item for item in OrderItem.query.filter(
+        OrderItem.order_id == order.id, OrderItem.product_id.in_(quantities)
+    )}
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        order_item = existing.get(product_id)
+        if order_item:
+            order_item.quantity += quantity
+        else:
+            db.session.add(OrderItem(order_id=order.id, product_id=product_id, quantity=quantity, price=product.price))
+        order.total_price += product.price * quantity
+
+    # read before the commit expires the products
+    category_ids = {product.category_id for product in products.values()}
     db.session.commit()
+    invalidate_stock(quantities, category_ids)
     
     return jsonify(order.serialize()), 201
 
+def reserve_stock(quantities):
+    """Decrement stock for every product, or for none if any has too little. Returns whether it succeeded."""
+    needed = case(quantities, value=Product.id)
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id.in_(quantities), Product.stock >= needed)
+        .values(stock=Product.stock - needed)
+        .execution_options(synchronize_session=False)
+    )
+    invalidate_encoded_products(db.session, quantities)
+    bump_products(db.session.connection(), quantities)
+    return result.rowcount == len(quantities)
+
+def release_stock(product_id, quantity):
+    db.session.execute(
+        update(Product)
+        .where(Product.id == product_id)
+        .values(stock=Product.stock + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    invalidate_encoded_products(db.session, [product_id])
+    bump_products(db.session.connection(), [product_id])
+
+def invalidate_stock(product_ids, category_ids):
+    """Drop cached responses showing the stock of these products. Call it once the stock change is committed."""
+    response_cache.invalidate(
+        'products',
+        *(f'product:{product_id}' for product_id in product_ids),
+        *(f'category:{category_id}' for category_id in set(category_ids)),
+    )
+
 @order_bp.route('/checkout', methods=['POST'])
 @jwt_required()
 def checkout():
@@ -105,6 +175,7 @@ def complete_order(order_id):
     # process payment    
     # If payment is successful, update the order status to 'completed'
     order.status = 'completed'
+    record_completed_order(db.session.connection(), order.id)
     db.session.commit()
     
     return jsonify(order.serialize()), 200
@@ -120,17 +191,22 @@ def get_orders():
 
 # get all products by a specific seller
 @order_bp.route('/seller/<int:seller_id>/products', methods=['GET'])
+@replica_reads
 def get_products_by_seller(seller_id):
-    seller = User.query.get(seller_id)
+    seller = db.session.get(User, seller_id)
     if not seller:
         return jsonify({"error": "Seller not found"}), 404
 
-    products = seller.products
-    products_with_sales = []
+    try:
+        start_date = parse_date(request.args.get('start_date'))
+        end_date = parse_date(request.args.get('end_date'))
+    except ValueError:
+        return jsonify({"error": "Dates must be in ISO 8601 format"}), 400
+    status = request.args.get('status')
 
-    for product in products:
-        total_sales = sum(item.quantity * item.price for item in product.order_items)
-        total_quantity = sum(item.quantity for item in product.order_items)
+    # Sales totals come from one GROUP BY over the seller's order items
+    products_with_sales = []
+    for product, total_sales, total_quantity in seller_products_with_sales(seller_id, start_date, end_date, status):
         product_data = product.serialize()
         product_data['total_sales'] = total_sales
         product_data['total_quantity'] = total_quantity
@@ -138,17 +214,36 @@ def get_products_by_seller(seller_id):
 
     return jsonify(products_with_sales), 200
 
+def parse_date(value):
+    return datetime.fromisoformat(value) if value else None
+
 @order_bp.route('/seller/<int:seller_id>/orders', methods=['GET'])
+@replica_reads
 def get_orders_by_seller(seller_id):
-    seller = User.query.get(seller_id)
+    seller = db.session.get(User, seller_id)
     if not seller:
         return jsonify({"error": "Seller not found"}), 404
 
-    orders = []
-    for product in seller.products:
-        for order_item in product.order_items:
-            if order_item.order not in orders:
-                orders.append(order_item.order)
-
-    return jsonify([order.serialize() for order in orders]), 200
-
+    status = request.args.get('status')
+
+    # Each order once, however many of the seller's products it contains
+    seller_order_ids = select(OrderItem.order_id).join(Product, Product.id == OrderItem.product_id).where(Product.user_id == seller_id)
+    query = Order.query.options(selectinload(Order.order_items)).filter(Order.id.in_(seller_order_ids))
+    if status:
+        query = query.filter(Order.status == status)
+
+    # without ?after= or ?limit=, the bare list existing clients expect
+    if 'after' not in request.args and 'limit' not in request.args:
+        return jsonify([order.serialize() for order in query.order_by(Order.id).all()]), 200
+
+    # keyset pagination: ?after=<last seen id>&limit=N
+    after = request.args.get('after', default=0, type=int)
+    limit = request.args.get('limit', default=current_app.config['SELLER_ORDERS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['SELLER_ORDERS_PAGE_SIZE_MAX']))
+    orders = query.filter(Order.id > after).order_by(Order.id).limit(limit + 1).all()
+
+    next_cursor = orders[limit - 1].id if len(orders) > limit else None
+    return jsonify({
+        'orders': [order.serialize() for order in orders[:limit]],
+        'next_cursor': next_cursor
+    }), 200
@@ -1,9 +1,19 @@
-from flask import Flask, abort, make_response, jsonify, session, request, current_app, Blueprint
+from flask import Flask, abort, make_response, jsonify, session, request, current_app, Blueprint, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from config import api, jwt, db, app
 from models import Product, User,Category, Tag, ViewingHistory, SearchQuery, Engagement,wishlist_table, Rating, Discount
-from authenticate import allow
-from Search import search_products
+from authenticate import allow, current_role
+from Search import search_products, get_search_index
+from recommendations import recommended_products as get_recommendations
+from cache import response_cache
+from database import replica_reads
+from ratings import valid_rating
+from serializers import (use_fast_serializers, use_compact_products, product_dicts, compact_listing,
+                         encoded_products, encoded_compact_listing)
+from json_provider import encode_json, json_bytes_response
+from conditional import conditional, catalog_validator, category_validator, product_validator
 
 product_bp = Blueprint('product_bp', __name__, url_prefix='/api')
 
@@ -13,31 +23,128 @@ def init_jwt(app):
 
 # get products
 @product_bp.route('/products', methods=['GET'])
+@conditional(catalog_validator)
+@response_cache.cached('products')
+@replica_reads
 def get_products():
     limit = request.args.get('limit',default=None,type=int)
-    if limit is None:
-        products = [product.serialize() for product in Product.query.all()]
+    after = request.args.get('after',default=None,type=int)
+    stream = request.args.get('stream',default=False,type=lambda value: value.lower() in ('1', 'true', 'yes'))
+    # ?compact=1: products carry a category_id, with the categories side-loaded once (not for streams)
+    compact = use_compact_products()
+
+    if stream:
+        return Response(stream_with_context(stream_products(after, limit)), mimetype='application/json'), 200
+
+    # keyset pagination: ?after=<last seen id>&limit=N
+    if after is not None:
+        limit = max(1, min(limit or current_app.config['PRODUCTS_PAGE_SIZE'], current_app.config['PRODUCTS_PAGE_SIZE_MAX']))
+        if use_fast_serializers():
+            product_ids = product_ids_after(after, limit + 1)
+            next_cursor = product_ids[limit - 1] if len(product_ids) > limit else None
+            if compact:
+                return json_bytes_response(encoded_compact_listing(product_ids[:limit], next_cursor=next_cursor)), 200
+            # the same bytes jsonify would produce for {'next_cursor': ..., 'products': [...]}
+            return json_bytes_response(
+                b'{"next_cursor":' + encode_json(next_cursor) + b',"products":'
+                + encoded_products(product_ids[:limit]) + b'}'
+            ), 200
+
+        page = products_after(after, limit + 1)
+        next_cursor = page[limit - 1].id if len(page) > limit else None
+        if compact:
+            products = [product.serialize(compact=True) for product in page[:limit]]
+            return jsonify(compact_listing(products, next_cursor=next_cursor)), 200
+        return jsonify({
+            'products': [product.serialize() for product in page[:limit]],
+            'next_cursor': next_cursor
+        }), 200
+
+    if use_fast_serializers():
+        if compact:
+            return json_bytes_response(encoded_compact_listing(product_ids_after(0, limit))), 200
+        return json_bytes_response(encoded_products(product_ids_after(0, limit))), 200
+    elif limit is None:
+        products = [product.serialize(compact) for product in Product.query_for_listing().all()]
     elif limit is not None:
-        products = [product.serialize() for product in Product.query.limit(limit).all()]
-    
+        products = [product.serialize(compact) for product in Product.query_for_listing().limit(limit).all()]
+
+    if compact:
+        return jsonify(compact_listing(products)), 200
     return jsonify(products), 200
 
+def product_ids_after(after, limit):
+    return db.session.execute(
+        select(Product.id).where(Product.id > after).order_by(Product.id).limit(limit)
+    ).scalars().all()
+
+def products_after(after, limit):
+    """Fetch the next `limit` products with an id greater than `after`."""
+    return Product.query_for_listing().filter(Product.id > after).order_by(Product.id).limit(limit).all()
+
+def stream_products(after=None, limit=None):
+    """
+    Yield the product listing as JSON text, one keyset batch at a time,
+    so only a single batch of products is held in memory.
+    Wraps the array in a {products, next_cursor} object when `after` is given.
+    """
+    batch_size = current_app.config['PRODUCTS_STREAM_BATCH_SIZE']
+    envelope = after is not None
+    last_id = after or 0
+    remaining = limit
+    has_more = False
+
+    yield '{"products": [' if envelope else '['
+    first = True
+    while remaining is None or remaining > 0:
+        size = batch_size if remaining is None else min(batch_size, remaining)
+        batch = products_after(last_id, size + 1)
+        has_more = len(batch) > size
+        batch = batch[:size]
+        for product in batch:
+            yield ('' if first else ',') + current_app.json.dumps(product.serialize())
+            first = False
+        if batch:
+            last_id = batch[-1].id
+        if remaining is not None:
+            remaining -= len(batch)
+        # drop the serialized batch from the identity map before loading the next one
+        db.session.expunge_all()
+        if not has_more:
+            break
+
+    if envelope:
+        next_cursor = last_id if has_more else None
+        yield '], "next_cursor": ' + current_app.json.dumps(next_cursor) + '}'
+    else:
+        yield ']'
+
 
 # Route to fetch products by category name
 @product_bp.route('/products/category/<string:category_name>', methods=['GET'])
+@conditional(category_validator)
+@response_cache.cached()
+@replica_reads
 def get_products_by_category_name(category_name):
     # Query the database to find the category by name
     category = Category.query.filter_by(name=category_name).first()
     
     if not category:
         abort(404, description="Category not found")
-    
-    # Fetch all products belonging to this category
-    products = Product.query.filter_by(category_id=category.id).all()
-    
-    # Serialize the list of products
-    serialized_products = [product.serialize() for product in products]
-    
+    response_cache.add_tags(f'category:{category.id}')
+    compact = use_compact_products()
+
+    if use_fast_serializers():
+        serialized_products = product_dicts(Product.category_id == category.id, compact=compact)
+    else:
+        # Fetch all products belonging to this category
+        products = Product.query_for_listing().filter_by(category_id=category.id).order_by(Product.id).all()
+
+        # Serialize the list of products
+        serialized_products = [product.serialize(compact) for product in products]
+
+    if compact:
+        return jsonify(compact_listing(serialized_products)), 200
     return jsonify(serialized_products), 200
 
 
@@ -59,10 +166,15 @@ def create_product():
     )
     db.session.add(product)
     db.session.commit()
+    get_search_index().add_product(product)
+    response_cache.invalidate('products', f'category:{product.category_id}')
     return jsonify(product.serialize()), 201
 
 # get a product
 @product_bp.route('/products/<int:product_id>', methods=['GET'])
+@conditional(product_validator)
+@response_cache.cached('product:{product_id}', 'ratings:{product_id}', 'discounts:{product_id}')
+@replica_reads
 def get_product(product_id):
     product = db.session.get(Product, product_id)
     if not product:
@@ -70,9 +182,11 @@ def get_product(product_id):
 
     product_data = product.serialize()
 
-    # Fetch ratings
-    ratings = Rating.query.filter_by(product_id=product_id).all()
-    product_data['ratings'] = [rating.serialize() for rating in ratings]
+    # The first page of reviews; rating_stats already summarizes all of them
+    limit = current_app.config['RATINGS_PAGE_SIZE']
+    ratings = ratings_before(product_id, None, limit + 1)
+    product_data['ratings'] = [rating.serialize() for rating in ratings[:limit]]
+    product_data['ratings_next_cursor'] = ratings[limit - 1].id if len(ratings) > limit else None
 
     # Fetch discounts
     discounts = Discount.query.filter_by(product_id=product_id).all()
@@ -86,8 +200,7 @@ def get_product(product_id):
 @allow('admin','seller')
 def update_product(product_id):
     current_user_id = get_jwt_identity()
-    user = User.query.filter(User.id == current_user_id).first()
-    role = user.role
+    role = current_role()
     product = Product.query.filter_by(id=product_id).first()
     data = request.get_json()
     if not product:
@@ -97,11 +210,14 @@ def update_product(product_id):
         if product.user_id != current_user_id:
             return jsonify({"message": "User not authorized"}), 401
 
+    previous_category_id = product.category_id
     for key, value in data.items():
         if key != 'id' and hasattr(product, key):
             setattr(product, key, value)
     try:
         db.session.commit()
+        get_search_index().add_product(product)
+        response_cache.invalidate('products', f'product:{product_id}', f'category:{previous_category_id}', f'category:{product.category_id}')
         return jsonify(product.serialize()), 200
     except Exception as e:
         return jsonify({"message": str(e)}), 400
@@ -112,16 +228,18 @@ def update_product(product_id):
 @allow('admin','seller')
 def delete_product(product_id):
     current_user_id = get_jwt_identity()
-    user = User.query.filter(User.id == current_user_id).first()
-    role = user.role
+    role = current_role()
     product = Product.query.filter_by(id=product_id).first()
     if not product:
         return jsonify({"message": "Product not found"}), 404
     if role == 'seller':
         if product.user_id != current_user_id:
             return jsonify({"message": "User not authorized"}), 401
+    category_id = product.category_id
     db.session.delete(product)
     db.session.commit()
+    get_search_index().remove_product(product_id)
+    response_cache.invalidate('products', f'product:{product_id}', f'category:{category_id}')
     return '', 204
 
 
@@ -129,33 +247,11 @@ def delete_product(product_id):
 @product_bp.route('/recommended_products', methods=['GET'])
 @jwt_required()
 def get_recommended_products():
+    # the token's user was loaded when the JWT was checked, and the request rejected if it's gone
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-
-    # Get recent search queries, views, and engagements
-    search_queries = SearchQuery.query.filter_by(user_id=user_id).order_by(SearchQuery.searched_at.desc()).limit(10).all()
-    viewing_history = ViewingHistory.query.filter_by(user_id=user_id).order_by(ViewingHistory.viewed_at.desc()).limit(10).all()
-    engagements = Engagement.query.filter_by(user_id=user_id).order_by(Engagement.engaged_at.desc()).limit(10).all()
 
-    # Gather product IDs from these interactions
-    product_ids = set()
-    for sq in search_queries:
-        products = Product.query.filter(Product.name.ilike(f"%{sq.search_query}%")).all()
-        product_ids.update([p.id for p in products])
-
-    product_ids.update([vh.product_id for vh in viewing_history])
-    product_ids.update([e.product_id for e in engagements])
-
-    # Fetch the products based on these IDs
-    recommended_products = Product.query.filter(Product.id.in_(list(product_ids))).limit(4).all()
-
-    # If not enough products, fetch some random ones to fill the gap
-    if len(recommended_products) < 4:
-        additional_products = Product.query.filter(Product.id.notin_(product_ids)).order_by(db.func.random()).limit(4 - len(recommended_products)).all()
-        recommended_products.extend(additional_products)
+    # Candidates are precomputed from views, engagements, searches and the wishlist
+    recommended_products = get_recommendations(user_id, 4)
 
     return jsonify([product.serialize() for product in recommended_products])
 
@@ -165,23 +261,66 @@ def get_recommended_products():
 @jwt_required()
 def get_user_products():
     current_user_id = get_jwt_identity()
-    products = Product.query.filter_by(user_id=current_user_id).all()
-    return jsonify([product.to_dict() for product in products]), 200
+    compact = use_compact_products()
+    if use_fast_serializers():
+        products = product_dicts(Product.user_id == current_user_id, compact=compact)
+    else:
+        products = Product.query_for_listing().filter_by(user_id=current_user_id).order_by(Product.id).all()
+        products = [product.serialize(compact) for product in products]
+    if compact:
+        return jsonify(compact_listing(products)), 200
+    return jsonify(products), 200
 
 
 # Ratings
+def ratings_before(product_id, before, limit):
+    """A product's ratings, newest first, with ids below `before`; each with its user for the username."""
+    query = Rating.query.options(joinedload(Rating.user)).filter(Rating.product_id == product_id)
+    if before is not None:
+        query = query.filter(Rating.id < before)
+    return query.order_by(Rating.id.desc()).limit(limit).all()
+
+def invalidate_ratings(product_id):
+    # rating_stats are part of the product in every listing of it
+    category_id = db.session.execute(select(Product.category_id).where(Product.id == product_id)).scalar()
+    response_cache.invalidate('ratings', f'ratings:{product_id}', 'products', f'category:{category_id}')
+
 @product_bp.route('/ratings', methods=['GET'])
+@response_cache.cached('ratings')
+@replica_reads
 def get_ratings():
-    ratings = [rating.serialize() for rating in Rating.query.all()]
+    ratings = [rating.serialize() for rating in Rating.query.options(joinedload(Rating.user)).all()]
     return jsonify(ratings), 200
 
 @product_bp.route('/ratings/<int:id>',methods=['GET'])
+@response_cache.cached('ratings:{id}')
+@replica_reads
 def get_rating(id):
-    ratings = [rating.serialize() for rating in Rating.query.filter(Rating.product_id == id).all()]
+    ratings = [rating.serialize() for rating in
+               Rating.query.options(joinedload(Rating.user)).filter(Rating.product_id == id).all()]
     return jsonify(ratings), 200
+
+# a product's reviews a page at a time, newest first: ?before=<last rating id>&limit=N
+@product_bp.route('/products/<int:product_id>/ratings', methods=['GET'])
+@response_cache.cached('ratings:{product_id}')
+@replica_reads
+def get_product_ratings(product_id):
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', default=current_app.config['RATINGS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['RATINGS_PAGE_SIZE_MAX']))
+    ratings = ratings_before(product_id, before, limit + 1)
+
+    next_cursor = ratings[limit - 1].id if len(ratings) > limit else None
+    return jsonify({
+        'ratings': [rating.serialize() for rating in ratings[:limit]],
+        'next_cursor': next_cursor
+    }), 200
+
 @product_bp.route('/ratings', methods=['POST'])
 def create_rating():
     data = request.get_json()
+    if not valid_rating(data.get('rating')):
+        return jsonify({'error': 'rating must be an integer from 1 to 5'}), 422
     new_rating = Rating(
         product_id=data.get('product_id'),
         user_id=data.get('user_id'),
@@ -190,6 +329,7 @@ def create_rating():
     )
     db.session.add(new_rating)
     db.session.commit()
+    invalidate_ratings(new_rating.product_id)
     return jsonify(new_rating.serialize()), 201
 
 @product_bp.route('/ratings/<int:id>', methods=['DELETE'])
@@ -197,6 +337,7 @@ def delete_rating(id):
     rating = Rating.query.get_or_404(id)
     db.session.delete(rating)
     db.session.commit()
+    invalidate_ratings(rating.product_id)
     return jsonify({'message': 'Rating deleted successfully'}), 200
 
 @product_bp.route('/ratings/<int:id>', methods=['PATCH'])
@@ -204,19 +345,26 @@ def update_rating(id):
     data = request.get_json()
     rating = Rating.query.get_or_404(id)
     if 'rating' in data:
+        if not valid_rating(data['rating']):
+            return jsonify({'error': 'rating must be an integer from 1 to 5'}), 422
         rating.rating = data['rating']
     if 'comment' in data:
         rating.comment = data['comment']
     db.session.commit()
+    invalidate_ratings(rating.product_id)
     return jsonify(rating.serialize()), 200
 
 # Discounts
 @product_bp.route('/discounts', methods=['GET'])
+@response_cache.cached('discounts')
+@replica_reads
 def get_discounts():
     discounts = [discount.serialize() for discount in Discount.query.all()]
     return jsonify(discounts), 200
 
 @product_bp.route('discounts/<int:id>',methods=['GET'])
+@response_cache.cached('discounts:{id}')
+@replica_reads
 def get_discount(id):
     discount =Discount.query.filter(Discount.product_id == id).first()
     if not discount:
@@ -235,6 +383,7 @@ def create_discount():
     )
     db.session.add(new_discount)
     db.session.commit()
+    response_cache.invalidate('discounts', f'discounts:{new_discount.product_id}')
     return jsonify(new_discount.serialize()), 201
 
 @product_bp.route('/discounts/<int:id>', methods=['DELETE'])
@@ -242,6 +391,7 @@ def delete_discount(id):
     discount = Discount.query.get_or_404(id)
     db.session.delete(discount)
     db.session.commit()
+    response_cache.invalidate('discounts', f'discounts:{discount.product_id}')
     return jsonify({'message': 'Discount deleted successfully'}), 200
 
 @product_bp.route('/discounts/<int:id>', methods=['PATCH'])
@@ -255,11 +405,20 @@ def update_discount(id):
     if 'end_date' in data:
         discount.end_date = data['end_date']
     db.session.commit()
+    response_cache.invalidate('discounts', f'discounts:{discount.product_id}')
     return jsonify(discount.serialize()), 200
 
+# Response cache hit/miss counters
+@product_bp.route('/cache/stats', methods=['GET'])
+@jwt_required()
+@allow('admin')
+def get_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
 @product_bp.route('/search_details', methods=['GET'])
+@replica_reads
 def search_product_details():
     query = request.args.get('query')
-    product_data=[product.serialize() for product in Product.query.all()]
-    results = search_products(query,product_data)
+    limit = request.args.get('limit',default=None,type=int)
+    results = search_products(query, limit)
     return jsonify(results),200
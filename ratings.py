@@ -0,0 +1,77 @@
+# ratings.py
+from sqlalchemy import event, inspect
+
+from config import db
+from models import Rating, ProductRatingStats
+from retention import add_to_rollup
+
+stats_table = ProductRatingStats.__table__
+
+
+def valid_rating(value):
+    """Whether `value` is a rating the API accepts: an int from 1 to 5."""
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= 5
+
+
+def coerce_rating(value):
+    """
+    An imported rating as an int from 1 to 5, or None when it isn't one.
+    Whole-number floats and numeric strings, like 4.0 or "4", are accepted.
+    """
+    if isinstance(value, bool):
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not number.is_integer():
+        return None
+    return int(number) if valid_rating(int(number)) else None
+
+
+def add_rating_stats(connection, changes):
+    """
+    Apply rating changes to product_rating_stats in the caller's transaction.
+    `changes` are (product_id, rating, sign) tuples: sign 1 for a rating added,
+    -1 for one removed. Ratings outside 1-5 count toward the average only.
+    """
+    rows = {}
+    for product_id, rating, sign in changes:
+        row = rows.setdefault(product_id, dict.fromkeys(('rating_count', 'rating_sum', *ProductRatingStats.HISTOGRAM), 0))
+        row['rating_count'] += sign
+        row['rating_sum'] += sign * rating
+        if 1 <= rating <= 5:
+            row[ProductRatingStats.HISTOGRAM[int(rating) - 1]] += sign
+    # changes that cancel out, like a rating edited and then edited back, write nothing
+    add_to_rollup(connection, stats_table, ['product_id'], [
+        dict(counters, product_id=product_id) for product_id, counters in rows.items() if any(counters.values())
+    ])
+
+
+# the previous rating and product of a changed rating are needed even when they weren't loaded
+@event.listens_for(Rating.rating, 'set', active_history=True)
+@event.listens_for(Rating.product_id, 'set', active_history=True)
+def keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+# Ratings written through the ORM update their product's stats in the same flush
+@event.listens_for(db.session.session_factory, 'after_flush')
+def update_rating_stats(session, flush_context):
+    changes = []
+    for instance in session.new:
+        if isinstance(instance, Rating):
+            changes.append((instance.product_id, instance.rating, 1))
+    for instance in session.deleted:
+        if isinstance(instance, Rating):
+            changes.append((instance.product_id, instance.rating, -1))
+    for instance in session.dirty:
+        if isinstance(instance, Rating):
+            state = inspect(instance)
+            product_id, rating = state.attrs.product_id.history, state.attrs.rating.history
+            if product_id.deleted or rating.deleted:
+                changes.append(((product_id.deleted or product_id.unchanged)[0],
+                                (rating.deleted or rating.unchanged)[0], -1))
+                changes.append((instance.product_id, instance.rating, 1))
+    if changes:
+        add_rating_stats(session.connection(), changes)
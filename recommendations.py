@@ -0,0 +1,233 @@
+# recommendations.py
+import time
+
+from flask import current_app
+from sqlalchemy import event, func, select, union_all, delete, literal, case
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import (Product, User, ViewingHistory, Engagement, SearchQuery, DailyInteraction, DailySearch,
+                    RecommendationCandidate, wishlist_table)
+
+# How much each kind of interaction adds to a candidate's score
+VIEW_WEIGHT = 1.0
+SEARCH_WEIGHT = 0.5
+WISHLIST_WEIGHT = 3.0
+ENGAGEMENT_WEIGHT = 1.0
+ENGAGEMENT_WEIGHT_PER_MINUTE = 0.5
+# products matched per search query, by name
+SEARCH_MATCH_LIMIT = 10
+# Scores only grow between refresh_candidates() runs, so one product viewed
+# over and over would outrank everything else for good. Capping them keeps
+# recent interactions with other products able to catch up.
+MAX_CANDIDATE_SCORE = 50.0
+
+candidates_table = RecommendationCandidate.__table__
+
+
+def engagement_weight(watch_time):
+    return ENGAGEMENT_WEIGHT + ENGAGEMENT_WEIGHT_PER_MINUTE * min(watch_time or 0, 300) / 60
+
+
+def capped(score):
+    return case((score > MAX_CANDIDATE_SCORE, MAX_CANDIDATE_SCORE), else_=score)
+
+
+def bump_candidates(connection, scores):
+    """
+    Add scores to (user_id, product_id) candidates, creating missing rows.
+    `scores` maps (user_id, product_id) to the weight to add. Scores are
+    capped at MAX_CANDIDATE_SCORE.
+    """
+    rows = [
+        {'user_id': user_id, 'product_id': product_id, 'score': min(score, MAX_CANDIDATE_SCORE)}
+        for (user_id, product_id), score in scores.items()
+        if user_id is not None and product_id is not None
+    ]
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(candidates_table)
+        connection.execute(insert.on_conflict_do_update(
+            index_elements=['user_id', 'product_id'],
+            set_={'score': capped(candidates_table.c.score + insert.excluded.score), 'updated_at': func.now()}
+        ), rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            candidates_table.update()
+            .where(candidates_table.c.user_id == row['user_id'], candidates_table.c.product_id == row['product_id'])
+            .values(score=capped(candidates_table.c.score + row['score']), updated_at=func.now())
+        )
+        if not updated.rowcount:
+            connection.execute(candidates_table.insert().values(**row))
+
+
+def search_matches(connection, search_query):
+    if not search_query:
+        return []
+    # a search for "50%" or "usb_c" matches those characters, not any
+    pattern = search_query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return connection.execute(
+        select(Product.id).where(Product.name.ilike(f'%{pattern}%', escape='\\')).limit(SEARCH_MATCH_LIMIT)
+    ).scalars().all()
+
+
+def interaction_scores(connection, views=(), engagements=(), searches=(), wishlist=()):
+    """
+    Candidate score increments for a batch of interactions. Each argument is a
+    list of dicts shaped like the rows of the matching table.
+    """
+    scores = {}
+
+    def add(user_id, product_id, weight):
+        scores[(user_id, product_id)] = scores.get((user_id, product_id), 0) + weight
+
+    for row in views:
+        add(row['user_id'], row['product_id'], VIEW_WEIGHT)
+    for row in engagements:
+        add(row['user_id'], row['product_id'], engagement_weight(row.get('watch_time')))
+    for row in searches:
+        for product_id in search_matches(connection, row.get('search_query')):
+            add(row['user_id'], product_id, SEARCH_WEIGHT)
+    for row in wishlist:
+        add(row['user_id'], row['product_id'], WISHLIST_WEIGHT)
+    return scores
+
+
+def record_interactions(connection, **interactions):
+    """Incrementally fold new interaction rows into the candidate table."""
+    bump_candidates(connection, interaction_scores(connection, **interactions))
+
+
+@event.listens_for(ViewingHistory, 'after_insert')
+def record_view(mapper, connection, target):
+    record_interactions(connection, views=[{'user_id': target.user_id, 'product_id': target.product_id}])
+
+
+@event.listens_for(Engagement, 'after_insert')
+def record_engagement(mapper, connection, target):
+    record_interactions(connection, engagements=[
+        {'user_id': target.user_id, 'product_id': target.product_id, 'watch_time': target.watch_time}
+    ])
+
+
+@event.listens_for(SearchQuery, 'after_insert')
+def record_search(mapper, connection, target):
+    record_interactions(connection, searches=[{'user_id': target.user_id, 'search_query': target.search_query}])
+
+
+def refresh_candidates(user_ids=None, history_limit=10):
+    """
+    Rebuild the candidate rows of the given users (all users by default) from
+    their latest viewing history, engagements and searches and their wishlist.
+    Users with fewer than `history_limit` raw rows of a kind are topped up from
+    the daily rollups of older rows (retention.py), newest days first.
+    Returns the number of users refreshed.
+    """
+    if user_ids is None:
+        user_ids = db.session.execute(select(User.id)).scalars().all()
+
+    connection = db.session.connection()
+    for user_id in user_ids:
+        views = db.session.execute(
+            select(ViewingHistory.user_id, ViewingHistory.product_id)
+            .where(ViewingHistory.user_id == user_id)
+            .order_by(ViewingHistory.viewed_at.desc()).limit(history_limit)
+        ).mappings().all()
+        engagements = db.session.execute(
+            select(Engagement.user_id, Engagement.product_id, Engagement.watch_time)
+            .where(Engagement.user_id == user_id)
+            .order_by(Engagement.engaged_at.desc()).limit(history_limit)
+        ).mappings().all()
+        searches = db.session.execute(
+            select(SearchQuery.user_id, SearchQuery.search_query)
+            .where(SearchQuery.user_id == user_id)
+            .order_by(SearchQuery.searched_at.desc()).limit(history_limit)
+        ).mappings().all()
+        views += rolled_up(
+            select(DailyInteraction.user_id, DailyInteraction.product_id)
+            .where(DailyInteraction.user_id == user_id, DailyInteraction.views > 0),
+            DailyInteraction.day, history_limit - len(views)
+        )
+        engagements += rolled_up(
+            select(DailyInteraction.user_id, DailyInteraction.product_id,
+                   (DailyInteraction.watch_time // DailyInteraction.engagements).label('watch_time'))
+            .where(DailyInteraction.user_id == user_id, DailyInteraction.engagements > 0),
+            DailyInteraction.day, history_limit - len(engagements)
+        )
+        searches += rolled_up(
+            select(DailySearch.user_id, DailySearch.search_query).where(DailySearch.user_id == user_id),
+            DailySearch.day, history_limit - len(searches)
+        )
+        wishlist = db.session.execute(
+            select(wishlist_table.c.user_id, wishlist_table.c.product_id).where(wishlist_table.c.user_id == user_id)
+        ).mappings().all()
+
+        connection.execute(delete(candidates_table).where(candidates_table.c.user_id == user_id))
+        record_interactions(connection, views=views, engagements=engagements, searches=searches, wishlist=wishlist)
+    db.session.commit()
+    return len(user_ids)
+
+
+def rolled_up(query, day, limit):
+    """Up to `limit` rows of a rollup query, newest days first."""
+    if limit <= 0:
+        return []
+    return db.session.execute(query.order_by(day.desc()).limit(limit)).mappings().all()
+
+
+def popular_product_ids(limit):
+    """
+    Ids of the most viewed, engaged with and wishlisted products, newest
+    products first when there is no history. Cached per app for
+    RECOMMENDATION_POPULAR_TTL seconds.
+    """
+    cached = current_app.extensions.get('popular_products')
+    if cached and cached[0] > time.monotonic() and len(cached[1]) >= limit:
+        return cached[1][:limit]
+
+    size = max(limit, current_app.config['RECOMMENDATION_POPULAR_SIZE'])
+    # raw rows count once each; rolled up rows count the views and engagements they replaced
+    interactions = union_all(
+        select(ViewingHistory.product_id.label('product_id'), literal(1).label('weight')),
+        select(Engagement.product_id.label('product_id'), literal(1).label('weight')),
+        select(wishlist_table.c.product_id.label('product_id'), literal(1).label('weight')),
+        select(DailyInteraction.product_id.label('product_id'),
+               (DailyInteraction.views + DailyInteraction.engagements).label('weight')),
+    ).subquery()
+    product_ids = db.session.execute(
+        select(interactions.c.product_id)
+        .join(Product, Product.id == interactions.c.product_id)
+        .group_by(interactions.c.product_id)
+        .order_by(func.sum(interactions.c.weight).desc(), interactions.c.product_id)
+        .limit(size)
+    ).scalars().all()
+    if len(product_ids) < size:
+        product_ids += db.session.execute(
+            select(Product.id).where(Product.id.notin_(product_ids)).order_by(Product.id.desc()).limit(size - len(product_ids))
+        ).scalars().all()
+
+    current_app.extensions['popular_products'] = (
+        time.monotonic() + current_app.config['RECOMMENDATION_POPULAR_TTL'], product_ids
+    )
+    return product_ids[:limit]
+
+
+def recommended_products(user_id, limit=4):
+    """Top scored candidates for the user, topped up with popular products."""
+    products = Product.query_for_listing().join(
+        RecommendationCandidate, RecommendationCandidate.product_id == Product.id
+    ).filter(
+        RecommendationCandidate.user_id == user_id
+    ).order_by(RecommendationCandidate.score.desc(), Product.id).limit(limit).all()
+
+    if len(products) < limit:
+        seen = {product.id for product in products}
+        fill_ids = [product_id for product_id in popular_product_ids(limit + len(seen)) if product_id not in seen]
+        fill_ids = fill_ids[:limit - len(products)]
+        if fill_ids:
+            fill = {product.id: product for product in Product.query_for_listing().filter(Product.id.in_(fill_ids))}
+            products.extend(fill[product_id] for product_id in fill_ids if product_id in fill)
+    return products
@@ -0,0 +1,134 @@
+# retention.py
+import csv
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import select, delete
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import ViewingHistory, Engagement, SearchQuery, DailyInteraction, DailySearch
+
+interactions = DailyInteraction.__table__
+searches = DailySearch.__table__
+
+
+def add_to_rollup(connection, table, keys, rows):
+    """
+    Add the counters of `rows` to the rollup rows with the same `keys`,
+    creating missing rows. Every column that isn't a key is a counter.
+    """
+    if not rows:
+        return
+    counters = [column for column in rows[0] if column not in keys]
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = (sqlite if dialect == 'sqlite' else postgresql).insert(table)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=keys,
+            set_={column: table.c[column] + upsert.excluded[column] for column in counters}
+        ), rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(*(table.c[key] == row[key] for key in keys))
+            .values({column: table.c[column] + row[column] for column in counters})
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert().values(**row))
+
+
+def view_totals(rows):
+    totals = {}
+    for row in rows:
+        if row.user_id is not None and row.product_id is not None:
+            total = totals.setdefault((row.viewed_at.date(), row.user_id, row.product_id), {'views': 0})
+            total['views'] += 1
+    return totals
+
+
+def engagement_totals(rows):
+    totals = {}
+    for row in rows:
+        if row.user_id is not None and row.product_id is not None:
+            total = totals.setdefault((row.engaged_at.date(), row.user_id, row.product_id),
+                                      {'engagements': 0, 'watch_time': 0})
+            total['engagements'] += 1
+            total['watch_time'] += row.watch_time or 0
+    return totals
+
+
+def search_totals(rows):
+    totals = {}
+    for row in rows:
+        if row.user_id is not None and row.search_query:
+            total = totals.setdefault((row.searched_at.date(), row.user_id, row.search_query), {'searches': 0})
+            total['searches'] += 1
+    return totals
+
+
+# raw table, its timestamp, rollup table and keys, and how a batch of raw rows adds up
+ROLLUPS = {
+    'views': (ViewingHistory.__table__, 'viewed_at', interactions, ['day', 'user_id', 'product_id'], view_totals),
+    'engagements': (Engagement.__table__, 'engaged_at', interactions, ['day', 'user_id', 'product_id'], engagement_totals),
+    'searches': (SearchQuery.__table__, 'searched_at', searches, ['day', 'user_id', 'search_query'], search_totals),
+}
+
+
+def rollup_events(days=None, batch_size=None, archive=None, pause=None):
+    """
+    Fold raw view, engagement and search rows older than `days` days into the
+    daily rollup tables and delete them. Returns the rows rolled up per kind.
+
+    Rows are handled in id order, `batch_size` at a time, each batch in its own
+    short transaction with a `pause` between batches, so request writes are
+    never blocked for long. With `archive`, each batch is appended to
+    <archive>/<table>.csv before it is deleted; a batch that fails after
+    being archived is archived again on the next run.
+    """
+    config = current_app.config
+    days = config['EVENTS_RETENTION_DAYS'] if days is None else days
+    batch_size = batch_size or config['EVENTS_RETENTION_BATCH_SIZE']
+    pause = config['EVENTS_RETENTION_PAUSE'] if pause is None else pause
+    # raw timestamps are naive UTC, see events.py
+    before = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=days)
+    if archive:
+        os.makedirs(archive, exist_ok=True)
+
+    counts = {}
+    for kind, (source, timestamp, rollup, keys, totals) in ROLLUPS.items():
+        counts[kind] = 0
+        last_id = 0
+        while True:
+            with db.engine.begin() as connection:
+                # keyset on the primary key: each batch starts where the last one ended
+                rows = connection.execute(
+                    select(source).where(source.c.id > last_id, source.c[timestamp] < before)
+                    .order_by(source.c.id).limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                add_to_rollup(connection, rollup, keys, [
+                    dict(zip(keys, key), **counters) for key, counters in totals(rows).items()
+                ])
+                if archive:
+                    archive_rows(os.path.join(archive, f'{source.name}.csv'), rows)
+                connection.execute(delete(source).where(source.c.id.in_([row.id for row in rows])))
+            last_id = rows[-1].id
+            counts[kind] += len(rows)
+            if len(rows) < batch_size:
+                break
+            time.sleep(pause)
+    return counts
+
+
+def archive_rows(path, rows):
+    new = not os.path.exists(path)
+    with open(path, 'a', newline='') as archive:
+        writer = csv.writer(archive)
+        if new:
+            writer.writerow(rows[0]._fields)
+        writer.writerows(rows)
@@ -2,7 +2,13 @@ from flask import Flask
 from flask.cli import with_appcontext
 import click
 from seed import seed_db  # Replace with the actual import path to your seeding function
-from config import db, create_app
+from config import db
+from app import create_app
+from recommendations import refresh_candidates
+from similarity import rebuild_similarities
+from sales import rebuild_sales_summary
+from retention import rollup_events
+from importer import read_records, import_catalog
 
 app = create_app('production')
 
@@ -13,8 +19,66 @@ def seed_command():
     seed_db()
     click.echo('Database seeded successfully.')
 
+@click.command('refresh-recommendations')
+@click.option('--user-id', 'user_ids', type=int, multiple=True, help='Only refresh these users.')
+@with_appcontext
+def refresh_recommendations_command(user_ids):
+    """Rebuild the precomputed recommendation candidates."""
+    count = refresh_candidates(list(user_ids) or None)
+    click.echo(f'Refreshed recommendations for {count} users.')
+
+@click.command('rebuild-similarities')
+@click.option('--top-k', type=int, default=None, help='Neighbors to keep per product.')
+@with_appcontext
+def rebuild_similarities_command(top_k):
+    """Rebuild the product tag similarity table."""
+    count = rebuild_similarities(db.session.connection(), top_k)
+    db.session.commit()
+    click.echo(f'Stored {count} product similarities.')
+
+@click.command('rebuild-sales-summary')
+@with_appcontext
+def rebuild_sales_summary_command():
+    """Rebuild the per-product sales summary from completed orders."""
+    count = rebuild_sales_summary(db.session.connection())
+    db.session.commit()
+    click.echo(f'Summarized sales for {count} products.')
+
+@click.command('rollup-events')
+@click.option('--days', type=int, default=None, help='Days of raw events to keep (EVENTS_RETENTION_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (EVENTS_RETENTION_BATCH_SIZE).')
+@click.option('--archive', type=click.Path(file_okay=False), default=None,
+              help='Append the raw rows to CSV files in this directory before deleting them.')
+@with_appcontext
+def rollup_events_command(days, batch_size, archive):
+    """Fold old views, engagements and searches into the daily rollup tables."""
+    counts = rollup_events(days, batch_size, archive)
+    click.echo('Rolled up ' + ', '.join(f'{count} {kind}' for kind, count in counts.items()) + '.')
+
+@click.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--seller-id', type=int, required=True, help='Seller of products that name none.')
+@click.option('--reviewer-id', type=int, default=None, help='User for reviews whose reviewerEmail matches no user.')
+@click.option('--batch-size', type=int, default=1000, help='Products per transaction.')
+@click.option('--skip-similarities', is_flag=True, help='Leave the similarity table for rebuild-similarities.')
+@with_appcontext
+def import_catalog_command(path, seller_id, reviewer_id, batch_size, skip_similarities):
+    """Stream products from a JSON array or JSON Lines file into the catalog."""
+    counts = import_catalog(read_records(path), seller_id, batch_size, reviewer_id)
+    click.echo(', '.join(f'{count} {name}' for name, count in sorted(counts.items())) or 'Nothing to import.')
+    if counts['products'] and not skip_similarities:
+        # bulk inserts skip the flush hook that refreshes neighbors product by product
+        count = rebuild_similarities(db.session.connection())
+        db.session.commit()
+        click.echo(f'Stored {count} product similarities.')
+
 # Register the command with the Flask CLI
 app.cli.add_command(seed_command)
+app.cli.add_command(refresh_recommendations_command)
+app.cli.add_command(rebuild_similarities_command)
+app.cli.add_command(rebuild_sales_summary_command)
+app.cli.add_command(rollup_events_command)
+app.cli.add_command(import_catalog_command)
 
 if __name__ == '__main__':
     app.run()
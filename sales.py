@@ -0,0 +1,117 @@
+# sales.py
+from sqlalchemy import select, func, delete, insert
+from sqlalchemy.dialects import postgresql, sqlite
+
+from config import db
+from models import Product, Order, OrderItem, ProductSalesSummary
+
+summaries = ProductSalesSummary.__table__
+
+
+def sales_by_product(seller_id, start_date=None, end_date=None, status=None):
+    """
+    Subquery of (product_id, total_sales, total_quantity) over the seller's
+    order items, in a single GROUP BY. Dates filter on the order's creation time.
+    """
+    query = select(
+        OrderItem.product_id.label('product_id'),
+        func.sum(OrderItem.quantity * OrderItem.price).label('total_sales'),
+        func.sum(OrderItem.quantity).label('total_quantity'),
+    ).join(
+        Product, Product.id == OrderItem.product_id
+    ).where(Product.user_id == seller_id)
+
+    if start_date or end_date or status:
+        query = query.join(Order, Order.id == OrderItem.order_id)
+    if start_date:
+        query = query.where(Order.created_at >= start_date)
+    if end_date:
+        query = query.where(Order.created_at < end_date)
+    if status:
+        query = query.where(Order.status == status)
+    return query.group_by(OrderItem.product_id).subquery('sales')
+
+
+def seller_products_with_sales(seller_id, start_date=None, end_date=None, status=None):
+    """
+    The seller's products with their sales totals, as (product, total_sales,
+    total_quantity) rows. Completed sales with no date range come from the
+    materialized summary table.
+    """
+    if status == 'completed' and not start_date and not end_date:
+        sales = select(
+            summaries.c.product_id,
+            summaries.c.total_sales,
+            summaries.c.total_quantity,
+        ).subquery('sales')
+    else:
+        sales = sales_by_product(seller_id, start_date, end_date, status)
+
+    return Product.query_for_listing().outerjoin(
+        sales, sales.c.product_id == Product.id
+    ).filter(
+        Product.user_id == seller_id
+    ).add_columns(
+        func.coalesce(sales.c.total_sales, 0),
+        func.coalesce(sales.c.total_quantity, 0),
+    ).order_by(Product.id).all()
+
+
+def record_completed_order(connection, order_id):
+    """Add a newly completed order's items to the per-product sales summary."""
+    rows = connection.execute(
+        select(
+            OrderItem.product_id.label('product_id'),
+            func.sum(OrderItem.quantity).label('total_quantity'),
+            func.sum(OrderItem.quantity * OrderItem.price).label('total_sales'),
+        ).where(
+            OrderItem.order_id == order_id, OrderItem.product_id.isnot(None)
+        ).group_by(OrderItem.product_id)
+    ).mappings().all()
+    if not rows:
+        return
+    rows = [dict(row, order_count=1) for row in rows]
+
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        upsert = (sqlite if dialect == 'sqlite' else postgresql).insert(summaries)
+        connection.execute(upsert.on_conflict_do_update(
+            index_elements=['product_id'],
+            set_={
+                'total_quantity': summaries.c.total_quantity + upsert.excluded.total_quantity,
+                'total_sales': summaries.c.total_sales + upsert.excluded.total_sales,
+                'order_count': summaries.c.order_count + 1,
+                'updated_at': func.now(),
+            }
+        ), rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            summaries.update().where(summaries.c.product_id == row['product_id']).values(
+                total_quantity=summaries.c.total_quantity + row['total_quantity'],
+                total_sales=summaries.c.total_sales + row['total_sales'],
+                order_count=summaries.c.order_count + 1,
+                updated_at=func.now(),
+            )
+        )
+        if not updated.rowcount:
+            connection.execute(summaries.insert().values(**row))
+
+
+def rebuild_sales_summary(connection):
+    """Recompute the summary from every completed order. Returns the number of products summarized."""
+    connection.execute(delete(summaries))
+    connection.execute(insert(summaries).from_select(
+        ['product_id', 'total_quantity', 'total_sales', 'order_count'],
+        select(
+            OrderItem.product_id,
+            func.sum(OrderItem.quantity),
+            func.sum(OrderItem.quantity * OrderItem.price),
+            func.count(func.distinct(OrderItem.order_id)),
+        ).join(
+            Order, Order.id == OrderItem.order_id
+        ).where(
+            Order.status == 'completed', OrderItem.product_id.isnot(None)
+        ).group_by(OrderItem.product_id)
+    ))
+    return connection.execute(select(func.count()).select_from(summaries)).scalar()
@@ -4,7 +4,10 @@ from datetime import datetime, timedelta
 from app import create_app
 import requests
 import random
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
+from importer import import_catalog
+from similarity import rebuild_similarities
 
 # Function to seed the database
 def seed_db():
@@ -83,70 +86,20 @@ def seed_db():
         sellers = User.query.filter_by(role='seller').all()
         users = User.query.filter_by(role='user').all()
 
-        # Add products to db
+        # Add products to db, skipping the categories the shop doesn't sell
+        products = [product_data for product_data in products
+                    if product_data['category'] not in ['groceries', 'vehicle', 'motorcycle']]
         for product_data in products:
-            # Add category
-            category_name = product_data['category']
-            if category_name not in ['groceries', 'vehicle', 'motorcycle']:
-                category = Category.query.filter_by(name=category_name).first()
-                if not category:
-                    category = Category(name=category_name)
-                    db.session.add(category)
-                    db.session.flush()
-
-                stock = product_data['stock'] or 20
-
-                # Add product
-                product = Product(
-                    name=product_data['title'],
-                    description=product_data['description'],
-                    price=product_data['price'],
-                    stock=stock,
-                    category_id=category.id,
-                    image_url=product_data['thumbnail'],
-                    sku=product_data['sku'],  # Main image or thumbnail
-                    user_id=random.choice(sellers).id
-                )
-                db.session.add(product)
-                db.session.flush()
-
-                # Add images
-                for image_url in product_data['images']:
-                    product_image = ProductImage(
-                        product_id=product.id,
-                        image_url=image_url
-                    )
-                    db.session.add(product_image)
-
-                # Add tags
-                for tag_name in product_data.get('tags', []):
-                    if tag_name != category_name:
-                        tag = Tag.query.filter_by(name=tag_name).first()
-                        if not tag:
-                            tag = Tag(name=tag_name, category_id=category.id)
-                            db.session.add(tag)
-                        product.tags.append(tag)
-
-                # Add product ratings and reviews
-                for review in product_data.get('reviews', []):
-                    rating = Rating(
-                        product_id=product.id,
-                        user_id=random.choice(users).id,  # Assign to a random user
-                        rating=review['rating'],
-                        comment=review.get('comment')
-                    )
-                    db.session.add(rating)
-
-                # Add discounts
-                discount = Discount(
-                    product_id=product.id,
-                    discount_percentage=random.uniform(5, 25),
-                    start_date=datetime.now() - timedelta(days=random.randint(1, 10)),
-                    end_date=datetime.now() + timedelta(days=random.randint(5, 15))
-                )
-                db.session.add(discount)
-
+            product_data['seller_id'] = random.choice(sellers).id
+            product_data['stock'] = product_data['stock'] or 20
+            product_data['discountPercentage'] = random.uniform(5, 25)
+            # Add product ratings and reviews from random users
+            for review in product_data.get('reviews', []):
+                review['user_id'] = random.choice(users).id
+        import_catalog(products, seller_id=sellers[0].id)
+        rebuild_similarities(db.session.connection())
         db.session.commit()
+        product_ids = db.session.execute(select(Product.id)).scalars().all()
 
         # Create Orders and OrderItems
         for _ in range(10):  # Create 10 random orders
@@ -176,7 +129,7 @@ def seed_db():
         for _ in range(50):  # Create 50 random viewing history records
             viewing_history = ViewingHistory(
                 user_id=random.choice(users).id,
-                product_id=random.choice(Product.query.all()).id,
+                product_id=random.choice(product_ids),
                 viewed_at=datetime.now() - timedelta(days=random.randint(1, 30))
             )
             db.session.add(viewing_history)
@@ -198,7 +151,7 @@ def seed_db():
         for _ in range(40):  # Create 40 random engagements
             engagement = Engagement(
                 user_id=random.choice(users).id,
-                product_id=random.choice(Product.query.all()).id,
+                product_id=random.choice(product_ids),
                 watch_time=random.randint(10, 300),
                 engaged_at=datetime.now() - timedelta(days=random.randint(1, 30))
             )
@@ -207,8 +160,8 @@ def seed_db():
         # Seed Wishlist data
         for _ in range(25):  # Create 50 random wishlist entries
             user = random.choice(users)
-            product = random.choice(Product.query.all())
-            db.session.execute(wishlist_table.insert().values(user_id=user.id, product_id=product.id))
+            product_id = random.choice(product_ids)
+            db.session.execute(wishlist_table.insert().values(user_id=user.id, product_id=product_id))
 
         db.session.commit()
 
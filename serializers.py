@@ -0,0 +1,310 @@
+# serializers.py
+from collections import defaultdict
+from itertools import chain
+
+from flask import current_app, has_app_context, request
+from sqlalchemy import event, select, or_, and_
+
+from cache import LRUCache
+from conditional import category_key, product_key
+from config import db
+from json_provider import encode_json
+from models import Product, Category, Tag, ProductImage, CatalogVersion, ProductRatingStats, Rating, product_tag_association
+
+ALL_PRODUCTS = object()
+
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.category_id, Product.price, Product.image_url,
+    Product.description, Product.sku, Product.stock,
+)
+# read in the same query as the product, through an outer join
+RATING_STATS_COLUMNS = tuple(
+    getattr(ProductRatingStats, column) for column in ('rating_count', 'rating_sum', *ProductRatingStats.HISTOGRAM)
+)
+
+
+def use_fast_serializers():
+    """Whether the current endpoint is listed in FAST_SERIALIZER_ENDPOINTS."""
+    return request.endpoint in current_app.config['FAST_SERIALIZER_ENDPOINTS']
+
+
+def use_compact_products():
+    """Whether the request asked for compact products (?compact=1)."""
+    return request.args.get('compact', '').lower() in ('1', 'true', 'yes')
+
+
+def product_dicts(*criteria, limit=None, limited=False, compact=False):
+    """
+    Products matching `criteria`, ordered by id, as the dicts Product.serialize()
+    (or serialize_limited() when `limited`) would build. Reads plain rows from
+    column projections instead of loading ORM objects. `compact` products carry
+    a category_id instead of the serialized category.
+    """
+    query = product_rows().where(*criteria).order_by(Product.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return build_product_dicts(db.session.execute(query).all(), limited, compact)
+
+
+def product_dicts_by_id(product_ids, limited=False, compact=False):
+    """product_dicts() for the given ids, in the order given."""
+    if not product_ids:
+        return []
+    rows = {row.id: row for row in db.session.execute(product_rows().where(Product.id.in_(product_ids)))}
+    return build_product_dicts([rows[product_id] for product_id in product_ids if product_id in rows], limited, compact)
+
+
+def product_rows():
+    return select(*PRODUCT_COLUMNS, *RATING_STATS_COLUMNS).outerjoin(
+        ProductRatingStats, ProductRatingStats.product_id == Product.id
+    )
+
+
+def build_product_dicts(rows, limited=False, compact=False):
+    if not rows:
+        return []
+    product_ids = [row.id for row in rows]
+    categories = None if compact else category_dicts({row.category_id for row in rows})
+
+    tags = defaultdict(list)
+    for product_id, tag_id, name, category_id in db.session.execute(
+        select(product_tag_association.c.product_id, Tag.id, Tag.name, Tag.category_id)
+        .join(Tag, Tag.id == product_tag_association.c.tag_id)
+        .where(product_tag_association.c.product_id.in_(product_ids))
+        .order_by(product_tag_association.c.product_id, Tag.id)
+    ):
+        tags[product_id].append({'id': tag_id, 'name': name, 'category_id': category_id})
+
+    if limited:
+        return [{
+            'id': row.id,
+            'name': row.name,
+            'tags': tags[row.id],
+            'description': row.description,
+            'image_url': row.image_url,
+            **category_field(row, categories),
+        } for row in rows]
+
+    images = defaultdict(list)
+    for image_id, product_id, image_url in db.session.execute(
+        select(ProductImage.id, ProductImage.product_id, ProductImage.image_url)
+        .where(ProductImage.product_id.in_(product_ids))
+        .order_by(ProductImage.id)
+    ):
+        images[product_id].append({'id': image_id, 'product_id': product_id, 'image_url': image_url})
+
+    return [{
+        'id': row.id,
+        'name': row.name,
+        **category_field(row, categories),
+        'price': row.price,
+        'image_url': row.image_url,
+        'description': row.description,
+        'images': images[row.id],
+        'tags': tags[row.id],
+        'sku': row.sku,
+        'stock': row.stock,
+        'rating_stats': ProductRatingStats.stats_dict(row),
+    } for row in rows]
+
+
+def category_field(row, categories):
+    if categories is None:
+        return {'category_id': row.category_id}
+    return {'category': categories[row.category_id]}
+
+
+def compact_listing(products, **fields):
+    """
+    The compact response body: `products` with category ids, and each of
+    their categories serialized once in a side-loaded map keyed by id.
+    """
+    categories = category_dicts({product['category_id'] for product in products})
+    return dict(fields, products=products, categories=side_loaded(categories))
+
+
+def side_loaded(categories):
+    # string keys, as JSON would have them
+    return {str(category_id): category for category_id, category in sorted(categories.items())}
+
+
+def init_category_cache(app):
+    app.extensions['serialized_categories'] = LRUCache(
+        app.config['CATEGORY_CACHE_SIZE'], app.config['CATEGORY_CACHE_TTL']
+    )
+
+
+def category_dicts(category_ids):
+    """
+    {id: Category.serialize()} for the given categories. Serialized categories
+    are cached per app with their catalog version (conditional.py), so a
+    category and its tags are only serialized again after they change. The
+    dicts are shared between responses and must not be modified.
+    """
+    category_ids = set(category_ids)
+    if not category_ids:
+        return {}
+    cache = current_app.extensions['serialized_categories']
+    versions = dict(db.session.execute(
+        select(CatalogVersion.category_id, CatalogVersion.version)
+        .where(CatalogVersion.key.in_([category_key(category_id) for category_id in category_ids]))
+    ).all())
+
+    categories = {}
+    for category_id in category_ids:
+        entry = cache.get(category_id)
+        if entry is not None and entry[0] == versions.get(category_id):
+            categories[category_id] = entry[1]
+
+    loaded = load_category_dicts(category_ids - categories.keys())
+    for category_id, category in loaded.items():
+        # the version was read first, so a concurrent change only makes the entry look older
+        if versions.get(category_id) is not None:
+            cache.set(category_id, (versions[category_id], category))
+    categories.update(loaded)
+    return categories
+
+
+def load_category_dicts(category_ids):
+    if not category_ids:
+        return {}
+    categories = {
+        category_id: {'id': category_id, 'name': name, 'tags': []}
+        for category_id, name in db.session.execute(
+            select(Category.id, Category.name).where(Category.id.in_(category_ids))
+        )
+    }
+    for tag_id, name, category_id in db.session.execute(
+        select(Tag.id, Tag.name, Tag.category_id).where(Tag.category_id.in_(category_ids)).order_by(Tag.id)
+    ):
+        categories[category_id]['tags'].append({'id': tag_id, 'name': name, 'category_id': category_id})
+    return categories
+
+
+def init_encoded_products(app):
+    app.extensions['encoded_products'] = LRUCache(
+        app.config['ENCODED_PRODUCTS_CACHE_SIZE'], app.config['ENCODED_PRODUCTS_CACHE_TTL']
+    )
+
+
+def encoded_products(product_ids):
+    """
+    JSON array bytes of the products' serialize() output, in the given order.
+    Each product's encoded bytes are cached per app until it changes, so a
+    listing only serializes and encodes the products it hasn't seen yet.
+    """
+    entries = encoded_entries(product_ids, compact=False)
+    return encoded_array(entries, product_ids)
+
+
+def encoded_compact_listing(product_ids, **fields):
+    """
+    compact_listing() as JSON bytes, built from the products' cached encoded
+    bytes like encoded_products().
+    """
+    entries = encoded_entries(product_ids, compact=True)
+    categories = category_dicts({category_id for category_id, body in entries.values()})
+    # keys in sorted order, as the JSON provider writes them; 'products' sorts after the rest
+    fields = dict(fields, categories=side_loaded(categories))
+    members = [encode_json(key) + b':' + encode_json(value) for key, value in sorted(fields.items())]
+    members.append(b'"products":' + encoded_array(entries, product_ids))
+    return b'{' + b','.join(members) + b'}'
+
+
+def encoded_entries(product_ids, compact):
+    """
+    {id: (category id, encoded bytes)} for the products that exist. Cached
+    bytes are reused only while the product's catalog version (and, for full
+    products, its category's) matches, so changes committed by other workers
+    are picked up too.
+    """
+    cache = current_app.extensions['encoded_products']
+    versions = entry_versions(product_ids, compact)
+    entries = {}
+    for product_id in product_ids:
+        entry = cache.get((product_id, compact))
+        if entry is not None and entry[0] == versions.get(product_id):
+            entries[product_id] = entry[1]
+    for product in product_dicts_by_id([product_id for product_id in product_ids if product_id not in entries],
+                                       compact=compact):
+        category_id = product['category_id'] if compact else product['category']['id']
+        entries[product['id']] = (category_id, encode_json(product))
+        # the versions were read first, so a concurrent change only makes the entry look older
+        if versions.get(product['id']) is not None:
+            cache.set((product['id'], compact), (versions[product['id']], entries[product['id']]))
+    return entries
+
+
+def entry_versions(product_ids, compact):
+    """
+    {id: version} for the products' encoded cache entries: the product's
+    catalog version, paired with its category's unless `compact`. Products
+    missing a version row are left out and never cached.
+    """
+    product_keys = [product_key(product_id) for product_id in product_ids]
+    if not product_keys:
+        return {}
+    criteria = CatalogVersion.key.in_(product_keys)
+    if not compact:
+        # the full product JSON embeds its category and the category's tags
+        criteria = or_(criteria, and_(
+            CatalogVersion.key.startswith('category:'),
+            CatalogVersion.category_id.in_(select(CatalogVersion.category_id).where(CatalogVersion.key.in_(product_keys))),
+        ))
+    products, categories = {}, {}
+    for key, category_id, version in db.session.execute(
+        select(CatalogVersion.key, CatalogVersion.category_id, CatalogVersion.version).where(criteria)
+    ):
+        if key.startswith('product:'):
+            products[int(key.split(':')[1])] = (category_id, version)
+        else:
+            categories[category_id] = version
+    if compact:
+        return {product_id: version for product_id, (category_id, version) in products.items()}
+    return {
+        product_id: (version, categories[category_id])
+        for product_id, (category_id, version) in products.items() if category_id in categories
+    }
+
+
+def encoded_array(entries, product_ids):
+    return b'[' + b','.join(entries[product_id][1] for product_id in product_ids if product_id in entries) + b']'
+
+
+def invalidate_encoded_products(session, product_ids):
+    """Drop the products' encoded bytes once the session commits; for changes made without the ORM."""
+    session.info.setdefault('encoded_products_changed', set()).update(product_ids)
+
+
+# Products whose serialized form changed in a flush are dropped from the cache on commit
+@event.listens_for(db.session.session_factory, 'after_flush')
+def collect_changed_products(session, flush_context):
+    changed = session.info.setdefault('encoded_products_changed', set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Product):
+            changed.add(instance.id)
+        elif isinstance(instance, (ProductImage, Rating)):
+            # ratings through the product's rating_stats
+            changed.add(instance.product_id)
+        elif isinstance(instance, (Category, Tag)):
+            # category tags are part of every product in the category
+            changed.add(ALL_PRODUCTS)
+
+
+@event.listens_for(db.session.session_factory, 'after_commit')
+def drop_changed_products(session):
+    changed = session.info.pop('encoded_products_changed', None)
+    if not changed or not has_app_context() or 'encoded_products' not in current_app.extensions:
+        return
+    cache = current_app.extensions['encoded_products']
+    if ALL_PRODUCTS in changed:
+        cache.clear()
+        return
+    for product_id in changed:
+        cache.delete((product_id, False))
+        cache.delete((product_id, True))
+
+
+@event.listens_for(db.session.session_factory, 'after_rollback')
+def forget_changed_products(session):
+    session.info.pop('encoded_products_changed', None)
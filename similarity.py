@@ -0,0 +1,164 @@
+# similarity.py
+from flask import current_app
+from sqlalchemy import event, select, insert, delete, func, and_
+from sqlalchemy.orm import aliased, object_session
+
+from config import db
+from models import Product, ProductSimilarity, product_tag_association
+
+similarities = ProductSimilarity.__table__
+DEFAULT_TOP_K = 20
+
+
+def top_k():
+    return current_app.config.get('SIMILARITY_TOP_K', DEFAULT_TOP_K)
+
+
+def scored_pairs(product_ids=None, similar_product_ids=None, exclude_product_ids=None):
+    """
+    Select (product_id, similar_product_id, score) for every pair of products
+    sharing at least one tag. The score is the Jaccard index of their tag sets.
+    """
+    a = product_tag_association.alias('a')
+    b = product_tag_association.alias('b')
+    pairs = select(
+        a.c.product_id.label('product_id'),
+        b.c.product_id.label('similar_product_id'),
+        func.count().label('shared'),
+    ).join(b, and_(a.c.tag_id == b.c.tag_id, a.c.product_id != b.c.product_id))
+    if product_ids is not None:
+        pairs = pairs.where(a.c.product_id.in_(product_ids))
+    if similar_product_ids is not None:
+        pairs = pairs.where(b.c.product_id.in_(similar_product_ids))
+    if exclude_product_ids is not None:
+        pairs = pairs.where(a.c.product_id.notin_(exclude_product_ids))
+    pairs = pairs.group_by(a.c.product_id, b.c.product_id).cte('pairs')
+
+    tag_counts = select(
+        product_tag_association.c.product_id, func.count().label('tags')
+    ).group_by(product_tag_association.c.product_id).cte('tag_counts')
+    counts_a = tag_counts.alias('counts_a')
+    counts_b = tag_counts.alias('counts_b')
+
+    score = (pairs.c.shared * 1.0 / (counts_a.c.tags + counts_b.c.tags - pairs.c.shared)).label('score')
+    return select(pairs.c.product_id, pairs.c.similar_product_id, score).join(
+        counts_a, counts_a.c.product_id == pairs.c.product_id
+    ).join(
+        counts_b, counts_b.c.product_id == pairs.c.similar_product_id
+    )
+
+
+def top_k_pairs(k, product_ids=None):
+    """scored_pairs() cut to the k best neighbors of each product."""
+    scored = scored_pairs(product_ids).subquery('scored')
+    rank = func.row_number().over(
+        partition_by=scored.c.product_id, order_by=(scored.c.score.desc(), scored.c.similar_product_id)
+    ).label('rank')
+    ranked = select(scored.c.product_id, scored.c.similar_product_id, scored.c.score, rank).subquery('ranked')
+    return select(ranked.c.product_id, ranked.c.similar_product_id, ranked.c.score).where(ranked.c.rank <= k)
+
+
+def insert_pairs(connection, pairs):
+    connection.execute(insert(similarities).from_select(['product_id', 'similar_product_id', 'score'], pairs))
+
+
+def rebuild_similarities(connection, k=None):
+    """Recompute the whole neighbor table. Returns the number of rows written."""
+    connection.execute(delete(similarities))
+    insert_pairs(connection, top_k_pairs(k or top_k()))
+    return connection.execute(select(func.count()).select_from(similarities)).scalar()
+
+
+def refresh_similarities(connection, product_ids, k=None):
+    """
+    Recompute the neighbors of products whose tags changed, and their place
+    in the neighbor lists of other products.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    k = k or top_k()
+    # lists that held a changed product may have been trimmed, so they are recomputed whole
+    stale = connection.execute(
+        select(similarities.c.product_id).distinct()
+        .where(similarities.c.similar_product_id.in_(product_ids), similarities.c.product_id.notin_(product_ids))
+    ).scalars().all()
+    connection.execute(delete(similarities).where(
+        similarities.c.product_id.in_(product_ids + stale) | similarities.c.similar_product_id.in_(product_ids)
+    ))
+    insert_pairs(connection, top_k_pairs(k, product_ids + stale))
+
+    # other products' rows pointing at the changed ones, then trim their lists back to k
+    insert_pairs(connection, scored_pairs(similar_product_ids=product_ids, exclude_product_ids=product_ids + stale))
+    neighbors = select(similarities.c.product_id).where(similarities.c.similar_product_id.in_(product_ids))
+    kept = aliased(ProductSimilarity, name='kept')
+    connection.execute(delete(similarities).where(
+        similarities.c.product_id.in_(neighbors),
+        similarities.c.similar_product_id.notin_(
+            select(kept.similar_product_id)
+            .where(kept.product_id == similarities.c.product_id)
+            .order_by(kept.score.desc(), kept.similar_product_id)
+            .limit(k)
+        )
+    ))
+
+
+def remove_similarities(connection, product_ids, k=None):
+    """
+    Drop the rows of deleted products and refill the neighbor lists they
+    were cut from.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return
+    neighbors = connection.execute(
+        select(similarities.c.product_id).distinct()
+        .where(similarities.c.similar_product_id.in_(product_ids), similarities.c.product_id.notin_(product_ids))
+    ).scalars().all()
+    connection.execute(delete(similarities).where(
+        similarities.c.product_id.in_(product_ids) | similarities.c.similar_product_id.in_(product_ids)
+    ))
+    if neighbors:
+        connection.execute(delete(similarities).where(similarities.c.product_id.in_(neighbors)))
+        insert_pairs(connection, top_k_pairs(k or top_k(), neighbors))
+
+
+def recommend_for_products(product_ids, limit):
+    """Products most similar to the given ones in aggregate, excluding them."""
+    ranked = select(
+        ProductSimilarity.similar_product_id.label('product_id'),
+        func.sum(ProductSimilarity.score).label('score'),
+    ).where(
+        ProductSimilarity.product_id.in_(product_ids),
+        ProductSimilarity.similar_product_id.notin_(product_ids),
+    ).group_by(ProductSimilarity.similar_product_id).subquery('ranked')
+
+    return Product.query_for_listing().join(ranked, ranked.c.product_id == Product.id).order_by(
+        ranked.c.score.desc(), Product.id
+    ).limit(limit).all()
+
+
+# Track products whose tags change and refresh their neighbors when the session flushes
+@event.listens_for(Product.tags, 'append')
+@event.listens_for(Product.tags, 'remove')
+@event.listens_for(Product.tags, 'bulk_replace')
+def mark_tags_changed(target, value, initiator, *args):
+    session = object_session(target) or db.session()
+    session.info.setdefault('similarity_changed', set()).add(target)
+
+
+@event.listens_for(db.session.session_factory, 'after_flush')
+def refresh_changed_products(session, flush_context):
+    changed = session.info.pop('similarity_changed', None)
+    if not changed:
+        return
+    product_ids = [product.id for product in changed if product.id is not None]
+    refresh_similarities(session.connection(), product_ids)
+
+
+# SQLite doesn't enforce the foreign keys, so deleted products' rows are removed here rather than by the cascade
+@event.listens_for(db.session.session_factory, 'after_flush')
+def remove_deleted_products(session, flush_context):
+    product_ids = [instance.id for instance in session.deleted if isinstance(instance, Product)]
+    if product_ids:
+        remove_similarities(session.connection(), product_ids)
@@ -1,8 +1,11 @@
 import unittest
 from seed import seed_db
-from flask_jwt_extended import create_access_token, create_refresh_token, JWTManager
+from flask_jwt_extended import create_access_token, create_refresh_token, JWTManager, decode_token
+from sqlalchemy import event
 from app import create_app
-from models import db, User
+from models import db, User, Category, Product
+from config import bcrypt
+from hashing import hash_rounds
 
 
 
@@ -88,6 +91,151 @@ class AuthenticateTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 204)
         self.assertIsNone(db.session.get(User, user.id))
 
+
+class TokenUserTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.admin = User(username='admin', email='admin@example.com', role='admin')
+        self.admin.set_password('password')
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.admin, self.seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.product = Product(name='Laptop', category_id=category.id, image_url='http://example.com/laptop.jpg',
+                               price=999.99, description='Laptop', sku='LAPTOP', stock=5, user_id=self.seller.id)
+        db.session.add(self.product)
+        db.session.commit()
+
+    def user_queries(self, method, url, token, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.open(url, method=method, headers={'Authorization': f'Bearer {token}'}, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, [statement for statement in statements if 'FROM users' in statement]
+
+    def test_tokens_carry_the_role(self):
+        with self.app.test_request_context():
+            from authenticate import create_tokens
+            access_token, refresh_token = create_tokens(self.admin)
+        self.assertEqual(decode_token(access_token)['role'], 'admin')
+        self.assertEqual(decode_token(refresh_token)['role'], 'admin')
+
+    def test_allow_reads_the_role_claim_and_users_are_cached_per_token(self):
+        token = create_access_token(identity=self.admin.id, additional_claims={'role': 'admin'})
+        response, queries = self.user_queries('GET', '/api/cache/stats', token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+        response, queries = self.user_queries('GET', '/api/cache/stats', token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+        token = create_access_token(identity=self.seller.id, additional_claims={'role': 'seller'})
+        self.user_queries('GET', '/api/cache/stats', token)
+        response, queries = self.user_queries('PATCH', f'/api/products/{self.product.id}', token, json={'stock': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(queries, [])
+
+    def test_tokens_without_a_role_claim_use_the_user(self):
+        token = create_access_token(identity=self.seller.id)
+        response, queries = self.user_queries('GET', '/api/cache/stats', token)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(len(queries), 1)
+
+    def test_user_changes_clear_the_cache(self):
+        token = create_access_token(identity=self.customer.id, additional_claims={'role': 'user'})
+        self.assertEqual(self.client.get('/user/me', headers={'Authorization': f'Bearer {token}'}).status_code, 200)
+        self.assertEqual(len(self.app.extensions['token_users']), 1)
+
+        response = self.client.put(f'/user/update_user/{self.customer.id}', headers={'Authorization': f'Bearer {token}'},
+                                   json={'username': 'renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.app.extensions['token_users']), 0)
+
+        self.client.delete(f'/user/delete/{self.customer.id}', headers={'Authorization': f'Bearer {token}'})
+        response = self.client.get('/user/me', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 401)
+
+class PasswordHashingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing', PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_SIZE=0,
+                              PASSWORD_HASH_WAIT_TIMEOUT=0)
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.user = User(username='customer', email='customer@example.com', role='user')
+        self.user.set_password('password')
+        db.session.add(self.user)
+        db.session.commit()
+
+    def test_passwords_are_hashed_at_the_configured_cost(self):
+        self.assertEqual(hash_rounds(self.user._password_hash), self.app.config['BCRYPT_LOG_ROUNDS'])
+        self.assertTrue(self.user.authenticate('password'))
+        self.assertFalse(self.user.authenticate('wrong'))
+        self.assertFalse(self.user.password_needs_rehash())
+
+        # a hash from before BCRYPT_LOG_ROUNDS changed still checks, and asks to be redone
+        self.user._password_hash = bcrypt.generate_password_hash('password', 5).decode('utf8')
+        self.assertTrue(self.user.authenticate('password'))
+        self.assertTrue(self.user.password_needs_rehash())
+        self.user.set_password('password')
+        self.assertFalse(self.user.password_needs_rehash())
+
+    def test_saturated_hasher_sheds_with_429(self):
+        hasher = self.app.extensions['password_hasher']
+        # the only worker slot is taken
+        hasher.slots.acquire()
+        try:
+            response = self.client.post('/user/login', json={'email': 'customer@example.com', 'password': 'password'})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers['Retry-After'], '1')
+            response = self.client.post('/user/register', json={'email': 'new@example.com', 'password': 'password',
+                                                                'username': 'new'})
+            self.assertEqual(response.status_code, 429)
+        finally:
+            hasher.slots.release()
+        self.assertIsNone(User.query.filter_by(username='new').first())
+        self.assertEqual(hasher.get_stats()['rejected'], 2)
+        self.assertTrue(self.user.authenticate('password'))
+
 if __name__ == '__main__':
     unittest.main()
 
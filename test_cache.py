@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from threading import Thread
+from unittest import mock
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, User, Product, Category, Rating
+from cache import LRUCache, SqliteCacheBackend, CacheStore, response_cache
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(max_size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.evictions, 1)
+
+    def test_expires_entries(self):
+        cache = LRUCache(max_size=2, ttl=-1)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+class CacheStoreTestCase(unittest.TestCase):
+
+    def test_shared_backend_closes_its_connections(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        for suffix in ('', '-wal', '-shm'):
+            self.addCleanup(lambda name=path + suffix: os.path.exists(name) and os.remove(name))
+        connections = []
+        sqlite_connect = sqlite3.connect
+
+        def connect(*args, **kwargs):
+            connections.append(sqlite_connect(*args, **kwargs))
+            return connections[-1]
+
+        with mock.patch('cache.sqlite3.connect', side_effect=connect):
+            store = CacheStore(max_size=10, ttl=60, shared=SqliteCacheBackend(path))
+            store.set('a', 1, {'products': 0})
+            store.local.delete('a')
+            self.assertEqual(store.get('a'), 1)
+            store.invalidate(['products'])
+        self.assertTrue(connections)
+        for connection in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                connection.execute('SELECT 1')
+
+    def test_stats_count_every_thread(self):
+        store = CacheStore(max_size=10, ttl=60)
+
+        def read():
+            for _ in range(1000):
+                store.get('missing')
+
+        threads = [Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(store.get_stats()['misses'], 8000)
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.admin = User(username='admin', email='admin@example.com', role='admin')
+        db.session.add(self.admin)
+        self.category = Category(name='Electronics')
+        db.session.add(self.category)
+        db.session.flush()
+        self.laptop = Product(name='Laptop', category_id=self.category.id, image_url='http://example.com/laptop.jpg',
+                              price=999.99, description='Laptop', sku='LAPTOP', stock=5, user_id=self.admin.id)
+        self.tv = Product(name='Smart TV', category_id=self.category.id, image_url='http://example.com/tv.jpg',
+                          price=599.99, description='TV', sku='TV', stock=5, user_id=self.admin.id)
+        db.session.add_all([self.laptop, self.tv])
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.admin.id)}'}
+
+    def test_repeated_reads_are_served_from_cache(self):
+        self.assertEqual(self.client.get('/api/products').headers['X-Cache'], 'MISS')
+        response = self.client.get('/api/products')
+        self.assertEqual(response.headers['X-Cache'], 'HIT')
+        self.assertEqual(len(response.json), 2)
+        # a different query string is a different entry
+        self.assertEqual(self.client.get('/api/products?limit=1').headers['X-Cache'], 'MISS')
+
+        stats = self.client.get('/api/cache/stats', headers=self.headers).json
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 2)
+
+    def test_product_update_invalidates_only_affected_entries(self):
+        for url in ['/api/products', f'/api/products/{self.laptop.id}', f'/api/products/{self.tv.id}',
+                    '/api/products/category/Electronics']:
+            self.client.get(url)
+
+        response = self.client.patch(f'/api/products/{self.laptop.id}', headers=self.headers, json={'name': 'Gaming Laptop'})
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get(f'/api/products/{self.laptop.id}')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(response.json['name'], 'Gaming Laptop')
+        self.assertEqual(self.client.get('/api/products').headers['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/api/products/category/Electronics').headers['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(f'/api/products/{self.tv.id}').headers['X-Cache'], 'HIT')
+
+    def test_rating_write_invalidates_product_and_ratings(self):
+        self.client.get(f'/api/products/{self.laptop.id}')
+        self.client.get('/api/ratings')
+        response = self.client.post('/api/ratings', json={
+            'product_id': self.laptop.id, 'user_id': self.admin.id, 'rating': 5, 'comment': 'Great'
+        })
+        self.assertEqual(response.status_code, 201)
+
+        response = self.client.get(f'/api/products/{self.laptop.id}')
+        self.assertEqual(response.headers['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json['ratings']), 1)
+        self.assertEqual(len(self.client.get('/api/ratings').json), 1)
+
+    def test_shared_backend_invalidates_across_apps(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        try:
+            self.app.config['CACHE_SHARED_PATH'] = path
+            response_cache.init_app(self.app)
+            other_app = create_app('testing')
+            other_app.config['CACHE_SHARED_PATH'] = path
+            response_cache.init_app(other_app)
+            other_client = other_app.test_client()
+
+            self.assertEqual(self.client.get(f'/api/products/{self.tv.id}').headers['X-Cache'], 'MISS')
+            # the other worker finds the entry in the shared backend
+            self.assertEqual(other_client.get(f'/api/products/{self.tv.id}').headers['X-Cache'], 'HIT')
+
+            self.client.patch(f'/api/products/{self.tv.id}', headers=self.headers, json={'price': 499.99})
+            response = other_client.get(f'/api/products/{self.tv.id}')
+            self.assertEqual(response.headers['X-Cache'], 'MISS')
+            self.assertEqual(response.json['price'], 499.99)
+        finally:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+if __name__ == '__main__':
+    unittest.main()
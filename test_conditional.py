@@ -0,0 +1,125 @@
+import unittest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Product, Category, Tag
+
+
+class ConditionalGetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.admin = User(username='admin', email='admin@example.com', role='admin')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.admin, self.customer])
+        self.electronics = Category(name='Electronics')
+        self.books = Category(name='Books')
+        db.session.add_all([self.electronics, self.books])
+        db.session.flush()
+        self.tag = Tag(name='gadgets', category_id=self.electronics.id)
+        db.session.add(self.tag)
+        self.laptop = Product(name='Laptop', category_id=self.electronics.id, image_url='http://example.com/laptop.jpg',
+                              price=999.99, description='Laptop', sku='LAPTOP', stock=5, user_id=self.admin.id)
+        self.novel = Product(name='Novel', category_id=self.books.id, image_url='http://example.com/novel.jpg',
+                             price=9.99, description='Novel', sku='NOVEL', stock=5, user_id=self.admin.id)
+        db.session.add_all([self.laptop, self.novel])
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.admin.id)}'}
+
+    def etag(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.last_modified)
+        return response.headers['ETag']
+
+    def test_matching_etag_gets_304_without_running_the_view(self):
+        etag = self.etag('/api/products')
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get('/api/products', headers={'If-None-Match': etag})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+        # only the validator query
+        self.assertEqual(len(statements), 1)
+
+    def test_if_modified_since(self):
+        response = self.client.get(f'/api/products/{self.laptop.id}')
+        response = self.client.get(f'/api/products/{self.laptop.id}',
+                                   headers={'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_product_update_changes_etags(self):
+        listing = self.etag('/api/products')
+        laptop = self.etag(f'/api/products/{self.laptop.id}')
+        novel = self.etag(f'/api/products/{self.novel.id}')
+        books = self.etag('/api/products/category/Books')
+
+        response = self.client.patch(f'/api/products/{self.laptop.id}', headers=self.headers, json={'price': 899.99})
+        self.assertEqual(response.status_code, 200)
+
+        self.assertNotEqual(self.etag('/api/products'), listing)
+        self.assertNotEqual(self.etag(f'/api/products/{self.laptop.id}'), laptop)
+        self.assertEqual(self.etag(f'/api/products/{self.novel.id}'), novel)
+        self.assertEqual(self.etag('/api/products/category/Books'), books)
+
+    def test_rating_changes_product_etag(self):
+        laptop = self.etag(f'/api/products/{self.laptop.id}')
+        response = self.client.post('/api/ratings', json={
+            'product_id': self.laptop.id, 'user_id': self.customer.id, 'rating': 5, 'comment': 'Great'
+        })
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get(f'/api/products/{self.laptop.id}', headers={'If-None-Match': laptop})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json['ratings']), 1)
+
+    def test_tag_change_changes_category_etag(self):
+        electronics = self.etag('/api/products/category/Electronics')
+        books = self.etag('/api/products/category/Books')
+        laptop = self.etag(f'/api/products/{self.laptop.id}')
+
+        self.tag.name = 'devices'
+        db.session.commit()
+
+        self.assertNotEqual(self.etag('/api/products/category/Electronics'), electronics)
+        self.assertNotEqual(self.etag(f'/api/products/{self.laptop.id}'), laptop)
+        self.assertEqual(self.etag('/api/products/category/Books'), books)
+
+    def test_stock_reservation_changes_etag(self):
+        laptop = self.etag(f'/api/products/{self.laptop.id}')
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.post('/api/cart', headers=headers,
+                                    json={'order_items': [{'product_id': self.laptop.id, 'quantity': 1}]})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotEqual(self.etag(f'/api/products/{self.laptop.id}'), laptop)
+
+    def test_missing_product_has_no_validators(self):
+        response = self.client.get('/api/products/999')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response.headers)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import shutil
+import tempfile
+import unittest
+from flask import g
+from sqlalchemy import text
+from app import create_app
+from config import db, ProductionConfig
+from database import engine_options
+from models import User, Category, Product
+
+
+class EngineConfigTestCase(unittest.TestCase):
+
+    def config(self, **overrides):
+        config = {key: getattr(ProductionConfig, key) for key in dir(ProductionConfig) if key.isupper()}
+        config.update(overrides)
+        return config
+
+    def test_pool_options_come_from_config(self):
+        options = engine_options(self.config(SQLALCHEMY_DATABASE_URI='postgresql://localhost/shop'))
+        self.assertEqual(options, {'pool_size': 10, 'max_overflow': 20, 'pool_pre_ping': True, 'pool_recycle': 1800})
+
+    def test_memory_sqlite_skips_pool_sizing(self):
+        options = engine_options(self.config(SQLALCHEMY_DATABASE_URI='sqlite://'))
+        self.assertNotIn('pool_size', options)
+        self.assertNotIn('max_overflow', options)
+
+    def test_explicit_engine_options_win(self):
+        options = engine_options(self.config(SQLALCHEMY_DATABASE_URI='postgresql://localhost/shop',
+                                             SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2}))
+        self.assertEqual(options['pool_size'], 2)
+
+    def test_sqlite_connections_get_pragmas(self):
+        app = create_app('testing')
+        with app.app_context():
+            pragma = lambda name: db.session.execute(text(f'PRAGMA {name}')).scalar()
+            self.assertEqual(pragma('journal_mode'), 'wal')
+            self.assertEqual(pragma('synchronous'), 1)  # NORMAL
+            self.assertEqual(pragma('cache_size'), app.config['SQLITE_CACHE_SIZE'])
+            db.session.remove()
+
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.app = create_app(
+            'testing',
+            SQLALCHEMY_DATABASE_URI=f'sqlite:///{self.directory}/primary.db',
+            DB_REPLICA_URLS=[f'sqlite:///{self.directory}/replica.db'],
+            DB_REPLICA_LAG=0,
+            CACHE_ENABLED=False,
+        )
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        db.metadata.create_all(db.engines['replica_0'])
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def populate_db(self):
+        # the same rows on both sides except for the product name, to tell them apart
+        for engine, name in [(db.engines[None], 'Laptop'), (db.engines['replica_0'], 'Replica Laptop')]:
+            with engine.begin() as connection:
+                connection.execute(User.__table__.insert().values(id=1, username='seller', email='seller@example.com', role='seller'))
+                connection.execute(Category.__table__.insert().values(id=1, name='Electronics'))
+                connection.execute(Product.__table__.insert().values(
+                    id=1, name=name, category_id=1, image_url='http://example.com/laptop.jpg', price=999.99,
+                    description='Laptop', sku='LAPTOP', stock=5, user_id=1
+                ))
+
+    def test_marked_reads_go_to_replica(self):
+        self.assertEqual(self.client.get('/api/products/1').json['name'], 'Replica Laptop')
+        self.assertEqual(self.client.get('/api/products').json[0]['name'], 'Replica Laptop')
+
+    def test_writes_go_to_primary(self):
+        response = self.client.post('/api/ratings', json={'product_id': 1, 'user_id': 1, 'rating': 5, 'comment': 'Great'})
+        self.assertEqual(response.status_code, 201)
+        with db.engines[None].connect() as connection:
+            self.assertEqual(connection.execute(text('SELECT COUNT(*) FROM ratings')).scalar(), 1)
+        with db.engines['replica_0'].connect() as connection:
+            self.assertEqual(connection.execute(text('SELECT COUNT(*) FROM ratings')).scalar(), 0)
+
+    def test_reads_after_a_write_in_the_session_go_to_primary(self):
+        with self.app.test_request_context('/api/products'):
+            g.replica_reads = True
+            self.assertEqual(db.session.get(Product, 1).name, 'Replica Laptop')
+            db.session.expunge_all()
+            db.session.add(Category(name='Books'))
+            db.session.flush()
+            self.assertEqual(db.session.get(Product, 1).name, 'Laptop')
+            db.session.rollback()
+
+    def test_reads_within_replica_lag_go_to_primary(self):
+        self.app.config['DB_REPLICA_LAG'] = 60
+        self.client.post('/api/ratings', json={'product_id': 1, 'user_id': 1, 'rating': 5, 'comment': 'Great'})
+        db.session.remove()
+        self.assertEqual(self.client.get('/api/products/1').json['name'], 'Laptop')
+
+    def test_writes_in_other_workers_hold_reads_on_primary(self):
+        settings = dict(
+            SQLALCHEMY_DATABASE_URI=f'sqlite:///{self.directory}/primary.db',
+            DB_REPLICA_URLS=[f'sqlite:///{self.directory}/replica.db'],
+            DB_REPLICA_LAG=60,
+            CACHE_SHARED_PATH=f'{self.directory}/cache.db',
+        )
+        writer, reader = create_app('testing', **settings), create_app('testing', **settings)
+        reader.config['CACHE_ENABLED'] = False
+        self.assertEqual(reader.test_client().get('/api/products/1').json['name'], 'Replica Laptop')
+
+        response = writer.test_client().post('/api/ratings', json={'product_id': 1, 'user_id': 1, 'rating': 5})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(reader.test_client().get('/api/products/1').json['name'], 'Laptop')
+
+    def test_replica_binds_stay_out_of_create_all(self):
+        self.assertIn('replica_0', db.metadatas)
+        other = create_app('testing', SQLALCHEMY_DATABASE_URI=f'sqlite:///{self.directory}/other.db')
+        with other.app_context():
+            db.create_all()
+            self.assertIn('products', db.inspect(db.engine).get_table_names())
+            db.drop_all()
+
+if __name__ == '__main__':
+    unittest.main()
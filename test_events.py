@@ -0,0 +1,122 @@
+import unittest
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Product, Category, ViewingHistory, SearchQuery, Engagement, RecommendationCandidate
+
+
+class EventIngestionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+        self.events = self.app.extensions['events']
+
+    def tearDown(self):
+        self.events.stop(timeout=5)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.admin = User(username='admin', email='admin@example.com', role='admin')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.admin, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.products = [
+            Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                    description=name, sku=name.upper(), stock=5, user_id=self.admin.id)
+            for name in ['Laptop', 'Smart TV', 'Headphones']
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+
+    def post_events(self, events):
+        return self.client.post('/api/events', headers=self.headers, json={'events': events})
+
+    def test_events_are_written_in_batches(self):
+        laptop, tv = self.products[0].id, self.products[1].id
+        response = self.post_events(
+            [{'type': 'view', 'product_id': laptop}] * 3
+            + [{'type': 'engagement', 'product_id': tv, 'watch_time': 120},
+               {'type': 'search', 'query': 'Headphones'}]
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json['accepted'], 5)
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, executemany))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            self.events.stop(timeout=5)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        self.assertEqual(ViewingHistory.query.filter_by(user_id=self.customer.id).count(), 3)
+        self.assertEqual(Engagement.query.one().watch_time, 120)
+        self.assertEqual(SearchQuery.query.one().search_query, 'Headphones')
+        self.assertIsNotNone(ViewingHistory.query.first().viewed_at)
+        inserts = [executemany for statement, executemany in statements if statement.startswith('INSERT INTO viewing_history')]
+        self.assertEqual(inserts, [True])
+
+        # Core inserts don't fire the ORM hooks, so the candidates are fed directly
+        scores = {candidate.product_id: candidate.score for candidate in RecommendationCandidate.query.all()}
+        self.assertEqual(set(scores), {laptop, tv, self.products[2].id})
+        self.assertGreater(scores[laptop], scores[self.products[2].id])
+
+        stats = self.events.get_stats()
+        self.assertEqual(stats['written'], 5)
+        self.assertEqual(stats['depth'], 0)
+
+    def test_full_queue_drops_events_with_429(self):
+        self.events.stop(timeout=5)
+        self.events.queue.maxsize = 2
+        # keep the flusher from draining the queue
+        self.events.start = lambda: None
+        response = self.post_events([{'type': 'view', 'product_id': self.products[0].id}] * 3)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json, {'accepted': 2, 'dropped': 1})
+        self.assertIn('Retry-After', response.headers)
+        self.assertEqual(self.events.get_stats()['dropped'], 1)
+
+        self.events.flush()
+        self.assertEqual(ViewingHistory.query.count(), 2)
+
+    def test_events_for_missing_products_are_skipped(self):
+        response = self.post_events([{'type': 'view', 'product_id': 9999},
+                                     {'type': 'view', 'product_id': self.products[0].id}])
+        self.assertEqual(response.status_code, 202)
+        self.events.stop(timeout=5)
+        self.assertEqual(ViewingHistory.query.count(), 1)
+        self.assertEqual(self.events.get_stats()['invalid'], 1)
+
+    def test_invalid_events_are_rejected(self):
+        for events in ([{'type': 'click', 'product_id': 1}], [{'type': 'view'}],
+                       [{'type': 'search', 'query': ''}], {'type': 'view'}):
+            with self.subTest(events=events):
+                self.assertEqual(self.post_events(events).status_code, 422)
+        self.assertEqual(self.client.post('/api/events', json={'events': []}).status_code, 401)
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.client.get('/api/events/stats', headers=self.headers).status_code, 403)
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.admin.id)}'}
+        response = self.client.get('/api/events/stats', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['capacity'], self.app.config['EVENTS_QUEUE_SIZE'])
+
+if __name__ == '__main__':
+    unittest.main()
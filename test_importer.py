@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Product, Category, Tag, ProductImage, Rating, Discount
+from importer import read_records, import_catalog
+
+
+def product_record(n, category='laptops', **fields):
+    return dict({
+        'title': f'Product {n}',
+        'description': f'Imported product {n}',
+        'price': 10.0 + n,
+        'stock': 5,
+        'category': category,
+        'thumbnail': f'http://example.com/{n}.jpg',
+        'sku': f'IMPORT-{n}',
+        'images': [f'http://example.com/{n}-1.jpg', f'http://example.com/{n}-2.jpg'],
+        'tags': [category, 'portable', f'series-{n % 2}'],
+        'reviews': [{'rating': 5, 'comment': 'Great', 'reviewerEmail': 'customer@example.com'},
+                    {'rating': 3, 'comment': 'Fine', 'reviewerEmail': 'someone@example.com'}],
+        'discountPercentage': 12.5,
+    }, **fields)
+
+
+class CatalogImportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        category = Category(name='laptops')
+        db.session.add(category)
+        db.session.flush()
+        self.portable = Tag(name='portable', category_id=category.id)
+        db.session.add(self.portable)
+        db.session.add(Product(name='Existing', category_id=category.id, image_url='http://example.com/e.jpg',
+                               price=1.0, description='Existing', sku='IMPORT-0', stock=1, user_id=self.seller.id))
+        db.session.commit()
+
+    def write_file(self, content):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(fd, 'w') as output:
+            output.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
+    def test_read_records_streams_arrays_and_json_lines(self):
+        records = [product_record(n) for n in range(5)]
+        for content in (json.dumps(records, indent=2), '\n'.join(json.dumps(record) for record in records) + '\n'):
+            with self.subTest(content=content[:10]):
+                # chunks much smaller than a record
+                self.assertEqual(list(read_records(self.write_file(content), chunk_size=7)), records)
+        self.assertEqual(list(read_records(self.write_file('[]'))), [])
+        with self.assertRaises(ValueError):
+            list(read_records(self.write_file('[{"sku": "A"}, {"sku": ')))
+
+    def test_import_catalog(self):
+        records = [product_record(n) for n in range(6)] + [product_record(6, category='phones')]
+        counts = import_catalog(records, self.seller.id, batch_size=4)
+        self.assertEqual(counts['products'], 6)
+        self.assertEqual(counts['existing'], 1)
+        self.assertEqual(counts['categories'], 1)
+        self.assertEqual(counts['tags'], 2)
+        self.assertEqual(counts['skipped_reviews'], 6)
+
+        product = Product.query.filter_by(sku='IMPORT-6').one()
+        self.assertEqual(product.category.name, 'phones')
+        self.assertEqual(product.user_id, self.seller.id)
+        self.assertEqual(len(product.images), 2)
+        # tags are shared by name, and the category's own name is not a tag
+        self.assertEqual(sorted(tag.name for tag in product.tags), ['portable', 'series-0'])
+        self.assertIn(self.portable, product.tags)
+        self.assertEqual(Tag.query.filter_by(name='portable').count(), 1)
+        self.assertEqual([(rating.user_id, rating.rating) for rating in Rating.query.filter_by(product_id=product.id)],
+                         [(self.customer.id, 5)])
+        self.assertEqual(Discount.query.filter_by(product_id=product.id).one().discount_percentage, 12.5)
+        self.assertEqual(ProductImage.query.count(), 12)
+
+        response = self.client.get('/api/search?q=Imported')
+        self.assertEqual(len(response.json['results']), 6)
+
+    def test_import_without_returning(self):
+        records = [product_record(n) for n in range(1, 4)]
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        # e.g. SQLite before 3.35
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            with mock.patch.object(db.engine.dialect, 'insert_returning', False):
+                counts = import_catalog(records, self.seller.id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertFalse([statement for statement in statements if 'RETURNING' in statement])
+        self.assertEqual(counts['products'], 3)
+        for record in records:
+            product = Product.query.filter_by(sku=record['sku']).one()
+            self.assertEqual(product.name, record['title'])
+            self.assertEqual(len(product.images), 2)
+            self.assertEqual([rating.rating for rating in product.ratings], [5])
+
+    def test_import_changes_catalog_validators(self):
+        etag = self.client.get('/api/products/category/laptops').headers['ETag']
+        import_catalog([product_record(1)], self.seller.id)
+        response = self.client.get('/api/products/category/laptops', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 2)
+        self.assertIn('series-1', [tag['name'] for tag in response.json[0]['category']['tags']])
+
+    def test_queries_per_batch_do_not_grow_with_products(self):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        def count(records):
+            statements.clear()
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                import_catalog(records, self.seller.id, batch_size=len(records), reviewer_id=self.customer.id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+            return len(statements)
+
+        # the first batch creates the tags
+        count([product_record(n) for n in range(1, 3)])
+        self.assertEqual(count([product_record(n) for n in range(10, 12)]),
+                         count([product_record(n) for n in range(20, 60)]))
+
+if __name__ == '__main__':
+    unittest.main()
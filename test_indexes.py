@@ -0,0 +1,135 @@
+import re
+import unittest
+from datetime import datetime
+from flask_jwt_extended import create_access_token
+from sqlalchemy import event, text
+from app import create_app
+from models import (db, User, Product, Category, Order, OrderItem, Rating, Discount,
+                    ViewingHistory, SearchQuery, Engagement, wishlist_table)
+from recommendations import refresh_candidates
+
+# tables that grow with traffic; a plain SCAN of one of them means a missing index
+BIG_TABLES = {
+    'orders', 'order_items', 'products', 'ratings', 'discounts',
+    'viewing_history', 'engagement', 'search_query', 'wishlist_table', 'product_tag_association',
+}
+
+
+class IndexUsageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+        self.app.config['CACHE_ENABLED'] = False
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        self.category = Category(name='Electronics')
+        db.session.add(self.category)
+        db.session.flush()
+        self.laptop = Product(name='Laptop', category_id=self.category.id, image_url='http://example.com/laptop.jpg',
+                              price=999.99, description='Laptop', sku='LAPTOP', stock=5, user_id=self.seller.id)
+        db.session.add(self.laptop)
+        db.session.flush()
+        order = Order(user_id=self.customer.id, total_price=999.99, status='completed')
+        db.session.add(order)
+        db.session.flush()
+        db.session.add_all([
+            OrderItem(order_id=order.id, product_id=self.laptop.id, quantity=1, price=999.99),
+            Rating(product_id=self.laptop.id, user_id=self.customer.id, rating=5, comment='Great'),
+            Discount(product_id=self.laptop.id, discount_percentage=10.0,
+                     start_date=datetime(2024, 1, 1), end_date=datetime(2024, 2, 1)),
+            ViewingHistory(user_id=self.customer.id, product_id=self.laptop.id),
+            Engagement(user_id=self.customer.id, product_id=self.laptop.id, watch_time=30),
+            SearchQuery(user_id=self.customer.id, search_query='laptop'),
+        ])
+        db.session.execute(wishlist_table.insert().values(user_id=self.customer.id, product_id=self.laptop.id))
+        db.session.commit()
+
+    def capture_selects(self, fn):
+        statements = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith(('SELECT', 'WITH')) and not executemany:
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', capture)
+        try:
+            fn()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', capture)
+        return statements
+
+    def full_scans(self, statements):
+        scans = []
+        connection = db.session.connection().connection.dbapi_connection
+        for statement, parameters in statements:
+            # substring matches on product names can't use a b-tree index
+            if ' LIKE ' in statement:
+                continue
+            for row in connection.execute('EXPLAIN QUERY PLAN ' + statement, parameters):
+                match = re.match(r'SCAN (\w+)( AS \w+)?$', row[3])
+                if not match or match.group(1) not in BIG_TABLES:
+                    continue
+                # walking the primary key under a LIMIT stops after the rows it returns
+                if f'ORDER BY {match.group(1)}.id' in statement and 'LIMIT' in statement:
+                    continue
+                scans.append((match.group(1), statement))
+        return scans
+
+    def test_routes_use_indexes(self):
+        customer = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        seller = {'Authorization': f'Bearer {create_access_token(identity=self.seller.id)}'}
+        requests = [
+            ('/api/cart', customer),
+            ('/api/orders', customer),
+            (f'/api/products/{self.laptop.id}', None),
+            ('/api/products/category/Electronics', None),
+            (f'/api/seller/{self.seller.id}/products', seller),
+            (f'/api/seller/{self.seller.id}/products?status=pending', seller),
+            (f'/api/seller/{self.seller.id}/orders', seller),
+            (f'/api/seller/{self.seller.id}/orders?limit=10', seller),
+            (f'/api/discounts/{self.laptop.id}', None),
+            ('/api/wishlist', customer),
+            ('/api/wishlist/recommendations', customer),
+            ('/api/recommended_products', customer),
+        ]
+        for url, headers in requests:
+            with self.subTest(url=url):
+                statements = self.capture_selects(lambda: self.assertEqual(
+                    self.client.get(url, headers=headers).status_code, 200
+                ))
+                self.assertTrue(statements)
+                self.assertEqual(self.full_scans(statements), [])
+
+    def test_history_queries_use_indexes(self):
+        statements = self.capture_selects(lambda: refresh_candidates([self.customer.id]))
+        self.assertEqual(self.full_scans(statements), [])
+
+    def test_indexes_exist(self):
+        indexes = {
+            row[0] for row in db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))
+        }
+        for name in ['ix_orders_user_id_status', 'ix_order_items_order_id_product_id', 'ix_products_category_id',
+                     'ix_products_user_id', 'ix_ratings_product_id', 'ix_discounts_product_id',
+                     'ix_viewing_history_user_id_viewed_at', 'ix_engagement_user_id_engaged_at',
+                     'ix_search_query_user_id_searched_at']:
+            self.assertIn(name, indexes)
+
+if __name__ == '__main__':
+    unittest.main()
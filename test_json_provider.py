@@ -0,0 +1,32 @@
+import unittest
+from datetime import datetime, date
+from decimal import Decimal
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from json_provider import OrjsonProvider
+
+
+class OrjsonProviderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.default = DefaultJSONProvider(self.app)
+        self.provider = OrjsonProvider(self.app)
+
+    def test_matches_default_provider(self):
+        data = {
+            'name': 'Laptop', 'price': 999.99, 'stock': 5, 'description': None,
+            'created_at': datetime(2024, 5, 1, 12, 30), 'released': date(2024, 5, 1),
+            'discount': Decimal('10.5'), 'tags': [{'id': 2, 'name': 'b'}, {'id': 1, 'name': 'a'}],
+        }
+        self.assertEqual(self.provider.loads(self.provider.dumps(data)), self.default.loads(self.default.dumps(data)))
+        self.assertEqual(self.provider.dumps(data), self.default.dumps(data, separators=(',', ':')))
+
+    def test_response_is_indented_in_debug(self):
+        self.app.debug = True
+        with self.app.app_context():
+            self.assertEqual(self.provider.response({'b': 1, 'a': [1]}).get_data(),
+                             self.default.response({'b': 1, 'a': [1]}).get_data())
+
+if __name__ == '__main__':
+    unittest.main()
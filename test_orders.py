@@ -1,7 +1,12 @@
 import unittest
+from unittest import mock
 from flask_jwt_extended import create_access_token, JWTManager
 from app import create_app
-from models import db,  User, Product, Order, OrderItem
+from datetime import datetime
+from models import db,  User, Product, Order, OrderItem, Category, ProductSalesSummary
+from sales import rebuild_sales_summary
+from sqlalchemy import update
+import orders
 
 class OrdersTestCase(unittest.TestCase):
 
@@ -149,5 +154,188 @@ class OrdersTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json), 2)
 
+class OrderQueriesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.other_seller = User(username='other', email='other@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.other_seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.laptop = Product(name='Laptop', category_id=category.id, image_url='http://example.com/laptop.jpg',
+                              price=1000.0, description='Laptop', sku='LAPTOP', stock=50, user_id=self.seller.id)
+        self.tv = Product(name='Smart TV', category_id=category.id, image_url='http://example.com/tv.jpg',
+                          price=500.0, description='TV', sku='TV', stock=30, user_id=self.seller.id)
+        self.radio = Product(name='Radio', category_id=category.id, image_url='http://example.com/radio.jpg',
+                             price=50.0, description='Radio', sku='RADIO', stock=30, user_id=self.other_seller.id)
+        db.session.add_all([self.laptop, self.tv, self.radio])
+        db.session.flush()
+
+        self.orders = []
+        for status, created_at, items in [
+            ('completed', datetime(2024, 1, 10), [(self.laptop, 1), (self.tv, 2)]),
+            ('completed', datetime(2024, 2, 10), [(self.laptop, 2), (self.radio, 1)]),
+            ('pending', datetime(2024, 3, 10), [(self.tv, 1)]),
+        ]:
+            order = Order(user_id=self.customer.id, status=status, created_at=created_at,
+                          total_price=sum(product.price * quantity for product, quantity in items))
+            order.order_items = [OrderItem(product_id=product.id, quantity=quantity, price=product.price)
+                                 for product, quantity in items]
+            db.session.add(order)
+            self.orders.append(order)
+        db.session.commit()
+
+    def get_sales(self, query=''):
+        response = self.client.get(f'/api/seller/{self.seller.id}/products{query}')
+        self.assertEqual(response.status_code, 200)
+        return {product['name']: (product['total_sales'], product['total_quantity']) for product in response.json}
+
+    def test_sales_totals(self):
+        self.assertEqual(self.get_sales(), {'Laptop': (3000.0, 3), 'Smart TV': (1500.0, 3)})
+
+    def test_sales_filters(self):
+        self.assertEqual(self.get_sales('?status=pending'), {'Laptop': (0, 0), 'Smart TV': (500.0, 1)})
+        self.assertEqual(self.get_sales('?start_date=2024-02-01&end_date=2024-03-01'), {'Laptop': (2000.0, 2), 'Smart TV': (0, 0)})
+        response = self.client.get(f'/api/seller/{self.seller.id}/products?start_date=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_completed_sales_summary_is_maintained(self):
+        rebuild_sales_summary(db.session.connection())
+        db.session.commit()
+        self.assertEqual(self.get_sales('?status=completed'), {'Laptop': (3000.0, 3), 'Smart TV': (1000.0, 2)})
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.post(f'/api/complete_order/{self.orders[2].id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_sales('?status=completed'), {'Laptop': (3000.0, 3), 'Smart TV': (1500.0, 3)})
+        self.assertEqual(db.session.get(ProductSalesSummary, self.tv.id).order_count, 2)
+
+    def test_seller_orders_are_distinct_and_paginated(self):
+        response = self.client.get(f'/api/seller/{self.seller.id}/orders?limit=2')
+        self.assertEqual(response.status_code, 200)
+        first_page = [order['id'] for order in response.json['orders']]
+        self.assertEqual(first_page, [self.orders[0].id, self.orders[1].id])
+        self.assertEqual(len(response.json['orders'][0]['order_items']), 2)
+
+        cursor = response.json['next_cursor']
+        response = self.client.get(f'/api/seller/{self.seller.id}/orders?limit=2&after={cursor}')
+        self.assertEqual([order['id'] for order in response.json['orders']], [self.orders[2].id])
+        self.assertIsNone(response.json['next_cursor'])
+
+        response = self.client.get(f'/api/seller/{self.seller.id}/orders?status=pending&limit=10')
+        self.assertEqual([order['id'] for order in response.json['orders']], [self.orders[2].id])
+
+    def test_seller_orders_without_paging_are_a_list(self):
+        response = self.client.get(f'/api/seller/{self.seller.id}/orders')
+        self.assertEqual([order['id'] for order in response.json], [order.id for order in self.orders])
+        response = self.client.get(f'/api/seller/{self.seller.id}/orders?status=pending')
+        self.assertEqual([order['id'] for order in response.json], [self.orders[2].id])
+        response = self.client.get(f'/api/seller/{self.other_seller.id}/orders')
+        self.assertEqual([order['id'] for order in response.json], [self.orders[1].id])
+
+    def test_add_to_cart_merges_items_and_reserves_stock(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+            {'product_id': self.laptop.id, 'quantity': 2},
+            {'product_id': self.tv.id, 'quantity': 1},
+            {'product_id': self.laptop.id, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+            {'product_id': self.laptop.id, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 201)
+
+        items = {item['product_id']: item['quantity'] for item in response.json['order_items']}
+        self.assertEqual(items, {self.laptop.id: 4, self.tv.id: 1})
+        self.assertEqual(response.json['total_price'], 4500.0)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, self.laptop.id).stock, 46)
+        self.assertEqual(db.session.get(Product, self.tv.id).stock, 29)
+
+        response = self.client.delete(f'/api/cart/{self.laptop.id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, self.laptop.id).stock, 50)
+
+    def test_cart_writes_invalidate_cached_listings(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        urls = ['/api/products', f'/api/products/{self.laptop.id}', '/api/products/category/Electronics']
+
+        def laptop_stock():
+            stocks = []
+            for url in urls:
+                response = self.client.get(url)
+                products = response.json if isinstance(response.json, list) else [response.json]
+                stocks.append(next(product['stock'] for product in products if product['id'] == self.laptop.id))
+            return stocks
+
+        self.assertEqual(laptop_stock(), [50, 50, 50])
+        response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+            {'product_id': self.laptop.id, 'quantity': 2},
+        ]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(laptop_stock(), [48, 48, 48])
+
+        response = self.client.delete(f'/api/cart/{self.laptop.id}', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(laptop_stock(), [50, 50, 50])
+
+    def test_add_to_cart_is_all_or_nothing(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+            {'product_id': self.laptop.id, 'quantity': 1},
+            {'product_id': self.tv.id, 'quantity': 31},
+        ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json['product_ids'], [self.tv.id])
+
+        response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+            {'product_id': self.laptop.id, 'quantity': 1},
+            {'product_id': 999, 'quantity': 1},
+        ]})
+        self.assertEqual(response.status_code, 404)
+
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Product, self.laptop.id).stock, 50)
+        self.assertIsNone(Order.query.filter_by(user_id=self.customer.id, status='cart').first())
+
+    def test_add_to_cart_reports_stock_sold_meanwhile(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        reserve_stock = orders.reserve_stock
+
+        def sell_out_first(quantities):
+            # another request buys every laptop after this one loaded the products
+            db.session.execute(update(Product).where(Product.id == self.laptop.id).values(stock=0))
+            db.session.commit()
+            return reserve_stock(quantities)
+
+        with mock.patch('orders.reserve_stock', side_effect=sell_out_first):
+            response = self.client.post('/api/cart', headers=headers, json={'order_items': [
+                {'product_id': self.laptop.id, 'quantity': 1},
+                {'product_id': self.tv.id, 'quantity': 1},
+            ]})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json['product_ids'], [self.laptop.id])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,11 @@
 import unittest
 from flask_jwt_extended import create_access_token, JWTManager
 from app import create_app
-from models import db, User, Product, ViewingHistory, SearchQuery, Engagement
+from sqlalchemy import event, update
+from models import db, User, Product, ViewingHistory, SearchQuery, Engagement, Category, Tag, ProductImage
 from datetime import datetime 
+from serializers import product_dicts, product_dicts_by_id
+from conditional import bump_products
 
 class ProductsTestCase(unittest.TestCase):
 
@@ -122,5 +125,175 @@ class ProductsTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertGreater(len(response.json['recommended_products']), 0)
 
+class ProductListingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        seller = User(username='seller', email='seller@example.com', role='seller')
+        seller.set_password('password')
+        db.session.add(seller)
+        db.session.flush()
+
+        for c in range(3):
+            category = Category(name=f'category-{c}')
+            db.session.add(category)
+            db.session.flush()
+            tags = [Tag(name=f'tag-{c}-{t}', category_id=category.id) for t in range(3)]
+            db.session.add_all(tags)
+            for p in range(10):
+                product = Product(
+                    name=f'Product {c}-{p}', category_id=category.id, image_url='http://example.com/p.jpg',
+                    price=10.0 + p, description='A product', sku=f'SKU-{c}-{p}', stock=5, user_id=seller.id
+                )
+                product.tags = tags[:2]
+                product.images = [ProductImage(image_url=f'http://example.com/{c}-{p}-{i}.jpg') for i in range(2)]
+                db.session.add(product)
+        db.session.commit()
+        db.session.expunge_all()
+
+    def count_queries(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, statements
+
+    def test_get_products_query_count_is_bounded(self):
+        response, statements = self.count_queries('/api/products')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 30)
+        self.assertEqual(len(response.json[0]['images']), 2)
+        self.assertEqual(len(response.json[0]['category']['tags']), 3)
+        # validator, ids, encoded product versions, products, category versions, categories, category tags,
+        # images, product tags
+        self.assertLessEqual(len(statements), 9)
+
+    def test_get_products_by_category_query_count_is_bounded(self):
+        response, statements = self.count_queries('/api/products/category/category-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 10)
+        self.assertLessEqual(len(statements), 8)
+
+    def test_get_products_keyset_pagination(self):
+        seen = []
+        cursor = 0
+        while cursor is not None:
+            response = self.client.get(f'/api/products?after={cursor}&limit=12')
+            self.assertEqual(response.status_code, 200)
+            seen.extend(product['id'] for product in response.json['products'])
+            cursor = response.json['next_cursor']
+        self.assertEqual(len(seen), 30)
+        self.assertEqual(seen, sorted(seen))
+
+    def test_get_products_stream(self):
+        response = self.client.get('/api/products?stream=1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json), 30)
+
+        response = self.client.get('/api/products?stream=1&after=0&limit=10')
+        self.assertEqual(len(response.json['products']), 10)
+        self.assertEqual(response.json['next_cursor'], response.json['products'][-1]['id'])
+
+    def test_fast_serializers_match_model_serializers(self):
+        products = Product.query_for_listing().order_by(Product.id).all()
+        self.assertEqual(product_dicts(), [product.serialize() for product in products])
+        self.assertEqual(product_dicts(limited=True), [product.serialize_limited() for product in products])
+
+        ids = [products[5].id, products[0].id, 9999]
+        self.assertEqual(product_dicts_by_id(ids), [products[5].serialize(), products[0].serialize()])
+
+    def test_fast_serializers_are_selectable_per_endpoint(self):
+        self.app.config['CACHE_ENABLED'] = False
+        fast = self.client.get('/api/products?after=0&limit=12').json
+        self.app.config['FAST_SERIALIZER_ENDPOINTS'] = []
+        self.assertEqual(self.client.get('/api/products?after=0&limit=12').json, fast)
+
+    def test_listing_reuses_encoded_products_until_they_change(self):
+        self.app.config['CACHE_ENABLED'] = False
+        first = self.client.get('/api/products')
+        response, statements = self.count_queries('/api/products')
+        self.assertEqual(response.json, first.json)
+        # only the validator, the ids and their versions; every product comes from the encoded cache
+        self.assertEqual(len(statements), 3)
+
+        product = db.session.get(Product, first.json[0]['id'])
+        product.name = 'Renamed'
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/products').json[0]['name'], 'Renamed')
+
+        tag = db.session.get(Tag, first.json[1]['category']['tags'][0]['id'])
+        tag.name = 'renamed-tag'
+        db.session.commit()
+        self.assertEqual(self.client.get('/api/products').json[1]['category']['tags'][0]['name'], 'renamed-tag')
+
+    def test_encoded_products_follow_other_workers_changes(self):
+        self.app.config['CACHE_ENABLED'] = False
+        first = self.client.get('/api/products?compact=1').json['products'][0]
+        self.client.get('/api/products')
+        # committed elsewhere: only the catalog version tells this worker
+        with db.engine.begin() as connection:
+            connection.execute(update(Product).where(Product.id == first['id']).values(name='Renamed'))
+            bump_products(connection, [first['id']])
+        self.assertEqual(self.client.get('/api/products?compact=1').json['products'][0]['name'], 'Renamed')
+        self.assertEqual(self.client.get('/api/products').json[0]['name'], 'Renamed')
+
+    def test_serialized_categories_are_cached_until_they_change(self):
+        self.app.config['CACHE_ENABLED'] = False
+        first = self.client.get('/api/products/category/category-1')
+        response, statements = self.count_queries('/api/products/category/category-1')
+        self.assertEqual(response.json, first.json)
+        # the category and its tags come from the category cache
+        self.assertFalse([statement for statement in statements if 'WHERE categories.id IN' in statement])
+        self.assertFalse([statement for statement in statements if 'WHERE tags.category_id IN' in statement])
+
+        tag = db.session.get(Tag, first.json[0]['category']['tags'][0]['id'])
+        tag.name = 'renamed-tag'
+        db.session.commit()
+        response = self.client.get('/api/products/category/category-1')
+        self.assertEqual(response.json[0]['category']['tags'][0]['name'], 'renamed-tag')
+
+    def test_compact_products_side_load_categories(self):
+        self.app.config['CACHE_ENABLED'] = False
+        full = self.client.get('/api/products').json
+        urls = ['/api/products?compact=1', '/api/products/category/category-1?compact=1']
+        for fast in (True, False):
+            if not fast:
+                self.app.config['FAST_SERIALIZER_ENDPOINTS'] = []
+            for url in urls:
+                with self.subTest(url=url, fast=fast):
+                    compact = self.client.get(url).json
+                    self.assertEqual(set(compact), {'products', 'categories'})
+                    for product in compact['products']:
+                        expected = next(item for item in full if item['id'] == product['id'])
+                        self.assertEqual(compact['categories'][str(product.pop('category_id'))], expected['category'])
+                        self.assertEqual(product, {key: value for key, value in expected.items() if key != 'category'})
+
+            page = self.client.get('/api/products?compact=1&after=0&limit=12').json
+            self.assertEqual(len(page['products']), 12)
+            self.assertEqual(page['next_cursor'], page['products'][-1]['id'])
+            self.assertEqual(len(page['categories']), 2)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,170 @@
+import unittest
+from sqlalchemy import event
+from app import create_app
+from models import db, User, Product, Category, Rating, ProductRatingStats
+from importer import import_catalog
+from serializers import product_dicts
+
+
+class RatingStatsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing', RATINGS_PAGE_SIZE=2)
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customers = [User(username=f'customer{n}', email=f'customer{n}@example.com', role='user')
+                          for n in range(3)]
+        db.session.add_all([self.seller, *self.customers])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.products = [
+            Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                    description=name, sku=name.upper(), stock=5, user_id=self.seller.id)
+            for name in ['Laptop', 'Smart TV']
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+        self.laptop, self.tv = (product.id for product in self.products)
+
+    def statements(self, url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.get(url)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, statements
+
+    def stats(self, product_id):
+        return ProductRatingStats.stats_dict(db.session.get(ProductRatingStats, product_id))
+
+    def rate(self, product_id, rating, customer=0):
+        response = self.client.post('/api/ratings', json={
+            'product_id': product_id, 'user_id': self.customers[customer].id, 'rating': rating, 'comment': 'ok'
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json['id']
+
+    def test_rating_writes_keep_stats(self):
+        self.assertEqual(self.stats(self.laptop), {'count': 0, 'average': None,
+                                                   'histogram': {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}})
+        first = self.rate(self.laptop, 5)
+        self.rate(self.laptop, 4, customer=1)
+        self.rate(self.laptop, 4, customer=2)
+        self.assertEqual(self.stats(self.laptop), {'count': 3, 'average': 4.33,
+                                                   'histogram': {'1': 0, '2': 0, '3': 0, '4': 2, '5': 1}})
+
+        self.assertEqual(self.client.patch(f'/api/ratings/{first}', json={'rating': 1}).status_code, 200)
+        self.assertEqual(self.client.patch(f'/api/ratings/{first}', json={'comment': 'changed'}).status_code, 200)
+        self.assertEqual(self.stats(self.laptop)['histogram'], {'1': 1, '2': 0, '3': 0, '4': 2, '5': 0})
+        self.assertEqual(self.client.delete(f'/api/ratings/{first}').status_code, 200)
+        self.assertEqual(self.stats(self.laptop), {'count': 2, 'average': 4.0,
+                                                   'histogram': {'1': 0, '2': 0, '3': 0, '4': 2, '5': 0}})
+        self.assertEqual(self.stats(self.tv)['count'], 0)
+
+    def test_ratings_moved_between_products_move_their_stats(self):
+        rating = Rating(product_id=self.laptop, user_id=self.customers[0].id, rating=3)
+        db.session.add(rating)
+        db.session.commit()
+        db.session.expire_all()
+        rating = db.session.get(Rating, rating.id)
+        rating.product_id = self.tv
+        db.session.commit()
+        self.assertEqual(self.stats(self.laptop)['count'], 0)
+        self.assertEqual(self.stats(self.tv), {'count': 1, 'average': 3.0,
+                                               'histogram': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0}})
+
+    def test_listings_include_stats_without_more_queries(self):
+        self.app.config['CACHE_ENABLED'] = False
+        _, before = self.statements('/api/products')
+        self.rate(self.tv, 2)
+        self.app.extensions['encoded_products'].clear()
+        self.app.extensions['serialized_categories'].clear()
+        response, after = self.statements('/api/products')
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(response.json[1]['rating_stats']['average'], 2.0)
+        self.assertIsNone(response.json[0]['rating_stats']['average'])
+
+        # the model serializer joins the stats too
+        self.app.config['FAST_SERIALIZER_ENDPOINTS'] = []
+        response, statements = self.statements('/api/products/category/Electronics')
+        self.assertEqual(response.json[1]['rating_stats']['count'], 1)
+        self.assertFalse([statement for statement in statements if statement.startswith('SELECT product_rating_stats')])
+        db.session.expunge_all()
+        self.assertEqual(product_dicts(), [product.serialize() for product in Product.query_for_listing().all()])
+
+    def test_cached_listings_see_new_ratings(self):
+        self.client.get('/api/products')
+        self.client.get('/api/products/category/Electronics')
+        self.rate(self.laptop, 5)
+        self.assertEqual(self.client.get('/api/products').json[0]['rating_stats']['count'], 1)
+        self.assertEqual(self.client.get('/api/products/category/Electronics').json[0]['rating_stats']['count'], 1)
+
+    def test_reviews_are_paged_with_their_users(self):
+        ids = [self.rate(self.laptop, rating, customer) for customer, rating in enumerate([5, 4, 3])]
+
+        response = self.client.get(f'/api/products/{self.laptop}')
+        self.assertEqual([rating['id'] for rating in response.json['ratings']], ids[:0:-1])
+        self.assertEqual(response.json['ratings_next_cursor'], ids[1])
+        self.assertEqual(response.json['rating_stats']['count'], 3)
+
+        response, statements = self.statements(f'/api/products/{self.laptop}/ratings?before={ids[1]}')
+        self.assertEqual(response.json, {'ratings': [{
+            'id': ids[0], 'product_id': self.laptop, 'user_id': self.customers[0].id, 'username': 'customer0',
+            'rating': 5, 'comment': 'ok', 'created_at': response.json['ratings'][0]['created_at'],
+        }], 'next_cursor': None})
+        # the usernames come with the ratings
+        self.assertEqual(len([statement for statement in statements if 'FROM ratings' in statement]), 1)
+        self.assertFalse([statement for statement in statements if 'FROM users' in statement])
+
+        response = self.client.get(f'/api/products/{self.laptop}/ratings?limit=1')
+        self.assertEqual(len(response.json['ratings']), 1)
+        self.assertEqual(response.json['next_cursor'], ids[2])
+
+    def test_invalid_ratings_are_rejected(self):
+        rating_id = self.rate(self.laptop, 3)
+        for rating in [0, 6, 4.5, '4', True, None]:
+            with self.subTest(rating=rating):
+                response = self.client.post('/api/ratings', json={
+                    'product_id': self.laptop, 'user_id': self.customers[1].id, 'rating': rating
+                })
+                self.assertEqual(response.status_code, 422)
+                response = self.client.patch(f'/api/ratings/{rating_id}', json={'rating': rating})
+                self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.stats(self.laptop)['histogram'], {'1': 0, '2': 0, '3': 1, '4': 0, '5': 0})
+        self.assertEqual(Rating.query.count(), 1)
+
+    def test_imported_ratings_are_counted(self):
+        counts = import_catalog([{'title': 'Phone', 'category': 'Electronics', 'sku': 'PHONE', 'price': 5, 'stock': 1,
+                                  'reviews': [{'rating': 5, 'reviewerEmail': 'customer0@example.com'},
+                                              {'rating': '3', 'reviewerEmail': 'customer1@example.com'},
+                                              {'rating': 9, 'reviewerEmail': 'customer2@example.com'},
+                                              {'rating': 'great', 'reviewerEmail': 'customer2@example.com'}]}],
+                                self.seller.id)
+        self.assertEqual(counts['skipped_reviews'], 2)
+        phone = Product.query.filter_by(sku='PHONE').one()
+        self.assertEqual(self.stats(phone.id), {'count': 2, 'average': 4.0,
+                                                'histogram': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1}})
+
+if __name__ == '__main__':
+    unittest.main()
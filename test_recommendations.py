@@ -0,0 +1,113 @@
+import unittest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, User, Product, Category, ViewingHistory, SearchQuery, Engagement, RecommendationCandidate
+from recommendations import refresh_candidates, MAX_CANDIDATE_SCORE
+
+
+class RecommendationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.products = [
+            Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                    description=name, sku=name.upper(), stock=5, user_id=self.seller.id)
+            for name in ['Laptop', 'Smart TV', 'Headphones', 'Camera', 'Tablet', 'Speaker']
+        ]
+        db.session.add_all(self.products)
+        db.session.commit()
+
+    def get_recommended_names(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.get('/api/recommended_products', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.json]
+
+    def candidate_scores(self):
+        return {
+            candidate.product_id: candidate.score
+            for candidate in RecommendationCandidate.query.filter_by(user_id=self.customer.id)
+        }
+
+    def test_interactions_update_candidates(self):
+        laptop, tv, headphones = self.products[:3]
+        db.session.add_all([
+            ViewingHistory(user_id=self.customer.id, product_id=laptop.id),
+            ViewingHistory(user_id=self.customer.id, product_id=laptop.id),
+            Engagement(user_id=self.customer.id, product_id=tv.id, watch_time=120),
+            SearchQuery(user_id=self.customer.id, search_query='headphone'),
+        ])
+        db.session.commit()
+
+        scores = self.candidate_scores()
+        self.assertEqual(scores, {laptop.id: 2.0, tv.id: 2.0, headphones.id: 0.5})
+
+    def test_search_wildcards_match_literally(self):
+        db.session.add_all([
+            SearchQuery(user_id=self.customer.id, search_query='%'),
+            SearchQuery(user_id=self.customer.id, search_query='smart_tv'),
+        ])
+        db.session.commit()
+        self.assertEqual(self.candidate_scores(), {})
+
+    def test_scores_are_capped(self):
+        laptop = self.products[0]
+        db.session.add_all([ViewingHistory(user_id=self.customer.id, product_id=laptop.id)
+                            for _ in range(int(MAX_CANDIDATE_SCORE) + 5)])
+        db.session.commit()
+        self.assertEqual(self.candidate_scores(), {laptop.id: MAX_CANDIDATE_SCORE})
+
+    def test_refresh_rebuilds_candidates(self):
+        laptop = self.products[0]
+        db.session.add(ViewingHistory(user_id=self.customer.id, product_id=laptop.id))
+        db.session.commit()
+        db.session.add(RecommendationCandidate(user_id=self.customer.id, product_id=self.products[5].id, score=50))
+        db.session.commit()
+
+        refresh_candidates([self.customer.id])
+        self.assertEqual(self.candidate_scores(), {laptop.id: 1.0})
+
+    def test_recommended_products_are_ranked_and_topped_up(self):
+        camera, tablet = self.products[3], self.products[4]
+        db.session.add_all([
+            Engagement(user_id=self.customer.id, product_id=camera.id, watch_time=300),
+            ViewingHistory(user_id=self.customer.id, product_id=tablet.id),
+            # another user's views make the speaker popular
+            ViewingHistory(user_id=self.seller.id, product_id=self.products[5].id),
+        ])
+        db.session.commit()
+
+        names = self.get_recommended_names()
+        self.assertEqual(len(names), 4)
+        self.assertEqual(names[:3], ['Camera', 'Tablet', 'Speaker'])
+
+    def test_wishlist_adds_candidate(self):
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.post('/api/wishlist', headers=headers, json={'product_id': self.products[1].id})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.candidate_scores(), {self.products[1].id: 3.0})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from app import create_app
+from models import (db, User, Product, Category, ViewingHistory, SearchQuery, Engagement, DailyInteraction,
+                    DailySearch, RecommendationCandidate)
+from recommendations import refresh_candidates, popular_product_ids
+from retention import rollup_events
+
+
+class RetentionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.products = [
+            Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                    description=name, sku=name.upper(), stock=5, user_id=self.seller.id)
+            for name in ['Laptop', 'Smart TV', 'Headphones']
+        ]
+        db.session.add_all(self.products)
+        db.session.flush()
+
+        laptop, tv, headphones = (product.id for product in self.products)
+        self.old = datetime.utcnow() - timedelta(days=40)
+        recent = datetime.utcnow() - timedelta(days=1)
+        user_id = self.customer.id
+        db.session.add_all(
+            [ViewingHistory(user_id=user_id, product_id=laptop, viewed_at=self.old + timedelta(minutes=i)) for i in range(3)]
+            + [ViewingHistory(user_id=user_id, product_id=tv, viewed_at=self.old - timedelta(days=1)),
+               ViewingHistory(user_id=user_id, product_id=headphones, viewed_at=recent),
+               Engagement(user_id=user_id, product_id=tv, watch_time=60, engaged_at=self.old),
+               Engagement(user_id=user_id, product_id=tv, watch_time=120, engaged_at=self.old),
+               SearchQuery(user_id=user_id, search_query='Laptop', searched_at=self.old),
+               SearchQuery(user_id=user_id, search_query='Laptop', searched_at=self.old),
+               SearchQuery(user_id=user_id, search_query='Smart', searched_at=recent)]
+        )
+        db.session.commit()
+
+    def test_old_events_are_rolled_up_and_deleted(self):
+        counts = rollup_events(days=30, batch_size=2, pause=0)
+        self.assertEqual(counts, {'views': 4, 'engagements': 2, 'searches': 2})
+
+        laptop, tv, headphones = (product.id for product in self.products)
+        self.assertEqual([view.product_id for view in ViewingHistory.query.all()], [headphones])
+        self.assertEqual(Engagement.query.count(), 0)
+        self.assertEqual([search.search_query for search in SearchQuery.query.all()], ['Smart'])
+
+        rollups = {(row.day, row.product_id): row for row in DailyInteraction.query.all()}
+        self.assertEqual(rollups[(self.old.date(), laptop)].views, 3)
+        self.assertEqual(rollups[(self.old.date(), tv)].engagements, 2)
+        self.assertEqual(rollups[(self.old.date(), tv)].watch_time, 180)
+        self.assertEqual(rollups[((self.old - timedelta(days=1)).date(), tv)].views, 1)
+        self.assertEqual([(row.search_query, row.searches) for row in DailySearch.query.all()], [('Laptop', 2)])
+
+        # a second run has nothing left to do
+        self.assertEqual(rollup_events(days=30, pause=0), {'views': 0, 'engagements': 0, 'searches': 0})
+
+    def test_rolled_up_events_still_feed_recommendations(self):
+        refresh_candidates([self.customer.id])
+        before = {row.product_id: row.score for row in RecommendationCandidate.query.all()}
+        popular = popular_product_ids(3)
+
+        rollup_events(days=30, pause=0)
+        refresh_candidates([self.customer.id])
+        after = {row.product_id: row.score for row in RecommendationCandidate.query.all()}
+        self.assertEqual(set(after), set(before))
+        # three laptop views on one day now count as one
+        laptop = self.products[0].id
+        self.assertLess(after[laptop], before[laptop])
+
+        self.app.extensions.pop('popular_products', None)
+        self.assertEqual(popular_product_ids(3), popular)
+
+    def test_archive_keeps_the_raw_rows(self):
+        directory = tempfile.mkdtemp()
+        try:
+            rollup_events(days=30, batch_size=3, archive=directory, pause=0)
+            with open(os.path.join(directory, 'viewing_history.csv'), newline='') as archive:
+                rows = list(csv.DictReader(archive))
+            self.assertEqual(len(rows), 4)
+            self.assertEqual(set(rows[0]), {'id', 'user_id', 'product_id', 'viewed_at'})
+            self.assertTrue(os.path.exists(os.path.join(directory, 'search_query.csv')))
+        finally:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    unittest.main()
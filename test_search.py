@@ -1,7 +1,9 @@
 import unittest
 from flask_jwt_extended import create_access_token, JWTManager
 from app import create_app
-from models import db, Product
+from models import db, Product, User, Category, Tag
+from Search import get_search_index
+from fulltext import get_backend, IlikeBackend, SqliteFTS5Backend
 
 class TestSearchBlueprint(unittest.TestCase):
 
@@ -50,5 +52,188 @@ class TestSearchBlueprint(unittest.TestCase):
         data = response.get_json()
         self.assertEqual(data['error'], 'No search query provided')
 
+class SearchDetailsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.admin = User(username='admin', email='admin@example.com', role='admin')
+        self.admin.set_password('password')
+        db.session.add(self.admin)
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        tag = Tag(name='apple', category_id=category.id)
+        products = [
+            Product(name='Apple iPhone', category_id=category.id, image_url='http://example.com/iphone.jpg', price=999.99,
+                    description='Smartphone', sku='IPHONE', stock=10, user_id=self.admin.id),
+            Product(name='Apple MacBook', category_id=category.id, image_url='http://example.com/macbook.jpg', price=1299.99,
+                    description='Laptop', sku='MACBOOK', stock=5, user_id=self.admin.id),
+            Product(name='Desk Lamp', category_id=category.id, image_url='http://example.com/lamp.jpg', price=19.99,
+                    description='LED lamp', sku='LAMP', stock=50, user_id=self.admin.id),
+        ]
+        products[0].tags = [tag]
+        db.session.add_all(products)
+        db.session.commit()
+
+    def search_names(self, query):
+        response = self.client.get(f'/api/search_details?query={query}')
+        self.assertEqual(response.status_code, 200)
+        return sorted(product['name'] for product in response.get_json())
+
+    def test_search_details(self):
+        self.assertEqual(self.search_names('apple'), ['Apple MacBook', 'Apple iPhone'])
+        self.assertEqual(self.search_names('macbok'), ['Apple MacBook'])
+        self.assertEqual(self.search_names('smartph'), ['Apple iPhone'])
+        self.assertEqual(self.search_names('headphones'), [])
+
+    def test_candidates_are_narrowed_by_index(self):
+        self.search_names('lamp')
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+        self.assertEqual(get_search_index().candidates('lamp'), {lamp.id})
+
+    def test_index_follows_product_updates(self):
+        self.assertEqual(self.search_names('lamp'), ['Desk Lamp'])
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.admin.id)}'}
+
+        response = self.client.patch(f'/api/products/{lamp.id}', headers=headers, json={'name': 'Floor Light'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.search_names('floor'), ['Floor Light'])
+
+        response = self.client.delete(f'/api/products/{lamp.id}', headers=headers)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.search_names('floor'), [])
+
+    def test_results_carry_current_product_data(self):
+        self.search_names('lamp')
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+        # a write the index never sees, like a stock reservation
+        db.session.execute(db.update(Product).where(Product.id == lamp.id).values(stock=7))
+        db.session.commit()
+        response = self.client.get('/api/search_details?query=lamp')
+        self.assertEqual([product['stock'] for product in response.get_json()], [7])
+
+    def test_stale_index_is_rebuilt_in_background(self):
+        self.assertEqual(self.search_names('lamp'), ['Desk Lamp'])
+        category = Category.query.first()
+        # added by another worker, so this index doesn't know about it
+        db.session.execute(db.insert(Product).values(
+            name='Reading Lamp', category_id=category.id, image_url='http://example.com/reading.jpg', price=9.99,
+            description='Lamp', sku='READING', stock=3, user_id=self.admin.id))
+        db.session.commit()
+        self.assertEqual(self.search_names('lamp'), ['Desk Lamp'])
+
+        search_index = get_search_index()
+        search_index._built_at -= self.app.config['SEARCH_INDEX_TTL'] + 1
+        # the stale index answers while the new one is built
+        self.search_names('lamp')
+        search_index._rebuild_thread.join(5)
+        self.assertEqual(self.search_names('lamp'), ['Desk Lamp', 'Reading Lamp'])
+
+class FullTextSearchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        admin = User(username='admin', email='admin@example.com', role='admin')
+        db.session.add(admin)
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        db.session.add_all([
+            Product(name='Apple iPhone', category_id=category.id, image_url='http://example.com/iphone.jpg', price=999.99,
+                    description='Smartphone', sku='IPHONE', stock=10, user_id=admin.id),
+            Product(name='Apple MacBook', category_id=category.id, image_url='http://example.com/macbook.jpg', price=1299.99,
+                    description='Laptop by Apple', sku='MACBOOK', stock=5, user_id=admin.id),
+            Product(name='Reading Light', category_id=category.id, image_url='http://example.com/light.jpg', price=9.99,
+                    description='Clip-on book lamp', sku='LIGHT', stock=50, user_id=admin.id),
+            Product(name='Desk Lamp', category_id=category.id, image_url='http://example.com/lamp.jpg', price=19.99,
+                    description='LED lamp', sku='LAMP', stock=50, user_id=admin.id),
+        ])
+        db.session.commit()
+
+    def search_names(self, query):
+        response = self.client.get(f'/api/search?q={query}')
+        self.assertEqual(response.status_code, 200)
+        return [product['name'] for product in response.get_json()['results']]
+
+    def test_fts5_backend_ranks_matches(self):
+        self.assertIsInstance(get_backend(), SqliteFTS5Backend)
+        self.assertEqual(sorted(self.search_names('apple')), ['Apple MacBook', 'Apple iPhone'])
+        self.assertEqual(len(self.search_names('electronics')), 4)
+        self.assertEqual(self.search_names('mac'), ['Apple MacBook'])
+        # name matches are weighted above description matches
+        self.assertEqual(self.search_names('lamp'), ['Desk Lamp', 'Reading Light'])
+        # FTS5 query syntax in user input is treated as plain text
+        self.assertEqual(self.search_names('"lamp* NEAR('), [])
+        self.assertEqual(self.search_names('desk "lamp'), ['Desk Lamp'])
+
+    def test_fts5_backend_follows_product_updates(self):
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+        lamp.name = 'Floor Light'
+        db.session.commit()
+        self.assertEqual(self.search_names('floor'), ['Floor Light'])
+        self.assertEqual(sorted(self.search_names('lamp')), ['Floor Light', 'Reading Light'])
+
+        db.session.delete(lamp)
+        db.session.commit()
+        self.assertEqual(self.search_names('floor'), [])
+
+    def test_fts5_index_ignores_stock_updates(self):
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+
+        def rows_changed(statement):
+            before = db.session.execute(db.text('SELECT total_changes()')).scalar()
+            db.session.execute(db.text(statement), {'id': lamp.id})
+            # total_changes() counts the rows written by triggers too
+            return db.session.execute(db.text('SELECT total_changes()')).scalar() - before
+
+        self.assertEqual(rows_changed('UPDATE products SET stock = stock - 1 WHERE id = :id'), 1)
+        self.assertGreater(rows_changed("UPDATE products SET description = 'Bright lamp' WHERE id = :id"), 1)
+        db.session.commit()
+        self.assertEqual(self.search_names('bright'), ['Desk Lamp'])
+
+    def test_ilike_fallback(self):
+        self.app.config['SEARCH_BACKEND'] = 'ilike'
+        self.assertIsInstance(get_backend(), IlikeBackend)
+        self.assertEqual(self.search_names('Desk'), ['Desk Lamp'])
+        self.assertEqual(len(self.search_names('electronics')), 4)
+        # a product whose category row is missing still matches on its name
+        lamp = Product.query.filter_by(name='Desk Lamp').first()
+        db.session.execute(db.update(Product).where(Product.id == lamp.id).values(category_id=999))
+        db.session.commit()
+        self.assertEqual(IlikeBackend().search_ids('desk', 10), [lamp.id])
+
 if __name__ == '__main__':
     unittest.main()
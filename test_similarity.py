@@ -0,0 +1,121 @@
+import unittest
+from flask_jwt_extended import create_access_token
+from app import create_app
+from models import db, User, Product, Category, Tag, ProductSimilarity
+from similarity import rebuild_similarities
+
+
+class SimilarityTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.tags = {name: Tag(name=name, category_id=category.id) for name in ['audio', 'wireless', 'video', 'portable']}
+        self.products = {}
+        for name, tags in [
+            ('Headphones', ['audio', 'wireless']),
+            ('Earbuds', ['audio', 'wireless', 'portable']),
+            ('Speaker', ['audio']),
+            ('Camera', ['video', 'portable']),
+            ('Monitor', ['video']),
+        ]:
+            product = Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                              description=name, sku=name.upper(), stock=5, user_id=self.seller.id)
+            product.tags = [self.tags[tag] for tag in tags]
+            self.products[name] = product
+            db.session.add(product)
+        db.session.commit()
+
+    def neighbors(self, name):
+        rows = ProductSimilarity.query.filter_by(product_id=self.products[name].id).order_by(
+            ProductSimilarity.score.desc(), ProductSimilarity.similar_product_id
+        )
+        return [(db.session.get(Product, row.similar_product_id).name, round(row.score, 2)) for row in rows]
+
+    def test_incremental_updates_match_rebuild(self):
+        self.products['Speaker'].tags.append(self.tags['portable'])
+        self.products['Earbuds'].tags.remove(self.tags['wireless'])
+        db.session.commit()
+        incremental = {name: self.neighbors(name) for name in self.products}
+
+        rebuild_similarities(db.session.connection())
+        db.session.commit()
+        rebuilt = {name: self.neighbors(name) for name in self.products}
+
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(rebuilt['Speaker'], [('Earbuds', 1.0), ('Headphones', 0.33), ('Camera', 0.33)])
+
+    def test_incremental_updates_refill_trimmed_lists(self):
+        self.app.config['SIMILARITY_TOP_K'] = 1
+        rebuild_similarities(db.session.connection())
+        db.session.commit()
+        self.assertEqual(self.neighbors('Headphones'), [('Earbuds', 0.67)])
+
+        self.products['Earbuds'].tags.remove(self.tags['audio'])
+        self.products['Earbuds'].tags.remove(self.tags['wireless'])
+        db.session.commit()
+        incremental = {name: self.neighbors(name) for name in self.products}
+
+        rebuild_similarities(db.session.connection())
+        db.session.commit()
+        self.assertEqual(incremental, {name: self.neighbors(name) for name in self.products})
+        self.assertEqual(incremental['Headphones'], [('Speaker', 0.5)])
+
+    def test_top_k_is_enforced(self):
+        rebuild_similarities(db.session.connection(), k=1)
+        db.session.commit()
+        self.assertEqual(self.neighbors('Headphones'), [('Earbuds', 0.67)])
+        self.assertEqual(self.neighbors('Monitor'), [('Camera', 0.5)])
+
+    def test_deleted_products_leave_neighbor_lists(self):
+        self.app.config['SIMILARITY_TOP_K'] = 1
+        rebuild_similarities(db.session.connection())
+        db.session.commit()
+        earbuds = self.products.pop('Earbuds')
+        self.assertEqual(self.neighbors('Headphones'), [('Earbuds', 0.67)])
+
+        db.session.delete(earbuds)
+        db.session.commit()
+        self.assertFalse(ProductSimilarity.query.filter(
+            (ProductSimilarity.product_id == earbuds.id) | (ProductSimilarity.similar_product_id == earbuds.id)
+        ).count())
+        # the lists Earbuds was cut from are refilled
+        self.assertEqual(self.neighbors('Headphones'), [('Speaker', 0.5)])
+        incremental = {name: self.neighbors(name) for name in self.products}
+        rebuild_similarities(db.session.connection())
+        db.session.commit()
+        self.assertEqual(incremental, {name: self.neighbors(name) for name in self.products})
+
+    def test_wishlist_recommendations_are_ranked(self):
+        self.customer.wishlists.extend([self.products['Headphones'], self.products['Camera']])
+        db.session.commit()
+
+        headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+        response = self.client.get('/api/wishlist/recommendations', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        # Earbuds: 0.67 + 0.25, Speaker: 0.5, Monitor: 0.5
+        self.assertEqual([product['name'] for product in response.json], ['Earbuds', 'Speaker', 'Monitor'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,9 @@
 import unittest
+from unittest import mock
 from flask_jwt_extended import create_access_token, JWTManager
+from sqlalchemy import event
 from app import create_app
-from models import db, User, Product
+from models import db, User, Product, Category, RecommendationCandidate, wishlist_table
 
 class WishlistTestCase(unittest.TestCase):
 
@@ -107,5 +109,149 @@ class WishlistTestCase(unittest.TestCase):
         self.assertEqual(response.status_code, 404)
         self.assertIn('Product not in wishlist', response.json['message'])
 
+class WishlistQueryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app('testing', WISHLIST_BATCH_MAX_SIZE=5)
+        self.app.config['TESTING'] = True
+
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+        db.create_all()
+        self.populate_db()
+
+        self.client = self.app.test_client()
+        self.headers = {'Authorization': f'Bearer {create_access_token(identity=self.customer.id)}'}
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def populate_db(self):
+        self.seller = User(username='seller', email='seller@example.com', role='seller')
+        self.customer = User(username='customer', email='customer@example.com', role='user')
+        db.session.add_all([self.seller, self.customer])
+        category = Category(name='Electronics')
+        db.session.add(category)
+        db.session.flush()
+        self.products = [
+            Product(name=name, category_id=category.id, image_url='http://example.com/p.jpg', price=10.0,
+                    description=name, sku=name.upper(), stock=5, user_id=self.seller.id)
+            for name in ['Laptop', 'Smart TV', 'Headphones']
+        ]
+        db.session.add_all(self.products)
+        db.session.flush()
+        db.session.execute(wishlist_table.insert().values(user_id=self.customer.id, product_id=self.products[0].id))
+        db.session.commit()
+
+    def wishlist(self):
+        return sorted(db.session.execute(
+            wishlist_table.select().with_only_columns(wishlist_table.c.product_id)
+            .where(wishlist_table.c.user_id == self.customer.id)
+        ).scalars())
+
+    def statements(self, method, url, **kwargs):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = self.client.open(url, method=method, headers=self.headers, **kwargs)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        return response, [statement for statement in statements if 'wishlist_table' in statement]
+
+    def test_batch_add(self):
+        laptop, tv, headphones = (product.id for product in self.products)
+        response, statements = self.statements('POST', '/api/wishlist/batch',
+                                               json={'product_ids': [tv, laptop, 999, headphones, tv]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json, {'added': [tv, headphones], 'already_in_wishlist': [laptop],
+                                         'not_found': [999]})
+        self.assertEqual(self.wishlist(), [laptop, tv, headphones])
+        # one INSERT for the batch, and one query explaining the ids that weren't added
+        self.assertEqual(len([statement for statement in statements if statement.startswith('INSERT')]), 1)
+        self.assertIn(tv, [row.product_id for row in RecommendationCandidate.query.filter_by(user_id=self.customer.id)])
+
+        response = self.client.post('/api/wishlist/batch', headers=self.headers, json={'product_ids': [tv]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['already_in_wishlist'], [tv])
+
+    def test_batch_add_without_returning(self):
+        laptop, tv, headphones = (product.id for product in self.products)
+        # e.g. SQLite before 3.35
+        with mock.patch.object(db.engine.dialect, 'insert_returning', False):
+            response, statements = self.statements('POST', '/api/wishlist/batch',
+                                                   json={'product_ids': [tv, laptop, 999]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json, {'added': [tv], 'already_in_wishlist': [laptop], 'not_found': [999]})
+        self.assertEqual(self.wishlist(), [laptop, tv])
+        self.assertFalse([statement for statement in statements if 'RETURNING' in statement])
+
+    def test_batch_remove(self):
+        laptop, tv, headphones = (product.id for product in self.products)
+        self.client.post('/api/wishlist/batch', headers=self.headers, json={'product_ids': [tv]})
+        response, statements = self.statements('DELETE', '/api/wishlist/batch',
+                                               json={'product_ids': [laptop, tv, headphones]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'removed': 2})
+        self.assertEqual(self.wishlist(), [])
+        self.assertEqual(len(statements), 1)
+
+    def test_batch_requests_are_validated(self):
+        for data in [{}, {'product_ids': []}, {'product_ids': [1, 'two']}, {'product_ids': [True]},
+                     {'product_ids': list(range(1, 7))}, {'product_ids': 1}]:
+            with self.subTest(data=data):
+                for method in ('POST', 'DELETE'):
+                    response = self.client.open('/api/wishlist/batch', method=method, headers=self.headers, json=data)
+                    self.assertEqual(response.status_code, 422)
+
+    def test_single_item_routes_do_not_load_the_wishlist(self):
+        laptop, tv, _ = (product.id for product in self.products)
+        for product_id, status in [(tv, 201), (tv, 200), (999, 404)]:
+            response = self.client.post('/api/wishlist', headers=self.headers, json={'product_id': product_id})
+            self.assertEqual(response.status_code, status)
+        response, statements = self.statements('DELETE', f'/api/wishlist/{laptop}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        self.assertEqual(self.client.delete(f'/api/wishlist/{laptop}', headers=self.headers).status_code, 404)
+        self.assertEqual(self.wishlist(), [tv])
+
+    def test_dynamic_wishlist_relationship(self):
+        laptop, tv, _ = self.products
+        self.customer.wishlists.append(tv)
+        db.session.commit()
+        self.assertEqual(self.customer.wishlists.count(), 2)
+        self.assertEqual(self.customer.wishlists.filter(Product.price < 20).order_by(Product.id).all(), [laptop, tv])
+        self.assertNotIn('wishlists', self.customer.to_dict())
+
+    def test_wishlist_cards_are_paged(self):
+        laptop, tv, headphones = (product.id for product in self.products)
+        self.client.post('/api/wishlist/batch', headers=self.headers, json={'product_ids': [tv, headphones]})
+
+        response, statements = self.statements('GET', '/api/wishlist/items?limit=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['next_cursor'], tv)
+        self.assertEqual(response.json['products'][0], {'id': laptop, 'name': 'Laptop', 'price': 10.0,
+                                                        'image_url': 'http://example.com/p.jpg', 'stock': 5})
+        self.assertEqual(len(statements), 1)
+        # no category, tag or image queries for cards
+        self.assertNotIn('tags', statements[0])
+
+        response = self.client.get(f'/api/wishlist/items?limit=2&after={tv}', headers=self.headers)
+        self.assertEqual([product['id'] for product in response.json['products']], [headphones])
+        self.assertIsNone(response.json['next_cursor'])
+
+    def test_wishlist_count(self):
+        response, statements = self.statements('GET', '/api/wishlist/items?count=1')
+        self.assertEqual(response.json, {'count': 1})
+        self.assertNotIn('products', statements[0])
+        self.client.post('/api/wishlist/batch', headers=self.headers, json={'product_ids': [self.products[1].id]})
+        self.assertEqual(self.client.get('/api/wishlist/items?count=true', headers=self.headers).json, {'count': 2})
+
 if __name__ == '__main__':
     unittest.main()
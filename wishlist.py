@@ -1,11 +1,15 @@
 from flask import Flask, make_response,jsonify,session,request, current_app, Blueprint
 from flask_restful import Resource, Api, reqparse
 from flask_jwt_extended import jwt_required, get_jwt_identity, current_user
+from sqlalchemy import select, delete, exists, literal, func
+from sqlalchemy.dialects import postgresql, sqlite
 from config import api, jwt, db, app
 
 # Add your model imports
-from models import Product, User
+from models import Product, User, wishlist_table
 from authenticate import allow
+from recommendations import record_interactions
+from similarity import recommend_for_products
 
 wishlist_bp = Blueprint('wishlist_bp',__name__, url_prefix='/api')
 wishlist_api = Api(wishlist_bp)
@@ -18,8 +22,91 @@ def init_jwt(app):
 @jwt_required()
 def view_wishlist():
     user_id = get_jwt_identity()
-    user = db.session.get(User, user_id) 
-    return jsonify([product.serialize() for product in user.wishlists]), 200
+    products = Product.query_for_listing().join(wishlist_table, wishlist_table.c.product_id == Product.id).filter(wishlist_table.c.user_id == user_id).all()
+    return jsonify([product.serialize() for product in products]), 200
+
+def in_wishlist(user_id, product_id):
+    """EXISTS on the wishlist's (user_id, product_id) primary key, instead of loading user.wishlists."""
+    return exists().where(wishlist_table.c.user_id == user_id, wishlist_table.c.product_id == product_id)
+
+
+def add_wishlist_items(user_id, product_ids):
+    """
+    Add the products that exist to the user's wishlist, skipping those already
+    in it, and return the ids that were added. On SQLite (3.35 and later) and
+    PostgreSQL this is one INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING.
+    """
+    connection = db.session.connection()
+    products = select(literal(user_id, db.Integer), Product.id).where(Product.id.in_(product_ids))
+    dialect = connection.dialect.name
+    # older SQLite versions have ON CONFLICT but not RETURNING
+    if dialect in ('sqlite', 'postgresql') and connection.dialect.insert_returning:
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(wishlist_table)
+        added = connection.execute(
+            insert.from_select(['user_id', 'product_id'], products)
+            .on_conflict_do_nothing().returning(wishlist_table.c.product_id)
+        ).scalars().all()
+    else:
+        added = connection.execute(
+            products.with_only_columns(Product.id).where(~in_wishlist(user_id, Product.id))
+        ).scalars().all()
+        if added:
+            connection.execute(wishlist_table.insert(), [{'user_id': user_id, 'product_id': product_id}
+                                                         for product_id in added])
+    if added:
+        record_interactions(connection, wishlist=[{'user_id': user_id, 'product_id': product_id}
+                                                  for product_id in added])
+    return added
+
+
+def remove_wishlist_items(user_id, product_ids):
+    """Remove the products from the user's wishlist with one DELETE; returns how many were removed."""
+    return db.session.execute(
+        delete(wishlist_table)
+        .where(wishlist_table.c.user_id == user_id, wishlist_table.c.product_id.in_(product_ids))
+    ).rowcount
+
+
+def batch_product_ids(data):
+    """The product_ids list of a batch request, or None when it is malformed."""
+    product_ids = data.get('product_ids') if isinstance(data, dict) else None
+    if not isinstance(product_ids, list) or not product_ids \
+            or len(product_ids) > current_app.config['WISHLIST_BATCH_MAX_SIZE'] \
+            or not all(isinstance(product_id, int) and not isinstance(product_id, bool) for product_id in product_ids):
+        return None
+    return list(dict.fromkeys(product_ids))
+
+
+# The fields of a wishlist card, read straight from the products table
+CARD_FIELDS = ('id', 'name', 'price', 'image_url', 'stock')
+
+#wishlist cards a page at a time: ?after=<last product id>&limit=N, or ?count=1 for just the count
+@wishlist_bp.route('/wishlist/items', methods=['GET'])
+@jwt_required()
+def view_wishlist_items():
+    user_id = get_jwt_identity()
+    if request.args.get('count', '').lower() in ('1', 'true', 'yes'):
+        # counted on the wishlist's primary key, without touching products
+        count = db.session.execute(
+            select(func.count()).select_from(wishlist_table).where(wishlist_table.c.user_id == user_id)
+        ).scalar()
+        return jsonify({'count': count}), 200
+
+    after = request.args.get('after', default=0, type=int)
+    limit = request.args.get('limit', default=current_app.config['WISHLIST_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['WISHLIST_PAGE_SIZE_MAX']))
+    rows = db.session.execute(
+        select(*(getattr(Product, field) for field in CARD_FIELDS))
+        .join(wishlist_table, wishlist_table.c.product_id == Product.id)
+        .where(wishlist_table.c.user_id == user_id, Product.id > after)
+        .order_by(Product.id).limit(limit + 1)
+    ).all()
+
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return jsonify({
+        'products': [dict(zip(CARD_FIELDS, row)) for row in rows[:limit]],
+        'next_cursor': next_cursor
+    }), 200
 
 #add to wishlist
 @wishlist_bp.route('/wishlist', methods=['POST'])
@@ -29,22 +116,13 @@ def add_to_wishlist():
         data = request.get_json()
         user_id = get_jwt_identity()
         product_id = data.get('product_id')
-        print("User ID:", user_id, "Product ID:", product_id)
 
-        user = db.session.get(User, user_id)
-        if not user:
-            return jsonify({"message": "User not found"}), 404
-
-        product = db.session.get(Product, product_id)
-        if not product:
-            return jsonify({"message": "Product not found"}), 404
-
-        if product not in user.wishlists:
-            user.wishlists.append(product)
+        if add_wishlist_items(user_id, [product_id]):
             db.session.commit()
             return jsonify({'message': 'Product added to wishlist'}), 201
-        else:
-            return jsonify({'message': 'Product already in wishlist'}), 200
+        if not db.session.execute(select(exists().where(Product.id == product_id))).scalar():
+            return jsonify({"message": "Product not found"}), 404
+        return jsonify({'message': 'Product already in wishlist'}), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 422 
 
@@ -53,25 +131,56 @@ def add_to_wishlist():
 @jwt_required()
 def remove_from_wishlist(product_id):
     user_id = get_jwt_identity()
-    
-    user = db.session.get(User, user_id) 
-    product = db.session.get(Product, product_id) 
-    
-    if product in user.wishlists:
-        user.wishlists.remove(product)
+
+    if remove_wishlist_items(user_id, [product_id]):
         db.session.commit()
         return jsonify({'message': 'Product removed from wishlist'}), 200
     else:
         return jsonify({'message': 'Product not in wishlist'}), 404 
 
+#add several products to the wishlist: {"product_ids": [1, 2, 3]}
+@wishlist_bp.route('/wishlist/batch', methods=['POST'])
+@jwt_required()
+def add_batch_to_wishlist():
+    user_id = get_jwt_identity()
+    product_ids = batch_product_ids(request.get_json(silent=True))
+    if product_ids is None:
+        return jsonify({'error': 'product_ids must be a non-empty list of product ids'}), 422
+
+    added = set(add_wishlist_items(user_id, product_ids))
+    db.session.commit()
+    # only the products that weren't added are looked at again, to tell the client why
+    rest = [product_id for product_id in product_ids if product_id not in added]
+    existing = dict(db.session.execute(
+        select(Product.id, in_wishlist(user_id, Product.id)).where(Product.id.in_(rest))
+    ).all()) if rest else {}
+    return jsonify({
+        'added': [product_id for product_id in product_ids if product_id in added],
+        'already_in_wishlist': [product_id for product_id in rest if existing.get(product_id)],
+        'not_found': [product_id for product_id in rest if product_id not in existing],
+    }), 201 if added else 200
+
+#remove several products from the wishlist: {"product_ids": [1, 2, 3]}
+@wishlist_bp.route('/wishlist/batch', methods=['DELETE'])
+@jwt_required()
+def remove_batch_from_wishlist():
+    user_id = get_jwt_identity()
+    product_ids = batch_product_ids(request.get_json(silent=True))
+    if product_ids is None:
+        return jsonify({'error': 'product_ids must be a non-empty list of product ids'}), 422
+
+    removed = remove_wishlist_items(user_id, product_ids)
+    db.session.commit()
+    return jsonify({'removed': removed}), 200
+
 #wishlist recommendation
 @wishlist_bp.route('/wishlist/recommendations', methods=['GET'])
 @jwt_required()
 def recommend_products():
-    user = User.query.get(current_user.id)
-    wishlist_tags = [tag for product in user.wishlists for tag in product.tags]
-    
-    # Get products that share the same tags
-    recommended_products = Product.query.filter(Product.tags.any(wishlist_tags)).limit(6).all()
+    user_id = get_jwt_identity()
+    wishlist_ids = select(wishlist_table.c.product_id).where(wishlist_table.c.user_id == user_id)
+
+    # Products sharing the most tags with the whole wishlist, from the precomputed neighbor table
+    recommended_products = recommend_for_products(wishlist_ids, 6)
     
     return jsonify([product.serialize() for product in recommended_products])
\ No newline at end of file